@@ -1,28 +1,31 @@
 import streamlit as st
 import geocoder  # For geolocation
 from reportlab.lib.utils import simpleSplit
-import openai
-import base64
 from PIL import Image
-import pytz
 import io
 from datetime import datetime
-import json
+from collections import Counter, OrderedDict
 import os
 from dotenv import load_dotenv
-from reportlab.lib.pagesizes import A4, landscape
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image as ReportLabImage, PageBreak, KeepTogether, Indenter
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import cm, inch, mm
-from reportlab.lib import colors
-from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.pdfbase.cidfonts import UnicodeCIDFont
 import re
 import hashlib
+import threading
+import copy
+import uuid
 import streamlit.components.v1 as components
-from PIL import Image, ImageDraw
+from PIL import Image, ImageDraw, ImageOps
+from qc_core import (
+    PROBLEM_NAMES, InspectionState, calculate_final_decision, calculate_problem_table_totals,
+    calculate_total_sampling, create_openai_client, detect_input_language, empty_defect_store, empty_problem_table,
+    flatten_to_rgb, get_analysis_cache, get_defect_category, get_reverse_translation_stats, get_sampling_limits,
+    prefetch_translations, run_inspection_analysis, translate_defects, translate_text,
+    translate_to_english, update_ai_problem_table
+)
+from qc_audio import (
+    AUDIO_LONG_FORM_SECONDS, join_transcripts, prepare_audio, speech_to_text, split_at_silence
+)
+from qc_jobs import get_job_queue
+from qc_pdf import CHINESE_CITIES, PDF_LANGUAGES, generate_all_language_pdfs, report_digest
 # Simple handler for component messages
 
 # Simple annotation handler at TOP LEVEL (not inside any function)
@@ -59,50 +62,16 @@ LANGUAGES = {
     "English": {"code": "en", "flag": "🇺🇸", "label": "English"},
     "Mandarin": {"code": "zh", "flag": "🇨🇳", "label": "普通话 (Mandarin)"}
 }
-# Timezone mapping for Chinese cities
-# Timezone mapping for Chinese cities
-CITY_TIMEZONES = {
-    "Guangzhou": "Asia/Shanghai",
-    "Shenzhen": "Asia/Shanghai",
-    "Dongguan": "Asia/Shanghai",
-    "Foshan": "Asia/Shanghai",
-    "Zhongshan": "Asia/Shanghai",
-    "Huizhou": "Asia/Shanghai",
-    "Zhuhai": "Asia/Shanghai",
-    "Jiangmen": "Asia/Shanghai",
-    "Zhaoqing": "Asia/Shanghai",
-    "Shanghai": "Asia/Shanghai",
-    "Beijing": "Asia/Shanghai",
-    "Suzhou": "Asia/Shanghai",
-    "Hangzhou": "Asia/Shanghai",
-    "Ningbo": "Asia/Shanghai",
-    "Wenzhou": "Asia/Shanghai",
-    "Wuhan": "Asia/Shanghai",
-    "Chengdu": "Asia/Shanghai",
-    "Chongqing": "Asia/Shanghai",
-    "Tianjin": "Asia/Shanghai",
-    "Nanjing": "Asia/Shanghai",
-    "Xi'an": "Asia/Shanghai",
-    "Qingdao": "Asia/Shanghai",
-    "Dalian": "Asia/Shanghai",
-    "Shenyang": "Asia/Shanghai",
-    "Changsha": "Asia/Shanghai",
-    "Zhengzhou": "Asia/Shanghai",
-    "Jinan": "Asia/Shanghai",
-    "Harbin": "Asia/Shanghai",
-    "Changchun": "Asia/Shanghai",
-    "Taiyuan": "Asia/Shanghai",
-    "Shijiazhuang": "Asia/Shanghai",
-    "Lanzhou": "Asia/Shanghai",
-    "Xiamen": "Asia/Shanghai",
-    "Fuzhou": "Asia/Shanghai",
-    "Nanning": "Asia/Shanghai",
-    "Kunming": "Asia/Shanghai",
-    "Guiyang": "Asia/Shanghai",
-    "Haikou": "Asia/Shanghai",
-    "Ürümqi": "Asia/Urumqi",  # Different timezone for Ürümqi
-    "Lhasa": "Asia/Urumqi"
+# "per_image" sends one request per photo; "combined" sends all photos in one request
+ANALYSIS_MODES = {
+    "per_image": "Per-image requests",
+    "combined": "Single multi-image request"
 }
+DEFAULT_ANALYSIS_MODE = os.getenv("ANALYSIS_MODE", "per_image")
+
+# How often the page checks on background analysis / PDF jobs
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "1"))
+
 # Translation dictionary - REMOVED CANTONESE
 TRANSLATIONS = {
     "English": {
@@ -147,11 +116,13 @@ TRANSLATIONS = {
         "save_notes": "Save QC Notes",
         "final_summary": "Final Inspection Summary",
         "generate_pdf": "Generate PDF Report",
+        "generate_all_pdfs": "Generate All Languages",
         "language_preference": "Language Preference",
         "no_defects": "No defects",
         "image_upload": "Upload Inspection Images",
         "upload_images": "Upload 4 images (any order)",
         "view_ai_defects": "View AI Detected Defects",
+        "show_defect_crops": "Show defect close-ups",
         "type_defect": "Type defect description:",
         "enter_defect": "Enter defect...",
         "add_text": "Add",
@@ -180,6 +151,7 @@ TRANSLATIONS = {
         "speak_clearly": "Speak clearly for 3-10 seconds",
         "audio_too_short": "Audio seems very short. Please record for at least 2-3 seconds.",
         "no_text_transcribed": "No text was transcribed. Please speak louder and more clearly.",
+        "no_speech_detected": "No speech detected in the recording. Please speak closer to the microphone.",
         "use_voice_input": "Use voice input",
         "use_text_input": "Use text input",
         "transcribed_text": "Transcribed text:",
@@ -278,11 +250,13 @@ TRANSLATIONS = {
         "save_notes": "保存质检备注",
         "final_summary": "最终检查摘要",
         "generate_pdf": "生成PDF报告",
+        "generate_all_pdfs": "生成所有语言报告",
         "language_preference": "语言偏好",
         "no_defects": "无缺陷",
         "image_upload": "上传检查图像",
         "upload_images": "上传4张图片(任意顺序)",
         "view_ai_defects": "查看AI检测到的缺陷",
+        "show_defect_crops": "显示缺陷特写",
         "type_defect": "输入缺陷描述:",
         "enter_defect": "输入缺陷...",
         "add_text": "添加",
@@ -311,6 +285,7 @@ TRANSLATIONS = {
         "speak_clearly": "清晰说话3-10秒",
         "audio_too_short": "音频似乎太短。请至少录制2-3秒。",
         "no_text_transcribed": "没有转录到文本。请大声清晰地说话。",
+        "no_speech_detected": "录音中未检测到语音。请靠近麦克风说话。",
         "use_voice_input": "使用语音输入",
         "use_text_input": "使用文本输入",
         "transcribed_text": "转录文本:",
@@ -382,6 +357,10 @@ if 'last_audio_hash' not in st.session_state:
     st.session_state.last_audio_hash = {}
 if 'transcription_text' not in st.session_state:
     st.session_state.transcription_text = {}
+if 'transcription_english' not in st.session_state:
+    st.session_state.transcription_english = {}  # Category -> English of the current transcript
+if 'transcription_jobs' not in st.session_state:
+    st.session_state.transcription_jobs = {}  # Category -> running long-form transcription job ID
 if 'recording_count' not in st.session_state:
     st.session_state.recording_count = {}
 # Photos of Faults storage
@@ -396,70 +375,15 @@ if 'editing_existing_container_idx' not in st.session_state:
 
 # Core defect storage
 if 'defect_store' not in st.session_state:
-    st.session_state.defect_store = {
-        'ai_critical': [],
-        'ai_major': [],
-        'ai_minor': [],
-        'qc_critical': [],
-        'qc_major': [],
-        'qc_minor': []
-    }
+    st.session_state.defect_store = empty_defect_store()
 
 # Problem table defects storage - AI detected
 if 'problem_defects_ai' not in st.session_state:
-    st.session_state.problem_defects_ai = {
-        'color_variation': {'cr': 0, 'major': 0, 'minor': 0},
-        'clean': {'cr': 0, 'major': 0, 'minor': 0},
-        'toe_lasting': {'cr': 0, 'major': 0, 'minor': 0},
-        'heel_angle': {'cr': 0, 'major': 0, 'minor': 0},
-        'waist': {'cr': 0, 'major': 0, 'minor': 0},
-        'edge_wrinkle': {'cr': 0, 'major': 0, 'minor': 0},
-        'lace': {'cr': 0, 'major': 0, 'minor': 0},
-        'outsole': {'cr': 0, 'major': 0, 'minor': 0},
-        'velcro': {'cr': 0, 'major': 0, 'minor': 0},
-        'adhesion': {'cr': 0, 'major': 0, 'minor': 0},
-        'buckle': {'cr': 0, 'major': 0, 'minor': 0},
-        'midsole_glue': {'cr': 0, 'major': 0, 'minor': 0},
-        'tongue': {'cr': 0, 'major': 0, 'minor': 0},
-        'grinding_high': {'cr': 0, 'major': 0, 'minor': 0},
-        'back_strap_length': {'cr': 0, 'major': 0, 'minor': 0},
-        'heel': {'cr': 0, 'major': 0, 'minor': 0},
-        'back_strap_attachment': {'cr': 0, 'major': 0, 'minor': 0},
-        'toplift': {'cr': 0, 'major': 0, 'minor': 0},
-        'damage_upper': {'cr': 0, 'major': 0, 'minor': 0},
-        'bottom_gapping': {'cr': 0, 'major': 0, 'minor': 0},
-        'xray_wrinkle': {'cr': 0, 'major': 0, 'minor': 0},
-        'stains': {'cr': 0, 'major': 0, 'minor': 0},
-        'thread_ends': {'cr': 0, 'major': 0, 'minor': 0}
-    }
+    st.session_state.problem_defects_ai = empty_problem_table()
 
 # Problem table defects storage - QC Manager final
 if 'problem_defects_qc' not in st.session_state:
-    st.session_state.problem_defects_qc = {
-        'color_variation': {'cr': 0, 'major': 0, 'minor': 0},
-        'clean': {'cr': 0, 'major': 0, 'minor': 0},
-        'toe_lasting': {'cr': 0, 'major': 0, 'minor': 0},
-        'heel_angle': {'cr': 0, 'major': 0, 'minor': 0},
-        'waist': {'cr': 0, 'major': 0, 'minor': 0},
-        'edge_wrinkle': {'cr': 0, 'major': 0, 'minor': 0},
-        'lace': {'cr': 0, 'major': 0, 'minor': 0},
-        'outsole': {'cr': 0, 'major': 0, 'minor': 0},
-        'velcro': {'cr': 0, 'major': 0, 'minor': 0},
-        'adhesion': {'cr': 0, 'major': 0, 'minor': 0},
-        'buckle': {'cr': 0, 'major': 0, 'minor': 0},
-        'midsole_glue': {'cr': 0, 'major': 0, 'minor': 0},
-        'tongue': {'cr': 0, 'major': 0, 'minor': 0},
-        'grinding_high': {'cr': 0, 'major': 0, 'minor': 0},
-        'back_strap_length': {'cr': 0, 'major': 0, 'minor': 0},
-        'heel': {'cr': 0, 'major': 0, 'minor': 0},
-        'back_strap_attachment': {'cr': 0, 'major': 0, 'minor': 0},
-        'toplift': {'cr': 0, 'major': 0, 'minor': 0},
-        'damage_upper': {'cr': 0, 'major': 0, 'minor': 0},
-        'bottom_gapping': {'cr': 0, 'major': 0, 'minor': 0},
-        'xray_wrinkle': {'cr': 0, 'major': 0, 'minor': 0},
-        'stains': {'cr': 0, 'major': 0, 'minor': 0},
-        'thread_ends': {'cr': 0, 'major': 0, 'minor': 0}
-    }
+    st.session_state.problem_defects_qc = empty_problem_table()
 
 # Custom defects added by QC inspector
 if 'custom_defects' not in st.session_state:
@@ -481,24 +405,40 @@ if 'editing_defect' not in st.session_state:
 if 'edit_text' not in st.session_state:
     st.session_state.edit_text = ""
 
-# Translation cache
-if 'translation_cache' not in st.session_state:
-    st.session_state.translation_cache = {}
-
 # Store QC notes in English
 if 'qc_notes_english' not in st.session_state:
     st.session_state.qc_notes_english = ''
 
-# Defect images storage
-if 'defect_images' not in st.session_state:
-    st.session_state.defect_images = {}  # Store defect_id -> image_buffer
+# Defect crops: an index of defect_id -> (image index, box) built after analysis,
+# and JPEG crops generated from it the first time each one is needed
+if 'defect_crop_index' not in st.session_state:
+    st.session_state.defect_crop_index = {}
+if 'defect_crops' not in st.session_state:
+    st.session_state.defect_crops = {}  # defect_id -> JPEG bytes
 
-if 'uploaded_images_data' not in st.session_state:
-    st.session_state.uploaded_images_data = []  # Store original uploaded images
+if 'inspection_images' not in st.session_state:
+    st.session_state.inspection_images = []  # Original bytes + preview per photo, see sync_inspection_images
+if 'uploader_file_ids' not in st.session_state:
+    st.session_state.uploader_file_ids = []  # What the uploader held on the previous run
 
 if 'defect_coordinates' not in st.session_state:
     st.session_state.defect_coordinates = {}
 
+# Analysis mode (per-image vs single multi-image request) and timing/token records per run
+if 'analysis_mode' not in st.session_state:
+    st.session_state.analysis_mode = DEFAULT_ANALYSIS_MODE if DEFAULT_ANALYSIS_MODE in ANALYSIS_MODES else "per_image"
+if 'analysis_benchmarks' not in st.session_state:
+    st.session_state.analysis_benchmarks = []
+
+# Background jobs (see qc_jobs). A new session reattaches to the inspection named in the URL,
+# so a dropped connection does not lose an analysis that is still running or already finished.
+if 'analysis_job_id' not in st.session_state:
+    st.session_state.analysis_job_id = st.query_params.get("inspection")
+if 'inspection_jobs' not in st.session_state:
+    st.session_state.inspection_jobs = [st.session_state.analysis_job_id] if st.session_state.analysis_job_id else []
+if 'pdf_job_id' not in st.session_state:
+    st.session_state.pdf_job_id = None
+
 # New input fields storage
 if 'total_sampling' not in st.session_state:
     st.session_state.total_sampling = ''
@@ -968,31 +908,14 @@ def init_audio_mode(category):
 
 @st.cache_resource
 def get_openai_client():
-    api_key = os.getenv("OPENAI_API_KEY") or st.secrets.get("OPENAI_API_KEY")
-    if not api_key:
+    openai_client = create_openai_client(os.getenv("OPENAI_API_KEY") or st.secrets.get("OPENAI_API_KEY"))
+    if openai_client is None:
         st.error("❌ OpenAI API key not found.")
         st.stop()
-    return openai.OpenAI(api_key=api_key)
+    return openai_client
 
 client = get_openai_client()
 
-def calculate_total_sampling(order_qty):
-    """Calculate total sampling based on order quantity"""
-    try:
-        qty = int(order_qty)
-        if qty <= 300:
-            return "100%"
-        elif qty <= 1200:
-            return "80"
-        elif qty <= 3200:
-            return "125"
-        elif qty <= 10000:
-            return "200"
-        else:
-            return "315"
-    except:
-        return ""
-    
 # Add this function to create the arrow annotation component
 def create_arrow_annotation_component():
     """Create simplified arrow annotation component with Download PNG only"""
@@ -1477,112 +1400,47 @@ def create_arrow_annotation_component():
     '''
     
     return html_code
-def get_sampling_limits(order_qty):
-    """Get sampling limits based on order quantity"""
-    try:
-        qty = int(order_qty)
-        if qty <= 300:
-            return {"to_inspect": "100%", "major_limit": 1, "minor_limit": 5}
-        elif qty <= 1200:
-            return {"to_inspect": "80", "major_limit": 5, "minor_limit": 9}
-        elif qty <= 3200:
-            return {"to_inspect": "125", "major_limit": 7, "minor_limit": 10}
-        elif qty <= 10000:
-            return {"to_inspect": "200", "major_limit": 10, "minor_limit": 14}
-        else:
-            return {"to_inspect": "315", "major_limit": 14, "minor_limit": 21}
-    except:
-        return {"to_inspect": "", "major_limit": 0, "minor_limit": 0}
 
-def map_defect_to_problem(defect_text, severity):
-    """Map AI defect to problem categories"""
-    defect_lower = defect_text.lower()
-    
-    # Mapping of keywords to problem categories
-    problem_mapping = {
-        'color variation': 'color_variation',
-        'color variation': 'color_variation',
-        'color defect': 'color_variation',
-        '色差': 'color_variation',
-        'clean': 'clean',
-        'cleanliness': 'clean',
-        '清洁度': 'clean',
-        'dirty': 'clean',
-        'stain': 'clean',
-        'toe lasting': 'toe_lasting',
-        '前帮': 'toe_lasting',
-        'heel angle': 'heel_angle',
-        '包跟布起角': 'heel_angle',
-        'heel': 'heel_angle',
-        'waist': 'waist',
-        '腰帮': 'waist',
-        'edge wrinkle': 'edge_wrinkle',
-        '包边条皱': 'edge_wrinkle',
-        'edge': 'edge_wrinkle',
-        'wrinkle': 'edge_wrinkle',
-        'lace': 'lace',
-        '鞋带': 'lace',
-        'outsole': 'outsole',
-        '大底': 'outsole',
-        'sole': 'outsole',
-        'velcro': 'velcro',
-        '魔术贴': 'velcro',
-        'hook': 'velcro',
-        'loop': 'velcro',
-        'adhesion': 'adhesion',
-        '胶着力': 'adhesion',
-        'glue': 'adhesion',
-        'buckle': 'buckle',
-        '鞋扣': 'buckle',
-        'midsole': 'midsole_glue',
-        '中底': 'midsole_glue',
-        'tongue': 'tongue',
-        '鞋舌': 'tongue',
-        'grinding': 'grinding_high',
-        '打磨': 'grinding_high',
-        'back strap': 'back_strap_length',
-        '后带': 'back_strap_length',
-        'back strap attachment': 'back_strap_attachment',
-        '后带固定': 'back_strap_attachment',
-        'heel': 'heel',
-        '鞋跟': 'heel',
-        'toplift': 'toplift',
-        '大皮': 'toplift',
-        'damage': 'damage_upper',
-        '受损': 'damage_upper',
-        'damage upper': 'damage_upper',
-        'bottom gapping': 'bottom_gapping',
-        '底开胶': 'bottom_gapping',
-        'gapping': 'bottom_gapping',
-        'separation': 'bottom_gapping',
-        'x-ray': 'xray_wrinkle',
-        '打皱': 'xray_wrinkle',
-        'stain': 'stains',
-        '溢胶': 'stains',
-        'thread': 'thread_ends',
-        '线头': 'thread_ends',
-        'thread ends': 'thread_ends'
-    }
+def run_transcription_job(job, wav, chunks, ui_language):
+    job.set_progress(0, len(chunks))
     
-    # Find matching problem category
-    for keyword, problem in problem_mapping.items():
-        if keyword in defect_lower:
-            return problem
+    def on_chunk(index, text):
+        job.add_event(index, text)
+        job.set_progress(len(job.events), len(chunks))
     
-    # Default to damage_upper if no match found
-    return 'damage_upper'
+    return speech_to_text(client, wav, ui_language, chunks, on_chunk)
+
+def keep_transcription(category, result):
+    """Remember a transcript's UI text, and its English so an unedited transcript needs no translation"""
+    st.session_state.transcription_text[category] = result["text"]
+    st.session_state.transcription_english[category] = result["english"]
+    return result["text"]
+
+def transcript_english(category, submitted_text):
+    """The transcript's English if the inspector submitted it unedited, else None"""
+    if submitted_text.strip() == st.session_state.transcription_text.get(category, "").strip():
+        return st.session_state.transcription_english.get(category)
+    return None
 
-def update_ai_problem_table(defects, severity):
-    """Update AI problem table based on AI detected defects"""
-    for defect in defects:
-        problem_category = map_defect_to_problem(defect, severity)
-        if problem_category in st.session_state.problem_defects_ai:
-            if severity == 'critical':
-                st.session_state.problem_defects_ai[problem_category]['cr'] += 1
-            elif severity == 'major':
-                st.session_state.problem_defects_ai[problem_category]['major'] += 1
-            elif severity == 'minor':
-                st.session_state.problem_defects_ai[problem_category]['minor'] += 1
+def finish_transcription_job(category):
+    """
+    Follow the long-form transcription running for category: show its partial text while it
+    runs (returns None), then keep the stitched, localized transcript (returns the text).
+    """
+    job = get_job_queue().get(st.session_state.transcription_jobs[category])
+    if job is None:
+        st.session_state.transcription_jobs.pop(category)
+        return st.session_state.transcription_text.get(category, "")
+    if not job.finished:
+        render_transcription_job_progress(job.id)
+        return None
+    
+    st.session_state.transcription_jobs.pop(category)
+    if job.status == "error":
+        st.error(f"❌ Error during transcription: {job.error.splitlines()[0]}")
+        return None
+    st.success(f"✅ {t('transcription_complete')}")
+    return keep_transcription(category, job.result)
 
 def transcribe_audio(audio_bytes, category):
     """Transcribe audio using OpenAI Whisper"""
@@ -1596,68 +1454,44 @@ def transcribe_audio(audio_bytes, category):
         if is_new_recording:
             st.session_state.last_audio_hash[category] = audio_hash
             st.session_state.recording_count[category] = st.session_state.recording_count.get(category, 0) + 1
+            st.session_state.transcription_jobs.pop(category, None)
             
-            # Check if audio is substantial
-            if len(audio_bytes) < 1000:
+            # Downmix, resample to 16 kHz and trim silence before uploading
+            try:
+                prepared = prepare_audio(audio_bytes)
+            except ValueError:
+                prepared = None  # Not a WAV we can decode; let Whisper handle it as recorded
+            if prepared is not None and not prepared["speech"]:
+                st.warning(t("no_speech_detected"))
+                return None
+            if prepared is None and len(audio_bytes) < 1000:
                 st.warning(t("audio_too_short"))
                 return None
             
+            # Long notes are transcribed chunk by chunk in the background, showing text as it arrives
+            if category == "qc_notes" and prepared and prepared["seconds"] > AUDIO_LONG_FORM_SECONDS:
+                job = get_job_queue().submit(
+                    f"transcribe_{audio_hash}_{st.session_state.ui_language}", "transcription", run_transcription_job,
+                    prepared["wav"], split_at_silence(prepared["samples"]), st.session_state.ui_language
+                )
+                st.session_state.transcription_jobs[category] = job.id
+                st.session_state.transcription_text[category] = ""
+                return finish_transcription_job(category)
+            
             # Process the audio
             with st.spinner(f"🎧 {t('transcribing')}"):
                 try:
-                    # Convert bytes to file-like object
-                    audio_file = io.BytesIO(audio_bytes)
-                    audio_file.name = "recording.wav"
-                    
-                    # Transcribe using OpenAI Whisper
-                    transcription_response = client.audio.transcriptions.create(
-                        model="whisper-1",
-                        file=audio_file,
-                        response_format="verbose_json",
-                        language=None  # Auto-detect
-                    )
-                    
-                    transcribed_text = transcription_response.text
-                    detected_language = transcription_response.language
-                    
-                    # Map language codes to names
-                    lang_map = {
-                        "en": "English", 
-                        "zh": "Mandarin",
-                        "cmn": "Mandarin"
-                    }
-                    
-                    detected_lang_name = lang_map.get(detected_language, detected_language.upper())
-                    
-                    # If detected language doesn't match UI language, translate
-                    if detected_lang_name != st.session_state.ui_language:
-                        target_lang = st.session_state.ui_language
-                        translation_response = client.chat.completions.create(
-                            model="gpt-4o-mini",
-                            messages=[
-                                {
-                                    "role": "system", 
-                                    "content": f"You are a professional translator. Translate the following text to {target_lang}. Only provide the translation, nothing else."
-                                },
-                                {
-                                    "role": "user", 
-                                    "content": transcribed_text
-                                }
-                            ],
-                            temperature=0.3
-                        )
-                        final_text = translation_response.choices[0].message.content
-                    else:
-                        final_text = transcribed_text
-                    
-                    st.session_state.transcription_text[category] = final_text
+                    # One Whisper call plus at most one translation, cached by audio hash
+                    result = speech_to_text(client, prepared["wav"] if prepared else audio_bytes,
+                                            st.session_state.ui_language)
                     st.success(f"✅ {t('transcription_complete')}")
-                    
-                    return final_text
+                    return keep_transcription(category, result)
                     
                 except Exception as e:
                     st.error(f"❌ Error during transcription: {str(e)}")
                     return None
+        elif category in st.session_state.transcription_jobs:
+            return finish_transcription_job(category)
         else:
             # Same recording as before - return cached text
             return st.session_state.transcription_text.get(category, "")
@@ -1666,35 +1500,14 @@ def transcribe_audio(audio_bytes, category):
         st.error(f"❌ Transcription error: {str(e)}")
         return None
 
+# Session-facing wrappers around the translation helpers in qc_core
 def translate_text_with_openai(text, target_language):
     """Translate text using OpenAI with caching"""
-    if not text or text.strip() == "" or target_language == "English":
-        return text
-    
-    cache_key = (text, target_language)
-    if cache_key in st.session_state.translation_cache:
-        return st.session_state.translation_cache[cache_key]
-    
-    lang_map = {
-        "Mandarin": "Simplified Chinese (Mandarin)",
-    }
-    
-    try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{
-                "role": "user",
-                "content": f"Translate to {lang_map[target_language]}. Return ONLY the translation:\n\n{text}"
-            }],
-            max_tokens=500,
-            temperature=0.1
-        )
-        translated = response.choices[0].message.content.strip()
-        st.session_state.translation_cache[cache_key] = translated
-        return translated
-    except Exception as e:
-        st.warning(f"Translation error: {str(e)}")
-        return text
+    return translate_text(client, text, target_language)
+
+def prefetch_defect_translations(target_language, extra_texts=()):
+    """Translate the whole defect store (plus any extra strings) in one batched request"""
+    prefetch_translations(client, st.session_state.defect_store, target_language, extra_texts)
 
 def remove_measurements_from_defect(defect_text):
     """Remove numerical measurements from defect descriptions"""
@@ -1710,17 +1523,7 @@ def remove_measurements_from_defect(defect_text):
 
 def get_translated_defects(defect_category, target_language):
     """Get defects from store translated to target language"""
-    defects = st.session_state.defect_store.get(defect_category, [])
-    if target_language == "English":
-        return [defect_id for defect_id, defect_text in defects], [defect_text for defect_id, defect_text in defects]
-    
-    translated = []
-    ids = []
-    for defect_id, english_text in defects:
-        ids.append(defect_id)
-        translated.append(translate_text_with_openai(english_text, target_language))
-    
-    return ids, translated
+    return translate_defects(client, st.session_state.defect_store.get(defect_category, []), target_language)
 
 def add_defect_to_store(category, english_text):
     """Add a new defect to the store"""
@@ -1742,22 +1545,24 @@ def update_defect_in_store(category, defect_id, new_text):
             st.session_state.defect_store[category][i] = (defect_id, new_text)
             break
 
-def add_defect_from_input(input_text, store_category):
-    """Add defect from either text or audio input, handling translation if needed"""
+def add_defect_from_input(input_text, store_category, english_text=None):
+    """
+    Add defect from either text or audio input, handling translation if needed.
+    english_text, when known (an unedited transcript), is used instead of translating back.
+    """
     cleaned_input = input_text.strip()
     
-    if st.session_state.ui_language != "English":
+    if english_text:
+        english_text = english_text.strip()
+    elif st.session_state.ui_language != "English" or detect_input_language(cleaned_input) != "English":
+        # Skipped locally when the inspector typed English (or just a code) anyway; an English UI
+        # still translates a transcript whose English could not be resolved
         try:
-            reverse_response = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[{
-                    "role": "user",
-                    "content": f"Translate this quality control defect description to English. Be precise and accurate. Return ONLY the English translation:\n\n{cleaned_input}"
-                }],
-                max_tokens=200,
-                temperature=0.1
+            english_text = translate_to_english(
+                client, cleaned_input,
+                "Translate this quality control defect description to English. Be precise and accurate.",
+                max_tokens=200
             )
-            english_text = reverse_response.choices[0].message.content.strip()
         except Exception as e:
             st.warning(f"Translation warning: Using original text. Error: {str(e)}")
             english_text = cleaned_input
@@ -1802,6 +1607,7 @@ def render_audio_input_section(category, defect_type):
                 stop_prompt=f"⏹️ {t('stop_recording')}",
                 just_once=False,
                 use_container_width=True,
+                format="wav",
                 key=f'recorder_{category}'
             )
             
@@ -1827,7 +1633,8 @@ def render_audio_input_section(category, defect_type):
                         if st.button(f"{t('add_text')}", key=f"add_audio_{category}", use_container_width=True):
                             if edited_text and edited_text.strip():
                                 store_category = f'qc_{category.split("_")[1]}'
-                                add_defect_from_input(edited_text.strip(), store_category)
+                                add_defect_from_input(edited_text.strip(), store_category,
+                                                      transcript_english(category, edited_text))
                                 st.session_state.transcription_text[category] = ""  # Clear after adding
                                 st.rerun()
         
@@ -1889,6 +1696,7 @@ def render_qc_notes_audio_section():
                 stop_prompt=f"⏹️ {t('stop_recording')}",
                 just_once=False,
                 use_container_width=True,
+                format="wav",
                 key='recorder_qc_notes'
             )
             
@@ -1911,7 +1719,7 @@ def render_qc_notes_audio_section():
                     # Save notes button
                     if st.button(f"{t('save_notes')}", type="primary", key="save_audio_notes", use_container_width=True):
                         if displayed_notes and displayed_notes.strip():
-                            save_qc_notes(displayed_notes.strip())
+                            save_qc_notes(displayed_notes.strip(), transcript_english("qc_notes", displayed_notes))
                             st.session_state.transcription_text["qc_notes"] = ""  # Clear after saving
                             st.rerun()
         
@@ -1941,20 +1749,13 @@ def render_qc_notes_audio_section():
                 save_qc_notes(qc_notes_input.strip())
                 st.rerun()
 
-def save_qc_notes(notes_text):
-    """Save QC notes with translation if needed"""
-    if st.session_state.ui_language != "English":
+def save_qc_notes(notes_text, english_text=None):
+    """Save QC notes with translation if needed (not when english_text is already known)"""
+    if english_text:
+        st.session_state.qc_notes_english = english_text.strip()
+    elif st.session_state.ui_language != "English" or detect_input_language(notes_text) != "English":
         try:
-            reverse_response = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[{
-                    "role": "user",
-                    "content": f"Translate this to English. Return ONLY the English translation:\n\n{notes_text}"
-                }],
-                max_tokens=500,
-                temperature=0.1
-            )
-            st.session_state.qc_notes_english = reverse_response.choices[0].message.content.strip()
+            st.session_state.qc_notes_english = translate_to_english(client, notes_text)
         except:
             st.session_state.qc_notes_english = notes_text
     else:
@@ -1962,10 +1763,114 @@ def save_qc_notes(notes_text):
     
     st.success(f"{t('notes_saved')}")
 
-def encode_image(image):
-    buffer = io.BytesIO()
-    image.save(buffer, format="JPEG")
-    return base64.b64encode(buffer.getvalue()).decode()
+# Uploaded photos are kept in session state as their original compressed bytes plus a small
+# preview. Full-resolution decodes are shared by all sessions through a bounded LRU.
+IMAGE_PREVIEW_EDGE = int(os.getenv("IMAGE_PREVIEW_EDGE", "512"))
+DECODED_IMAGE_CACHE_MB = int(os.getenv("DECODED_IMAGE_CACHE_MB", "256"))
+
+class DecodedImageCache:
+    """
+    Process-wide LRU of decoded, EXIF-oriented images keyed by content hash, bounded in bytes.
+    Sessions that upload the same photo share its decode, so each session holds a reference
+    (hold/release) and a decode is only dropped early once no session holds it.
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._images = OrderedDict()
+        self._holders = Counter()
+        self._bytes = 0
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _size(image):
+        return image.width * image.height * len(image.getbands())
+    
+    def get(self, key, data):
+        with self._lock:
+            if key in self._images:
+                self._images.move_to_end(key)
+                return self._images[key]
+        # Decode outside the lock so sessions do not wait on each other's photos
+        image = ImageOps.exif_transpose(Image.open(io.BytesIO(data)))
+        image.load()
+        with self._lock:
+            if key not in self._images:
+                self._images[key] = image
+                self._bytes += self._size(image)
+                while self._bytes > self.max_bytes and len(self._images) > 1:
+                    _, evicted = self._images.popitem(last=False)
+                    self._bytes -= self._size(evicted)
+            return self._images[key]
+    
+    def hold(self, keys):
+        with self._lock:
+            self._holders.update(keys)
+    
+    def release(self, keys):
+        with self._lock:
+            for key in keys:
+                self._holders[key] -= 1
+                if self._holders[key] > 0:
+                    continue
+                del self._holders[key]
+                image = self._images.pop(key, None)
+                if image is not None:
+                    self._bytes -= self._size(image)
+
+@st.cache_resource
+def get_decoded_image_cache():
+    return DecodedImageCache(DECODED_IMAGE_CACHE_MB * 1024 * 1024)
+
+def make_image_preview(data, max_edge=None):
+    """Small oriented RGB preview; JPEGs are decoded at reduced scale via draft mode"""
+    max_edge = max_edge or IMAGE_PREVIEW_EDGE
+    image = Image.open(io.BytesIO(data))
+    image.draft("RGB", (max_edge, max_edge))
+    preview = flatten_to_rgb(ImageOps.exif_transpose(image))
+    preview.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+    return preview
+
+def sync_inspection_images(uploaded_files):
+    """
+    Keep st.session_state.inspection_images in step with the uploader. A different set of files
+    starts a new inspection, so the previous photos are released first.
+    """
+    file_ids = [file.file_id for file in uploaded_files]
+    if [entry['file_id'] for entry in st.session_state.inspection_images] == file_ids:
+        return st.session_state.inspection_images
+    reset_inspection_images()
+    entries = []
+    for file in uploaded_files:
+        data = file.getvalue()
+        entries.append({
+            'file_id': file.file_id,
+            'key': hashlib.sha256(data).hexdigest(),
+            'bytes': data,
+            'preview': make_image_preview(data)
+        })
+    replace_inspection_images(entries)
+    return st.session_state.inspection_images
+
+def load_inspection_image(index):
+    """Full-resolution oriented image for inspection photo `index`, decoded on demand"""
+    entry = st.session_state.inspection_images[index]
+    return get_decoded_image_cache().get(entry['key'], entry['bytes'])
+
+def replace_inspection_images(entries):
+    """
+    Make entries this session's photos. Their decodes are held for this session and the previous
+    photos' released (dropped unless another session holds them); crops of the old photos go too.
+    """
+    cache = get_decoded_image_cache()
+    cache.hold(entry['key'] for entry in entries)
+    cache.release(entry['key'] for entry in st.session_state.inspection_images)
+    st.session_state.inspection_images = entries
+    st.session_state.defect_crop_index = {}
+    st.session_state.defect_crops = {}
+
+def reset_inspection_images():
+    """Drop this session's photos, their decodes and any crops made from them"""
+    replace_inspection_images([])
 
 def crop_defect_area(image, coordinates, margin=5):
     """
@@ -1998,998 +1903,36 @@ def save_image_to_buffer(image):
     buffer.seek(0)
     return buffer
 
-def get_defect_category(defect_desc, analysis):
-    """Determine which category a defect belongs to"""
-    if defect_desc in analysis.get('critical_defects', []):
-        return 'critical'
-    elif defect_desc in analysis.get('major_defects', []):
-        return 'major'
-    elif defect_desc in analysis.get('minor_defects', []):
-        return 'minor'
-    return 'unknown'
-
-def analyze_shoe_image_with_locations(client, image, image_number, style_number="", color="", contract_number=""):
-    """Analyze image and return defect locations for cropping"""
-    base64_image = encode_image(image)
-    
-    prompt = f"""You are an expert footwear QC inspector analyzing Image {image_number}.
-Product: {style_number}, Color: {color}, Contract: {contract_number}
-
-CRITICAL INSTRUCTIONS:
-1. DO NOT include ANY measurements (mm, cm, inches, numbers) in defect descriptions
-2. Each defect must be unique - never list similar defects in different categories
-3. Use clear, descriptive language without numerical data
-4. Focus on defect type and location only
-5. For EACH defect, provide approximate location coordinates (x1,y1,x2,y2) where:
-   - Coordinates are relative to image size (0-100%)
-   - Format: [location - defect type] [(x1,y1,x2,y2)]
-
-INSPECTION PROTOCOL:
-1. Scan overall construction and proportion
-2. Examine all visible materials for defects
-3. Check all stitching lines and seam quality
-4. Inspect hardware, eyelets, and functional components
-5. Look for sole attachment and construction issues
-6. Verify color consistency and finish quality
-7. Note any safety or structural concerns
-
-CRITICAL DEFECT CATEGORIES (REJECT immediately):
-- Holes, tears, or punctures in upper materials
-- Broken/missing eyelets, hardware, or structural components
-- Sole separation or delamination
-- Asymmetrical lasting or construction
-- Safety hazards (sharp edges, protruding nails)
-
-MAJOR DEFECT CATEGORIES (Count towards rejection limits):
-- Stitching defects: skipped stitches, loose threads, crooked seams
-- Material defects: scratches, scuffs, stains, grain breaks
-- Construction issues: uneven toe caps, misaligned panels
-- Adhesive residue or excess glue visible
-- Color variation outside acceptable tolerance
-
-MINOR DEFECT CATEGORIES (Count but typically acceptable):
-- Minor sole defects, uneven texturing
-- Very light surface marks that don't affect structural integrity
-
-CRITICAL RULES:
-1. NO measurements or numbers in descriptions
-2. Each defect appears in ONLY ONE category
-3. Be specific about location and defect type WITHOUT measurements
-4. Use format: "[location] - [defect type] [(x1,y1,x2,y2)]"
-5. Similar defects should not appear across categories
-
-Return ONLY valid JSON in English:
-{{
-    "image_number": {image_number},
-    "critical_defects": ["left toe area - deep scratch (10,15,25,30)"],
-    "major_defects": ["heel counter - adhesive stain (60,70,80,85)"], 
-    "minor_defects": ["side panel - light scuff mark (40,50,55,65)"],
-    "defect_coordinates": {{
-        "left toe area - deep scratch": [10, 15, 25, 30],
-        "heel counter - adhesive stain": [60, 70, 80, 85],
-        "side panel - light scuff mark": [40, 50, 55, 65]
-    }},
-    "overall_condition": "Good/Fair/Poor",
-    "confidence": "High/Medium/Low",
-    "inspection_notes": "brief notes"
-}}"""
-    
-    try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[{
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": prompt},
-                    {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}}
-                ]
-            }],
-            max_tokens=1500,
-            temperature=0.1
-        )
-        
-        result_text = response.choices[0].message.content
-        start = result_text.find('{')
-        end = result_text.rfind('}') + 1
-        
-        if start != -1 and end > start:
-            result = json.loads(result_text[start:end])
-            # Extract coordinates and clean defect descriptions
-            defect_coordinates = result.get('defect_coordinates', {})
-            
-            # Clean defect descriptions (remove coordinates from text)
-            clean_defects = {}
-            for category in ['critical_defects', 'major_defects', 'minor_defects']:
-                clean_defects[category] = []
-                for defect in result.get(category, []):
-                    # Remove coordinate part from defect description
-                    clean_defect = re.sub(r'\s*\(\d+,\d+,\d+,\d+\)', '', defect).strip()
-                    clean_defects[category].append(clean_defect)
-            
-            result.update(clean_defects)
-            return result, defect_coordinates
-        
-        return None, {}
-    except Exception as e:
-        st.error(f"Analysis error: {str(e)}")
-        return None, {}
-
-def normalize_defect_description(defect):
-    """Normalize defect descriptions to remove variations and enable better duplicate detection"""
-    if not defect:
-        return defect
-    
-    normalized = defect.lower().strip()
-    normalized = ' '.join(normalized.split())
-    
-    replacements = {
-        'scuff marks': 'scuff',
-        'scratch marks': 'scratch', 
-        'loose thread': 'loose threads',
-        'frayed edge': 'fraying',
-        'adhesive mark': 'adhesive residue',
-        'glue mark': 'adhesive residue',
-        'stitching irregularity': 'stitching irregularities',
-        'uneven stitch': 'uneven stitching'
-    }
-    
-    for old, new in replacements.items():
-        normalized = normalized.replace(old, new)
-    
-    return normalized
-
-def generate_qc_report(analyses):
-    """Generate initial AI report from analyses with strict duplicate prevention"""
-    all_critical, all_major, all_minor = [], [], []
-    
-    for analysis in analyses:
-        if analysis:
-            critical_defects = list(dict.fromkeys(analysis.get('critical_defects', [])))
-            major_defects = list(dict.fromkeys(analysis.get('major_defects', [])))
-            minor_defects = list(dict.fromkeys(analysis.get('minor_defects', [])))
-            
-            all_critical.extend(critical_defects)
-            all_major.extend(major_defects)
-            all_minor.extend(minor_defects)
-    
-    # Remove exact duplicates
-    all_critical = list(dict.fromkeys(all_critical))
-    all_major = list(dict.fromkeys(all_major))
-    all_minor = list(dict.fromkeys(all_minor))
-    
-    # Create normalized versions for cross-category duplicate detection
-    normalized_critical = [normalize_defect_description(d) for d in all_critical]
-    normalized_major = [normalize_defect_description(d) for d in all_major]
-    normalized_minor = [normalize_defect_description(d) for d in all_minor]
-    
-    # Remove from major if similar defect exists in critical
-    final_major = []
-    for i, major_defect in enumerate(all_major):
-        norm_major = normalized_major[i]
-        # Check for any overlap with critical defects
-        is_duplicate = False
-        for norm_critical in normalized_critical:
-            # Check if either contains the other or if they share significant keywords
-            if (norm_critical in norm_major or norm_major in norm_critical or
-                len(set(norm_critical.split()) & set(norm_major.split())) >= 2):
-                is_duplicate = True
-                break
-        if not is_duplicate:
-            final_major.append(major_defect)
-    
-    # Remove from minor if similar defect exists in critical or major
-    final_minor = []
-    final_major_normalized = [normalize_defect_description(d) for d in final_major]
-    
-    for i, minor_defect in enumerate(all_minor):
-        norm_minor = normalized_minor[i]
-        is_duplicate = False
-        
-        # Check against critical
-        for norm_critical in normalized_critical:
-            if (norm_critical in norm_minor or norm_minor in norm_critical or
-                len(set(norm_critical.split()) & set(norm_minor.split())) >= 2):
-                is_duplicate = True
-                break
-        
-        # Check against major
-        if not is_duplicate:
-            for norm_major in final_major_normalized:
-                if (norm_major in norm_minor or norm_minor in norm_major or
-                    len(set(norm_major.split()) & set(norm_minor.split())) >= 2):
-                    is_duplicate = True
-                    break
-        
-        if not is_duplicate:
-            final_minor.append(minor_defect)
-    
-    # Final cleanup
-    final_critical = list(dict.fromkeys(all_critical))
-    final_major = list(dict.fromkeys(final_major))
-    final_minor = list(dict.fromkeys(final_minor))
-    
-    st.session_state.defect_store['ai_critical'] = [(f"ai_c_{i}", d) for i, d in enumerate(final_critical)]
-    st.session_state.defect_store['ai_major'] = [(f"ai_m_{i}", d) for i, d in enumerate(final_major)]
-    st.session_state.defect_store['ai_minor'] = [(f"ai_n_{i}", d) for i, d in enumerate(final_minor)]
-    
-    st.session_state.defect_store['qc_critical'] = st.session_state.defect_store['ai_critical'].copy()
-    st.session_state.defect_store['qc_major'] = st.session_state.defect_store['ai_major'].copy()
-    st.session_state.defect_store['qc_minor'] = st.session_state.defect_store['ai_minor'].copy()
-    
-    # Update AI problem table
-    update_ai_problem_table(final_critical, 'critical')
-    update_ai_problem_table(final_major, 'major')
-    update_ai_problem_table(final_minor, 'minor')
-    
-    # Get sampling limits based on order quantity
-    sampling_limits = get_sampling_limits(st.session_state.get('order_qty_input', 1000))
-    major_limit = sampling_limits["major_limit"]
-    minor_limit = sampling_limits["minor_limit"]
-    
-    if len(final_critical) > 0:
-        result, reason = "REJECT", f"Critical defects ({len(final_critical)}) - Zero tolerance"
-    elif len(final_major) > major_limit:
-        result, reason = "REJECT", f"Major defects ({len(final_major)}) exceed limit ({major_limit})"
-    elif len(final_minor) > minor_limit:
-        result, reason = "REWORK", f"Minor defects ({len(final_minor)}) exceed limit ({minor_limit})"
-    else:
-        result, reason = "ACCEPT", "All defects within AQL 2.5 limits"
-    
-    return {
-        "result": result,
-        "reason": reason,
-        "critical_count": len(final_critical),
-        "major_count": len(final_major),
-        "minor_count": len(final_minor),
-        "sampling_limits": sampling_limits
-    }
-
-def calculate_final_decision():
-    """Calculate final decision based on QC defects and sampling limits"""
-    # Calculate defect counts from QC Manager problem table
-    qc_critical_count, qc_major_count, qc_minor_count = calculate_problem_table_totals(st.session_state.problem_defects_qc)
-    
-    # Get sampling limits based on order quantity
-    order_qty = st.session_state.get('order_qty_input', 1000)
-    sampling_limits = get_sampling_limits(order_qty)
-    major_limit = sampling_limits["major_limit"]
-    minor_limit = sampling_limits["minor_limit"]
-    
-    if qc_critical_count > 0:
-        return "REJECT", f"Critical defects ({qc_critical_count}) - Zero tolerance"
-    elif qc_major_count > major_limit:
-        return "REJECT", f"Major defects ({qc_major_count}) exceed AQL limit ({major_limit})"
-    elif qc_minor_count > minor_limit:
-        return "REWORK", f"Minor defects ({qc_minor_count}) exceed AQL limit ({minor_limit})"
-    else:
-        return "ACCEPT", "All defects within AQL 2.5 limits"
-
-def calculate_problem_table_totals(problem_data):
-    """Calculate total defects from problem table (sum of all columns)"""
-    total_cr = 0
-    total_major = 0
-    total_minor = 0
-    
-    for problem_key, counts in problem_data.items():
-        total_cr += counts['cr']
-        total_major += counts['major']
-        total_minor += counts['minor']
-    
-    return total_cr, total_major, total_minor
-
-def create_sampling_table(order_qty, language, chinese_font=None):
-    """Create sampling inspection table for PDF - FIXED FOR MANDARIN"""
-    try:
-        # Get sampling limits based on order quantity
-        sampling_limits = get_sampling_limits(order_qty)
-        to_inspect = sampling_limits["to_inspect"]
-        major_limit = sampling_limits["major_limit"]
-        minor_limit = sampling_limits["minor_limit"]
-        
-        # Calculate defect counts from QC Manager problem table
-        qc_critical_count, qc_major_count, qc_minor_count = calculate_problem_table_totals(st.session_state.problem_defects_qc)
-        
-        # Determine status colors
-        critical_status = "FAIL" if qc_critical_count > 0 else "PASS"
-        major_status = "FAIL" if qc_major_count > major_limit else "PASS"
-        minor_status = "FAIL" if qc_minor_count > minor_limit else "PASS"
-        
-        # Create data for table - DIFFERENT FOR MANDARIN
-        if language == "Mandarin":
-            # Use proper Chinese font or default to Helvetica
-            font_name = chinese_font if chinese_font else 'Helvetica'
-            
-            data = [
-                # Title row
-                ['抽样检查标准 2.5', '', '', '', ''],
-                # Header row
-                ['批次数量', '检查数量', '严重 AQL', '主要 AQL', '次要 AQL'],
-                # Data rows
-                ['0-300 双', '100%', '0', '1', '5'],
-                ['301-1200 双', '80', '0', '5', '9'],
-                ['1201-3200 双', '125', '0', '7', '10'],
-                ['3201-10000 双', '200', '0', '10', '14'],
-                ['10001-35000 双以上', '315', '0', '14', '21'],
-                # Last row with actual results
-                [f"检查总数: {order_qty}", 
-                 f"已抽样: {st.session_state.total_sampling if st.session_state.total_sampling else to_inspect}", 
-                 f"{qc_critical_count} / 0", 
-                 f"{qc_major_count} / {major_limit}", 
-                 f"{qc_minor_count} / {minor_limit}"]
-            ]
-        else:
-            data = [
-                # Title row
-                ['Inspection Standard 2.5', '', '', '', ''],
-                # Header row
-                ['BATCH SIZE', 'TO INSPECT', 'CRITICAL AQL', 'MAJOR AQL', 'MINOR AQL'],
-                # Data rows
-                ['0-300PRS', '100%', '0', '1', '5'],
-                ['301-1200PRS', '80', '0', '5', '9'],
-                ['1201-3200PRS', '125', '0', '7', '10'],
-                ['3201-10000PRS', '200', '0', '10', '14'],
-                ['10001-35000 above', '315', '0', '14', '21'],
-                # Last row with actual results
-                [f"Order Qty: {order_qty}", 
-                 f"Sampled: {st.session_state.total_sampling if st.session_state.total_sampling else to_inspect}", 
-                 f"{qc_critical_count} / 0", 
-                 f"{qc_major_count} / {major_limit}", 
-                 f"{qc_minor_count} / {minor_limit}"]
-            ]
-        
-        # Create table with proper width for portrait A4
-        page_width = A4[0] - 4*cm  # Portrait width minus margins
-        col_widths = [page_width * 0.20] * 5
-        row_heights = [30, 25] + [22]*5 + [30]
-        
-        table = Table(data, colWidths=col_widths, rowHeights=row_heights)
-        
-        # Define table style
-        style = TableStyle([
-            # Title row - yellow background
-            ('BACKGROUND', (0, 0), (4, 0), colors.yellow),
-            ('SPAN', (0, 0), (4, 0)),  # Merge all columns for title
-            ('ALIGN', (0, 0), (4, 0), 'CENTER'),
-            ('FONTSIZE', (0, 0), (4, 0), 12),
-            ('FONTNAME', (0, 0), (4, 0), 'Helvetica-Bold' if language == "English" else (chinese_font if chinese_font else 'Helvetica-Bold')),
-            ('VALIGN', (0, 0), (4, 0), 'MIDDLE'),
-            
-            # Header row - light gray background
-            ('BACKGROUND', (0, 1), (4, 1), colors.Color(0.85, 0.85, 0.85)),
-            ('FONTSIZE', (0, 1), (4, 1), 9),
-            ('FONTNAME', (0, 1), (4, 1), 'Helvetica-Bold' if language == "English" else (chinese_font if chinese_font else 'Helvetica-Bold')),
-            ('ALIGN', (0, 1), (4, 1), 'CENTER'),
-            ('VALIGN', (0, 1), (4, 1), 'MIDDLE'),
-            
-            # Data rows - white background
-            ('BACKGROUND', (0, 2), (4, 6), colors.white),
-            ('FONTSIZE', (0, 2), (4, 6), 9),
-            ('FONTNAME', (0, 2), (4, 6), 'Helvetica' if language == "English" else (chinese_font if chinese_font else 'Helvetica')),
-            ('ALIGN', (0, 2), (0, 6), 'LEFT'),
-            ('ALIGN', (1, 2), (4, 6), 'CENTER'),
-            ('VALIGN', (0, 2), (4, 6), 'MIDDLE'),
-            
-            # Last row - yellow background with colored status
-            ('BACKGROUND', (0, 7), (4, 7), colors.yellow),
-            ('FONTSIZE', (0, 7), (4, 7), 9),
-            ('FONTNAME', (0, 7), (4, 7), 'Helvetica-Bold' if language == "English" else (chinese_font if chinese_font else 'Helvetica-Bold')),
-            ('ALIGN', (0, 7), (4, 7), 'CENTER'),
-            ('VALIGN', (0, 7), (4, 7), 'MIDDLE'),
-            
-            # Color code the results based on status
-            ('TEXTCOLOR', (2, 7), (2, 7), colors.red if critical_status == "FAIL" else colors.green),
-            ('TEXTCOLOR', (3, 7), (3, 7), colors.red if major_status == "FAIL" else colors.green),
-            ('TEXTCOLOR', (4, 7), (4, 7), colors.red if minor_status == "FAIL" else colors.green),
-            
-            # Grid - black borders
-            ('GRID', (0, 0), (4, 7), 1, colors.black),
-            ('LINEABOVE', (0, 0), (4, 0), 1, colors.black),
-            ('LINEBELOW', (0, 7), (4, 7), 1, colors.black),
-            
-            # Padding
-            ('LEFTPADDING', (0, 0), (4, 7), 4),
-            ('RIGHTPADDING', (0, 0), (4, 7), 4),
-            ('TOPPADDING', (0, 0), (4, 7), 3),
-            ('BOTTOMPADDING', (0, 0), (4, 7), 3),
-        ])
-        
-        table.setStyle(style)
-        return KeepTogether(table)  # Keep table together on same page
-        
-    except Exception as e:
-        st.error(f"Error creating sampling table: {str(e)}")
-        return None
-
-def create_problem_table(problem_data, title, language, chinese_font=None):
-    """Create problem identification table for PDF - UPDATED FOR MANDARIN"""
-    # Calculate totals from the problem table
-    total_cr = sum(problem_data[problem]['cr'] for problem in problem_data)
-    total_major = sum(problem_data[problem]['major'] for problem in problem_data)
-    total_minor = sum(problem_data[problem]['minor'] for problem in problem_data)
-    
-    # Define the data structure for the problem table - DIFFERENT FOR MANDARIN
-    if language == "Mandarin":
-        # Use proper Chinese font
-        font_name = chinese_font if chinese_font else 'Helvetica'
-        
-        table_data = [
-            # Header row - ALL 8 COLUMNS IN MANDARIN
-            ['问题', '严重', '主要', '次要', '问题', '严重', '主要', '次要'],
-            
-            # Row 1
-            ['色差', 
-             str(problem_data['color_variation']['cr']), 
-             str(problem_data['color_variation']['major']), 
-             str(problem_data['color_variation']['minor']), 
-             '清洁', 
-             str(problem_data['clean']['cr']), 
-             str(problem_data['clean']['major']), 
-             str(problem_data['clean']['minor'])],
-            
-            # Row 2
-            ['前帮', 
-             str(problem_data['toe_lasting']['cr']), 
-             str(problem_data['toe_lasting']['major']), 
-             str(problem_data['toe_lasting']['minor']), 
-             '包跟角', 
-             str(problem_data['heel_angle']['cr']), 
-             str(problem_data['heel_angle']['major']), 
-             str(problem_data['heel_angle']['minor'])],
-            
-            # Row 3
-            ['腰帮', 
-             str(problem_data['waist']['cr']), 
-             str(problem_data['waist']['major']), 
-             str(problem_data['waist']['minor']), 
-             '包边皱', 
-             str(problem_data['edge_wrinkle']['cr']), 
-             str(problem_data['edge_wrinkle']['major']), 
-             str(problem_data['edge_wrinkle']['minor'])],
-            
-            # Row 4
-            ['鞋带', 
-             str(problem_data['lace']['cr']), 
-             str(problem_data['lace']['major']), 
-             str(problem_data['lace']['minor']), 
-             '大底', 
-             str(problem_data['outsole']['cr']), 
-             str(problem_data['outsole']['major']), 
-             str(problem_data['outsole']['minor'])],
-            
-            # Row 5
-            ['魔术贴', 
-             str(problem_data['velcro']['cr']), 
-             str(problem_data['velcro']['major']), 
-             str(problem_data['velcro']['minor']), 
-             '胶着', 
-             str(problem_data['adhesion']['cr']), 
-             str(problem_data['adhesion']['major']), 
-             str(problem_data['adhesion']['minor'])],
-            
-            # Row 6
-            ['鞋扣', 
-             str(problem_data['buckle']['cr']), 
-             str(problem_data['buckle']['major']), 
-             str(problem_data['buckle']['minor']), 
-             '中底胶', 
-             str(problem_data['midsole_glue']['cr']), 
-             str(problem_data['midsole_glue']['major']), 
-             str(problem_data['midsole_glue']['minor'])],
-            
-            # Row 7
-            ['鞋舌', 
-             str(problem_data['tongue']['cr']), 
-             str(problem_data['tongue']['major']), 
-             str(problem_data['tongue']['minor']), 
-             '打磨高', 
-             str(problem_data['grinding_high']['cr']), 
-             str(problem_data['grinding_high']['major']), 
-             str(problem_data['grinding_high']['minor'])],
-            
-            # Row 8
-            ['后带长', 
-             str(problem_data['back_strap_length']['cr']), 
-             str(problem_data['back_strap_length']['major']), 
-             str(problem_data['back_strap_length']['minor']), 
-             '鞋跟', 
-             str(problem_data['heel']['cr']), 
-             str(problem_data['heel']['major']), 
-             str(problem_data['heel']['minor'])],
-            
-            # Row 9
-            ['后带固', 
-             str(problem_data['back_strap_attachment']['cr']), 
-             str(problem_data['back_strap_attachment']['major']), 
-             str(problem_data['back_strap_attachment']['minor']), 
-             '大皮', 
-             str(problem_data['toplift']['cr']), 
-             str(problem_data['toplift']['major']), 
-             str(problem_data['toplift']['minor'])],
-            
-            # Row 10
-            ['鞋面损', 
-             str(problem_data['damage_upper']['cr']), 
-             str(problem_data['damage_upper']['major']), 
-             str(problem_data['damage_upper']['minor']), 
-             '底开胶', 
-             str(problem_data['bottom_gapping']['cr']), 
-             str(problem_data['bottom_gapping']['major']), 
-             str(problem_data['bottom_gapping']['minor'])],
-            
-            # Row 11
-            ['鞋面皱', 
-             str(problem_data['xray_wrinkle']['cr']), 
-             str(problem_data['xray_wrinkle']['major']), 
-             str(problem_data['xray_wrinkle']['minor']), 
-             '溢胶', 
-             str(problem_data['stains']['cr']), 
-             str(problem_data['stains']['major']), 
-             str(problem_data['stains']['minor'])],
-            
-            # Row 12 - Thread ends only on left side, right side empty
-            ['线头', 
-             str(problem_data['thread_ends']['cr']), 
-             str(problem_data['thread_ends']['major']), 
-             str(problem_data['thread_ends']['minor']), 
-             '', '', '', ''],
-            
-            # Last row - Inspection results - USE CALCULATED TOTALS
-            [f'总缺陷数:', 
-             str(total_cr), 
-             str(total_major), 
-             str(total_minor), 
-             '', '', '', '']
-        ]
-    else:
-        table_data = [
-            # Header row - ALL 8 COLUMNS
-            ['Problem', 'CR', 'MAJOR', 'MINOR', 'Problem', 'CR', 'MAJOR', 'MINOR'],
-            
-            # Row 1
-            ['Color Variation', 
-             str(problem_data['color_variation']['cr']), 
-             str(problem_data['color_variation']['major']), 
-             str(problem_data['color_variation']['minor']), 
-             'Clean', 
-             str(problem_data['clean']['cr']), 
-             str(problem_data['clean']['major']), 
-             str(problem_data['clean']['minor'])],
-            
-            # Row 2
-            ['Toe Lasting', 
-             str(problem_data['toe_lasting']['cr']), 
-             str(problem_data['toe_lasting']['major']), 
-             str(problem_data['toe_lasting']['minor']), 
-             'Heel Angle', 
-             str(problem_data['heel_angle']['cr']), 
-             str(problem_data['heel_angle']['major']), 
-             str(problem_data['heel_angle']['minor'])],
-            
-            # Row 3
-            ['Waist', 
-             str(problem_data['waist']['cr']), 
-             str(problem_data['waist']['major']), 
-             str(problem_data['waist']['minor']), 
-             'Edge Wrinkle', 
-             str(problem_data['edge_wrinkle']['cr']), 
-             str(problem_data['edge_wrinkle']['major']), 
-             str(problem_data['edge_wrinkle']['minor'])],
-            
-            # Row 4
-            ['Lace', 
-             str(problem_data['lace']['cr']), 
-             str(problem_data['lace']['major']), 
-             str(problem_data['lace']['minor']), 
-             'Outsole', 
-             str(problem_data['outsole']['cr']), 
-             str(problem_data['outsole']['major']), 
-             str(problem_data['outsole']['minor'])],
-            
-            # Row 5
-            ['Velcro', 
-             str(problem_data['velcro']['cr']), 
-             str(problem_data['velcro']['major']), 
-             str(problem_data['velcro']['minor']), 
-             'Adhesion', 
-             str(problem_data['adhesion']['cr']), 
-             str(problem_data['adhesion']['major']), 
-             str(problem_data['adhesion']['minor'])],
-            
-            # Row 6
-            ['Buckle', 
-             str(problem_data['buckle']['cr']), 
-             str(problem_data['buckle']['major']), 
-             str(problem_data['buckle']['minor']), 
-             'Midsole Glue', 
-             str(problem_data['midsole_glue']['cr']), 
-             str(problem_data['midsole_glue']['major']), 
-             str(problem_data['midsole_glue']['minor'])],
-            
-            # Row 7
-            ['Tongue', 
-             str(problem_data['tongue']['cr']), 
-             str(problem_data['tongue']['major']), 
-             str(problem_data['tongue']['minor']), 
-             'Grinding High', 
-             str(problem_data['grinding_high']['cr']), 
-             str(problem_data['grinding_high']['major']), 
-             str(problem_data['grinding_high']['minor'])],
-            
-            # Row 8
-            ['Back strap Length', 
-             str(problem_data['back_strap_length']['cr']), 
-             str(problem_data['back_strap_length']['major']), 
-             str(problem_data['back_strap_length']['minor']), 
-             'Heel', 
-             str(problem_data['heel']['cr']), 
-             str(problem_data['heel']['major']), 
-             str(problem_data['heel']['minor'])],
-            
-            # Row 9
-            ['Back strap attachment', 
-             str(problem_data['back_strap_attachment']['cr']), 
-             str(problem_data['back_strap_attachment']['major']), 
-             str(problem_data['back_strap_attachment']['minor']), 
-             'Toplift', 
-             str(problem_data['toplift']['cr']), 
-             str(problem_data['toplift']['major']), 
-             str(problem_data['toplift']['minor'])],
-            
-            # Row 10
-            ['Damage upper', 
-             str(problem_data['damage_upper']['cr']), 
-             str(problem_data['damage_upper']['major']), 
-             str(problem_data['damage_upper']['minor']), 
-             'Bottom Gapping', 
-             str(problem_data['bottom_gapping']['cr']), 
-             str(problem_data['bottom_gapping']['major']), 
-             str(problem_data['bottom_gapping']['minor'])],
-            
-            # Row 11
-            ['X-RAY', 
-             str(problem_data['xray_wrinkle']['cr']), 
-             str(problem_data['xray_wrinkle']['major']), 
-             str(problem_data['xray_wrinkle']['minor']), 
-             'Stains', 
-             str(problem_data['stains']['cr']), 
-             str(problem_data['stains']['major']), 
-             str(problem_data['stains']['minor'])],
-            
-            # Row 12 - Thread ends only on left side, right side empty
-            ['Thread ends', 
-             str(problem_data['thread_ends']['cr']), 
-             str(problem_data['thread_ends']['major']), 
-             str(problem_data['thread_ends']['minor']), 
-             '', '', '', ''],
-            
-            # Last row - Inspection results - USE CALCULATED TOTALS
-            [f'总缺陷数:' if language == "Mandarin" else 'Total:', 
-             str(total_cr), 
-             str(total_major), 
-             str(total_minor), 
-             '', '', '', '']
-        ]
-    
-    # Calculate column widths for portrait A4
-    page_width = A4[0] - 4*cm  # Portrait width minus margins
-    col_widths = [
-        page_width * 0.22,  # Problem column (left side)
-        page_width * 0.07,  # CR
-        page_width * 0.07,  # MAJOR
-        page_width * 0.07,  # MINOR
-        page_width * 0.22,  # Problem column (right side)
-        page_width * 0.07,  # CR
-        page_width * 0.07,  # MAJOR
-        page_width * 0.07   # MINOR
-    ]
-    
-    # Create table - 13 rows total (0-12)
-    table = Table(table_data, colWidths=col_widths, rowHeights=[22] + [18]*12 + [22])
-    
-    # Define table style
-    style = TableStyle([
-        # Header row styling - ALL WHITE BACKGROUND
-        ('BACKGROUND', (0, 0), (7, 0), colors.white),
-        
-        # All body rows - white background
-        ('BACKGROUND', (0, 1), (7, 13), colors.white),
-        
-        # Grid - thin black borders
-        ('GRID', (0, 0), (7, 13), 0.5, colors.black),
-        
-        # Font - Use appropriate font for Chinese
-        ('FONTNAME', (0, 0), (7, 13), 'Helvetica' if language == "English" else (chinese_font if chinese_font else 'Helvetica')),
-        ('FONTSIZE', (0, 0), (7, 13), 7),
-        
-        # Header row - bold
-        ('FONTNAME', (0, 0), (7, 0), 'Helvetica-Bold' if language == "English" else (chinese_font if chinese_font else 'Helvetica-Bold')),
-        ('FONTSIZE', (0, 0), (7, 0), 8),
-        
-        # Last row - bold
-        ('FONTNAME', (0, 13), (3, 13), 'Helvetica-Bold' if language == "English" else (chinese_font if chinese_font else 'Helvetica-Bold')),
-        ('FONTNAME', (4, 13), (4, 13), 'Helvetica-Bold' if language == "English" else (chinese_font if chinese_font else 'Helvetica-Bold')),
-        ('FONTNAME', (5, 13), (7, 13), 'Helvetica-Bold' if language == "English" else (chinese_font if chinese_font else 'Helvetica-Bold')),
-        
-        # Background colors for last row to match screenshot
-        ('BACKGROUND', (0, 13), (0, 13), colors.Color(0.95, 0.95, 0.7)),  # Light yellow
-        ('BACKGROUND', (1, 13), (3, 13), colors.Color(0.8, 0.85, 1.0)),   # Light blue
-        ('BACKGROUND', (4, 13), (4, 13), colors.white),
-        ('BACKGROUND', (5, 13), (7, 13), colors.Color(0.8, 1.0, 0.8)),    # Light green
-        
-        # Alignment
-        ('ALIGN', (0, 0), (0, 13), 'LEFT'),      # Left problem column
-        ('ALIGN', (1, 0), (3, 13), 'CENTER'),    # CR, MAJOR, MINOR (left)
-        ('ALIGN', (4, 0), (4, 13), 'LEFT'),      # Right problem column
-        ('ALIGN', (5, 0), (7, 13), 'CENTER'),    # CR, MAJOR, MINOR (right)
-        
-        ('VALIGN', (0, 0), (7, 13), 'MIDDLE'),
-        
-        # Padding
-        ('LEFTPADDING', (0, 0), (7, 13), 4),
-        ('RIGHTPADDING', (0, 0), (7, 13), 4),
-        ('TOPPADDING', (0, 0), (7, 13), 3),
-        ('BOTTOMPADDING', (0, 0), (7, 13), 3),
-    ])
-    
-    table.setStyle(style)
-    return KeepTogether(table)  # Keep table together on same page
-
-def create_photos_of_faults_table(language, chinese_font=None):
+def build_defect_crop_index(analyses):
     """
-    Create Photos of Faults section for PDF with:
-    1. Only Defect Type headers have color (Critical=red, Major=orange, Minor=blue)
-    2. Container name has NO background color (white background)
-    3. Title "PHOTOS OF FAULTS" has color (dark blue)
-    4. Images aligned to left under container name
-    5. Defects arranged in rows (max 2 per row)
-    6. Defect names wrap text
-    7. All severity types on same page if possible
+    Map each AI defect to the image it was found on and its box, without cropping anything.
+    analyses is the per-image list of analysis dicts (None for failed images).
     """
-    from reportlab.platypus import Image as ReportLabImage, PageBreak, Spacer, Table, TableStyle, Paragraph, KeepTogether
-    from reportlab.lib.styles import ParagraphStyle
-    from reportlab.lib.units import inch, cm
-    from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
-    from reportlab.lib import colors
-    from reportlab.lib.pagesizes import A4
-    import io
-    
-    # Get QC defect containers
-    qc_containers = st.session_state.get('qc_defect_containers', [])
-    
-    if not qc_containers:
-        return None  # Don't show section if no containers
-    
-    # Group containers by severity
-    containers_by_severity = {
-        'critical': [c for c in qc_containers if c.get('severity') == 'critical'],
-        'major': [c for c in qc_containers if c.get('severity') == 'major'],
-        'minor': [c for c in qc_containers if c.get('severity') == 'minor']
-    }
-    
-    # Remove empty severity groups
-    containers_by_severity = {k: v for k, v in containers_by_severity.items() if v}
-    
-    if not containers_by_severity:
-        return None
-    
-    elements = []
-    
-    # ========== MAIN TITLE ==========
-    title_text = "缺陷照片" if language == "Mandarin" else "PHOTOS OF FAULTS"
-    
-    title_style = ParagraphStyle(
-        'PhotosMainTitle',
-        fontName='Helvetica-Bold' if language == "English" else (chinese_font if chinese_font else 'Helvetica-Bold'),
-        fontSize=16,
-        alignment=TA_CENTER,
-        textColor=colors.white,
-        spaceAfter=0
-    )
-    
-    # Create title table with dark blue background
-    title_table = Table(
-        [[Paragraph(title_text, title_style)]],
-        colWidths=[A4[0] - 4*cm]
-    )
-    title_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, -1), colors.Color(0.2, 0.3, 0.5)),  # Dark blue
-        ('TEXTCOLOR', (0, 0), (-1, -1), colors.white),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('BOX', (0, 0), (-1, -1), 2, colors.Color(0.15, 0.2, 0.35)),
-        ('TOPPADDING', (0, 0), (-1, -1), 12),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
-    ]))
-    
-    elements.append(title_table)
-    elements.append(Spacer(1, 20))
-    
-    # ========== DEFECT SEVERITY COLORS ==========
-    severity_colors = {
-        'critical': colors.Color(0.85, 0.2, 0.2),    # Red
-        'major': colors.Color(0.95, 0.6, 0.15),      # Orange
-        'minor': colors.Color(0.25, 0.5, 0.85)       # Blue
-    }
-    
-    # ========== PROCESS ALL SEVERITY GROUPS ==========
-    # Try to keep all on one page if possible
-    all_containers_processed = []
-    
-    # Process in order: Critical, Major, Minor
-    for severity in ['critical', 'major', 'minor']:
-        if severity not in containers_by_severity:
+    crop_index = {}
+    for img_idx, analysis in enumerate(analyses):
+        if not analysis:
             continue
-        
-        severity_containers = containers_by_severity[severity]
-        containers_with_images = [c for c in severity_containers if c.get('images')]
-        
-        if not containers_with_images:
-            continue
-        
-        # Add severity header with color
-        if language == "Mandarin":
-            severity_labels = {
-                'critical': "严重问题",
-                'major': "主要问题", 
-                'minor': "次要问题"
+        for position, (defect_desc, coords) in enumerate(analysis.get('defect_coordinates', {}).items()):
+            crop_index[f"defect_{img_idx}_{position}"] = {
+                'image_index': img_idx,
+                'coordinates': coords,
+                'description': defect_desc,
+                'category': get_defect_category(defect_desc, analysis)
             }
-        else:
-            severity_labels = {
-                'critical': "CRITICAL DEFECTS",
-                'major': "MAJOR DEFECTS",
-                'minor': "MINOR DEFECTS"
-            }
-        
-        header_text = severity_labels[severity]
-        header_style = ParagraphStyle(
-            f'SeverityHeader_{severity}',
-            fontName='Helvetica-Bold' if language == "English" else (chinese_font if chinese_font else 'Helvetica-Bold'),
-            fontSize=12,
-            alignment=TA_CENTER,
-            textColor=colors.white
-        )
-        
-        header_table = Table(
-            [[Paragraph(header_text, header_style)]],
-            colWidths=[A4[0] - 4*cm],
-            rowHeights=[25]
-        )
-        
-        header_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, -1), severity_colors[severity]),
-            ('TEXTCOLOR', (0, 0), (-1, -1), colors.white),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-            ('BOX', (0, 0), (-1, -1), 1, severity_colors[severity]),
-            ('TOPPADDING', (0, 0), (-1, -1), 4),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
-        ]))
-        
-        elements.append(header_table)
-        elements.append(Spacer(1, 10))
-        
-        
-        # Process containers in rows (max 2 per row)
-        container_count = len(containers_with_images)
-        
-        for i in range(0, container_count, 2):
-            # Get up to 2 containers for this row
-            row_containers = containers_with_images[i:min(i+2, container_count)]
-            
-            # Create table for this row (max 2 columns)
-            row_data = []
-            col_widths = []
-            
-            for container in row_containers:
-                images = container.get('images', [])
-                defect_name = container['name']
-                
-                # Translate defect name if needed
-                if language == "Mandarin":
-                    defect_name = translate_text_with_openai(defect_name, "Mandarin")
-                
-                # Create content for this cell
-                cell_content = []
-                
-                # 1. Container name (NO background color, white background)
-                name_style = ParagraphStyle(
-                    f'DefectName_{severity}_{i}',
-                    fontName='Helvetica-Bold' if language == "English" else (chinese_font if chinese_font else 'Helvetica-Bold'),
-                    fontSize=10,
-                    alignment=TA_LEFT,
-                    textColor=colors.black,  # Black text on white background
-                    wordWrap='LTR',  # Allow text wrapping
-                    leading=12
-                )
-                
-                # Wrap text if too long
-                wrapped_name = defect_name
-                if len(defect_name) > 30:
-                    # Simple wrapping - break into multiple lines
-                    words = defect_name.split()
-                    lines = []
-                    current_line = ""
-                    for word in words:
-                        if len(current_line) + len(word) + 1 <= 30:
-                            current_line += " " + word if current_line else word
-                        else:
-                            lines.append(current_line)
-                            current_line = word
-                    if current_line:
-                        lines.append(current_line)
-                    wrapped_name = "\n".join(lines)
-                
-                cell_content.append(Paragraph(wrapped_name, name_style))
-                
-                # 2. Image (1 inch x 1 inch)
-                if images:
-                    try:
-                        img_bytes = images[0]
-                        img_buffer = io.BytesIO(img_bytes)
-                        
-                        # Create ReportLab Image
-                        reportlab_img = ReportLabImage(img_buffer)
-                        reportlab_img.drawWidth = 1 * inch
-                        reportlab_img.drawHeight = 1 * inch
-                        
-                        cell_content.append(reportlab_img)
-                    except Exception as e:
-                        error_text = f"[Image error]"
-                        error_style = ParagraphStyle(
-                            'ErrorText',
-                            fontName='Helvetica',
-                            fontSize=8,
-                            textColor=colors.red
-                        )
-                        cell_content.append(Paragraph(error_text, error_style))
-                
-                row_data.append(cell_content)
-                col_widths.append((A4[0] - 5*cm) / 2)  # Equal width for 2 columns
-            
-            # If only one container in this row, add empty cell
-            if len(row_containers) == 1:
-                row_data.append([Paragraph("", ParagraphStyle('Empty'))])
-                col_widths.append((A4[0] - 5*cm) / 2)
-            
-            # Create table for this row
-            if row_data:
-                # Convert to proper table structure
-                table_data = []
-                max_elements = max(len(cell) for cell in row_data)
-                
-                for element_idx in range(max_elements):
-                    row = []
-                    for cell_idx in range(len(row_data)):
-                        if element_idx < len(row_data[cell_idx]):
-                            row.append(row_data[cell_idx][element_idx])
-                        else:
-                            row.append(Paragraph("", ParagraphStyle('Empty')))
-                    table_data.append(row)
-                
-                # Create the table
-                row_table = Table(table_data, colWidths=col_widths)
-                
-                # Style the table - NO background color for container names
-                table_style = TableStyle([
-                    # All cells - white background, black border
-                    ('BACKGROUND', (0, 0), (-1, -1), colors.white),
-                    ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-                    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-                    ('LEFTPADDING', (0, 0), (-1, -1), 5),
-                    ('RIGHTPADDING', (0, 0), (-1, -1), 5),
-                    ('TOPPADDING', (0, 0), (-1, -1), 3),
-                    ('BOTTOMPADDING', (0, 0), (-1, -1), 3),
-                ])
-                
-                row_table.setStyle(table_style)
-                elements.append(row_table)
-                elements.append(Spacer(1, 15))
-        
-        # Add spacing between severity groups
-        if severity in ['critical', 'major'] and 'minor' in containers_by_severity:
-            elements.append(Spacer(1, 20))
-    
-    return elements
+    return crop_index
+
+def get_defect_crop(defect_id):
+    """JPEG bytes of a defect close-up, cropped from the original on first use and memoized"""
+    if defect_id in st.session_state.defect_crops:
+        return st.session_state.defect_crops[defect_id]
+    entry = st.session_state.defect_crop_index.get(defect_id)
+    if not entry or entry['image_index'] >= len(st.session_state.inspection_images):
+        return None
+    original_image = load_inspection_image(entry['image_index'])
+    cropped_image = crop_defect_area(original_image, entry['coordinates'])
+    crop_bytes = save_image_to_buffer(flatten_to_rgb(cropped_image)).getvalue() if cropped_image else None
+    st.session_state.defect_crops[defect_id] = crop_bytes
+    return crop_bytes
 
 
 def render_photos_of_faults_ui():
@@ -3305,501 +2248,115 @@ def render_photos_of_faults_ui():
             st.info("📁 Please upload an image to create container")
 
 
-def generate_multilingual_pdf(order_info, language):
-    """Generate PDF with proper Mandarin font handling - UPDATED WITH TIMESTAMP & LOCATION FOOTER"""
-    try:
-        buffer = io.BytesIO()
-        
-        # Register Chinese font if available
-        chinese_font = None
-        try:
-            if language == "Mandarin":
-                # Try to use built-in Chinese font from ReportLab
-                try:
-                    pdfmetrics.registerFont(UnicodeCIDFont('STSong-Light'))
-                    chinese_font = 'STSong-Light'
-                except:
-                    try:
-                        # Try other common Chinese fonts
-                        pdfmetrics.registerFont(TTFont('SimSun', 'simsun.ttc'))
-                        chinese_font = 'SimSun'
-                    except:
-                        try:
-                            pdfmetrics.registerFont(TTFont('YaHei', 'msyh.ttc'))
-                            chinese_font = 'YaHei'
-                        except:
-                            # Fall back to Helvetica
-                            chinese_font = 'Helvetica'
-        except Exception as e:
-            st.warning(f"Could not register Chinese font: {str(e)}")
-            chinese_font = 'Helvetica'
-        
-        # Use appropriate font
-        if language == "Mandarin" and chinese_font:
-            base_font = chinese_font
-            bold_font = chinese_font
-        else:
-            base_font = 'Helvetica'
-            bold_font = 'Helvetica-Bold'
-        
-        # Define header/footer function with timestamp and location - OUTSIDE the try block
-        def add_header_footer(canvas, doc):
-            """Add header and footer to all pages with timestamp and location"""
-            canvas.saveState()
-            
-            # Get current timestamp based on selected city's timezone
-            selected_city = st.session_state.get('selected_city', 'Guangzhou')
-            
-            # Get the timezone for the selected city from your CITY_TIMEZONES dictionary
-            city_timezone = CITY_TIMEZONES.get(selected_city, 'Asia/Shanghai')  # Default to Shanghai timezone
-            
-            try:
-                # Create timezone object
-                import pytz
-                tz = pytz.timezone(city_timezone)
-                
-                # Get current time in the selected city's timezone
-                city_time = datetime.now(tz)
-                timestamp = city_time.strftime("%Y-%m-%d %H:%M:%S")
-                
-            except Exception as e:
-                # Fallback to server time if timezone conversion fails
-                # Note: We can't use st.warning here as this runs in PDF generation context
-                timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            
-            # USE SELECTED CITY FROM DROPDOWN
-            chinese_city_name = CHINESE_CITIES.get(selected_city, "广东")
-            
-            if language == "Mandarin":
-                location = chinese_city_name
-            else:
-                location = selected_city
-            
-            # Page dimensions
-            page_width = A4[0]
-            page_height = A4[1]
-            
-            # FOOTER: Centered at bottom with timestamp and location
-            footer_text = f"Generated: {timestamp} | Location: {location}"
-            footer_font_size = 8
-            
-            canvas.setFont(base_font, footer_font_size)
-            canvas.setFillColor(colors.grey)
-            
-            # Draw footer text centered at bottom
-            text_width = canvas.stringWidth(footer_text, base_font, footer_font_size)
-            footer_x = (page_width - text_width) / 2
-            footer_y = 1*cm  # 1cm from bottom
-            
-            canvas.drawString(footer_x, footer_y, footer_text)
-            
-            # HEADER: GRAND STEP (H.K.) LTD on all pages except first
-            if doc.page > 1:
-                header_font_size = 12
-                canvas.setFont(bold_font, header_font_size)
-                canvas.setFillColor(colors.black)
-                
-                # Draw header at top center (NO UNDERLINE)
-                header_text = "GRAND STEP (H.K.) LTD"
-                canvas.drawCentredString(page_width/2, page_height - 1*cm, header_text)
-            
-            # PAGE NUMBER: Top right corner
-            page_text = f"Page {doc.page}"
-            canvas.setFont(base_font, 10)
-            canvas.drawRightString(page_width - 2*cm, page_height - 1*cm, page_text)
-            
-            canvas.restoreState()
-        
-        # Create document with increased bottom margin for footer
-        doc = SimpleDocTemplate(buffer, pagesize=A4, 
-                               rightMargin=2*cm, leftMargin=2*cm, 
-                               topMargin=2*cm, bottomMargin=2.5*cm)  # Increased bottom margin for footer
-        
-        elements = []
-        styles = getSampleStyleSheet()
-        
-        brand_blue = colors.Color(0.4, 0.49, 0.91)  # Original purple color
-        success_green = colors.Color(0.31, 0.78, 0.47)
-        warning_orange = colors.Color(1.0, 0.6, 0.0)
-        danger_red = colors.Color(1.0, 0.42, 0.42)
-        light_gray = colors.Color(0.97, 0.97, 0.97)
-        
-        # Restore original styles
-        title_style = ParagraphStyle('Title', parent=styles['Normal'], fontSize=22, alignment=TA_CENTER,
-                                     textColor=brand_blue, fontName=bold_font, spaceAfter=12)
-        subtitle_style = ParagraphStyle('Subtitle', parent=styles['Normal'], fontSize=12, alignment=TA_CENTER,
-                                        textColor=colors.Color(0.3, 0.3, 0.3), fontName=base_font, spaceAfter=8)
-        section_style = ParagraphStyle('Section', parent=styles['Heading2'], fontSize=14, spaceAfter=10,
-                                      spaceBefore=15, textColor=brand_blue, fontName=bold_font, alignment=TA_CENTER)
-        
-        # HEADER FOR PAGE 1 - Original purple GRAND STEP (H.K.) LTD
-        if language == "Mandarin":
-            elements.append(Paragraph("GRAND STEP (H.K.) LTD", title_style))
-            elements.append(Spacer(1, 12))
-            elements.append(Paragraph("专业鞋类制造与质量控制", subtitle_style))
-            elements.append(Paragraph("AI驱动质量检查系统", subtitle_style))
-            elements.append(Spacer(1, 20))
-            
-            # Title
-            title_text = "质量控制检查报告"
-        else:
-            elements.append(Paragraph("GRAND STEP (H.K.) LTD", title_style))
-            elements.append(Spacer(1, 12))
-            elements.append(Paragraph("Professional Footwear Manufacturing & Quality Control", subtitle_style))
-            elements.append(Paragraph("AI-Powered Quality Inspection System", subtitle_style))
-            elements.append(Spacer(1, 20))
-            
-            # Title
-            title_text = "QUALITY CONTROL INSPECTION REPORT"
-        
-        report_title = ParagraphStyle('ReportTitle', parent=title_style, fontSize=16, 
-                                      textColor=colors.black, fontName=bold_font)
-        elements.append(Paragraph(title_text, report_title))
-        elements.append(Spacer(1, 20))
-        
-        # Final Decision
-        final_result, final_reason = calculate_final_decision()
-        result_text = final_result
-        
-        # TRANSLATE DECISION TEXT FOR MANDARIN
-        if language == "Mandarin":
-            final_label = "最终质检决定"
-            if final_result == "ACCEPT":
-                result_text = "接受"
-                final_reason = "所有缺陷在AQL 2.5限制内"
-            elif final_result == "REJECT":
-                result_text = "拒绝"
-                if "Critical defects" in final_reason:
-                    final_reason = "严重缺陷 - 零容忍"
-                else:
-                    final_reason = "主要缺陷超出AQL限制"
-            elif final_result == "REWORK":
-                result_text = "返工"
-                final_reason = "次要缺陷超出AQL限制"
-        else:
-            final_label = "FINAL QC DECISION"
-        
-        result_color = success_green if final_result=='ACCEPT' else (danger_red if final_result=='REJECT' else warning_orange)
-        
-        result_style = ParagraphStyle('Result', parent=styles['Normal'], fontSize=18, alignment=TA_CENTER,
-                                     fontName=bold_font, spaceAfter=10, textColor=result_color)
-        
-        elements.append(Paragraph(f"{final_label}: {result_text}", result_style))
-        
-        body_style = ParagraphStyle('Body', parent=styles['Normal'], fontSize=10, spaceAfter=6,
-                                    fontName=base_font, textColor=colors.black)
-        elements.append(Paragraph(final_reason, body_style))
-        elements.append(Spacer(1, 20))
-        
-        # Order Information
-        if language == "Mandarin":
-            order_label = "订单信息"
-            # Prepare order data in Mandarin
-            order_data = [
-                ['合同编号', order_info['contract_number']],
-                ['工厂', order_info['factory']],
-                ['订单数量', order_info['order_qty']],
-                ['款式', order_info['style_number']],
-                ['颜色', order_info['color']],
-                ['客户', order_info['customer']],
-                ['检查员', order_info['inspector']],
-                ['日期', order_info['inspection_date']],
-                ['总抽样', st.session_state.total_sampling if st.session_state.total_sampling else calculate_total_sampling(order_info['order_qty'])],
-                ['箱号', st.session_state.ctn_no if st.session_state.ctn_no else ''],
-                ['批次大小', st.session_state.lot_size if st.session_state.lot_size else ''],
-                ['标准', "AQL 2.5"]
-            ]
-        else:
-            order_label = "ORDER INFORMATION"
-            order_data = [
-                ['Contract Number', order_info['contract_number']],
-                ['Factory', order_info['factory']],
-                ['Order Qty', order_info['order_qty']],
-                ['Style', order_info['style_number']],
-                ['Color', order_info['color']],
-                ['Customer', order_info['customer']],
-                ['Inspector', order_info['inspector']],
-                ['Date', order_info['inspection_date']],
-                ['Total Sampling', st.session_state.total_sampling if st.session_state.total_sampling else calculate_total_sampling(order_info['order_qty'])],
-                ['CTN No', st.session_state.ctn_no if st.session_state.ctn_no else ''],
-                ['Lot Size', st.session_state.lot_size if st.session_state.lot_size else ''],
-                ['Standard', "AQL 2.5"]
-            ]
-        
-        order_section_style = ParagraphStyle('OrderSection', parent=section_style, 
-                                            fontName=bold_font)
-        elements.append(Paragraph(order_label, order_section_style))
-        elements.append(Spacer(1, 10))
-        
-        order_table = Table(order_data, colWidths=[5*cm, 9*cm])
-        order_table.setStyle(TableStyle([
-            ('BACKGROUND', (0,0), (0,-1), brand_blue),
-            ('TEXTCOLOR', (0,0), (0,-1), colors.white),
-            ('BACKGROUND', (1,0), (1,-1), light_gray),
-            ('FONTNAME', (0,0), (0,-1), base_font),
-            ('FONTNAME', (1,0), (1,-1), base_font),
-            ('FONTSIZE', (0,0), (-1,-1), 10),
-            ('ALIGN', (0,0), (-1,-1), 'LEFT'),
-            ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
-            ('TOPPADDING', (0,0), (-1,-1), 8),
-            ('BOTTOMPADDING', (0,0), (-1,-1), 8),
-            ('GRID', (0,0), (-1,-1), 1, colors.grey)
-        ]))
-        elements.append(KeepTogether(order_table))  # Keep order table together
-        elements.append(Spacer(1, 20))
-        
-        # SAMPLING INSPECTION TABLE - Start new page
-        elements.append(PageBreak())
-        
-        if language == "Mandarin":
-            sampling_label = "抽样检查"
-        else:
-            sampling_label = "SAMPLING INSPECTION"
-            
-        sampling_section_style = ParagraphStyle('SamplingSection', parent=section_style,
-                                               fontName=bold_font)
-        elements.append(Paragraph(sampling_label, sampling_section_style))
-        elements.append(Spacer(1, 8))
-        
-        # Create sampling table
-        sampling_table = create_sampling_table(order_info['order_qty'], language, chinese_font)
-        if sampling_table:
-            elements.append(sampling_table)
-        elements.append(Spacer(1, 20))
-        
-        # PROBLEM IDENTIFIED BY THE AI TABLE
-        if language == "Mandarin":
-            problem_ai_label = "AI识别的问题"
-        else:
-            problem_ai_label = "PROBLEM IDENTIFIED BY THE AI"
-            
-        problem_section_style = ParagraphStyle('ProblemSection', parent=section_style,
-                                              fontName=bold_font)
-        elements.append(Paragraph(problem_ai_label, problem_section_style))
-        elements.append(Spacer(1, 8))
-        
-        # Create AI problem table
-        ai_problem_table = create_problem_table(st.session_state.problem_defects_ai, "AI", language, chinese_font)
-        if ai_problem_table:
-            elements.append(ai_problem_table)
-        elements.append(Spacer(1, 20))
-        
-        # PROBLEM IDENTIFIED BY THE QC MANAGER TABLE - Start new page if needed
-        elements.append(PageBreak())
-        
-        if language == "Mandarin":
-            problem_qc_label = "质检经理识别的问题"
-        else:
-            problem_qc_label = "PROBLEM IDENTIFIED BY THE QC MANAGER"
-            
-        elements.append(Paragraph(problem_qc_label, problem_section_style))
-        elements.append(Spacer(1, 8))
-        
-        # Create QC problem table
-        qc_problem_table = create_problem_table(st.session_state.problem_defects_qc, "QC", language, chinese_font)
-        if qc_problem_table:
-            elements.append(qc_problem_table)
-        elements.append(Spacer(1, 20))
-        
-        # CRITICAL DEFECTS REVIEW - Start new page
-        elements.append(PageBreak())
-        
-        if language == "Mandarin":
-            critical_label = "严重缺陷审查"
-        else:
-            critical_label = "CRITICAL DEFECTS REVIEW"
-            
-        critical_style = ParagraphStyle('CriticalSection', parent=section_style,
-                                       fontName=bold_font, textColor=danger_red)
-        elements.append(Paragraph(critical_label, critical_style))
-        elements.append(Spacer(1, 8))
-        
-        # Get critical defects
-        qc_critical_ids, qc_critical_translated = get_translated_defects('qc_critical', language)
-        if qc_critical_translated:
-            for i, defect in enumerate(qc_critical_translated, 1):
-                defect_style = ParagraphStyle(f'defect{i}', parent=styles['Normal'], 
-                                            textColor=danger_red, fontSize=9, 
-                                            fontName=base_font, leftIndent=15)
-                elements.append(Paragraph(f"{i}. {defect}", defect_style))
-                elements.append(Spacer(1, 4))
-        else:
-            no_defects_text = "无严重缺陷" if language == "Mandarin" else "No critical defects found"
-            no_defects_style = ParagraphStyle('NoDefects', parent=styles['Normal'], 
-                                            fontSize=9, fontName=base_font, 
-                                            alignment=TA_CENTER)
-            elements.append(Paragraph(no_defects_text, no_defects_style))
-        
-        elements.append(Spacer(1, 12))
-        
-        # MAJOR DEFECTS REVIEW
-        if language == "Mandarin":
-            major_label = "主要缺陷审查"
-        else:
-            major_label = "MAJOR DEFECTS REVIEW"
-            
-        major_style = ParagraphStyle('MajorSection', parent=section_style,
-                                    fontName=bold_font, textColor=warning_orange)
-        elements.append(Paragraph(major_label, major_style))
-        elements.append(Spacer(1, 8))
-        
-        # Get major defects
-        qc_major_ids, qc_major_translated = get_translated_defects('qc_major', language)
-        if qc_major_translated:
-            for i, defect in enumerate(qc_major_translated, 1):
-                defect_style = ParagraphStyle(f'defect{i}', parent=styles['Normal'], 
-                                            textColor=warning_orange, fontSize=9, 
-                                            fontName=base_font, leftIndent=15)
-                elements.append(Paragraph(f"{i}. {defect}", defect_style))
-                elements.append(Spacer(1, 4))
-        else:
-            no_defects_text = "无主要缺陷" if language == "Mandarin" else "No major defects found"
-            no_defects_style = ParagraphStyle('NoDefects', parent=styles['Normal'], 
-                                            fontSize=9, fontName=base_font, 
-                                            alignment=TA_CENTER)
-            elements.append(Paragraph(no_defects_text, no_defects_style))
-        
-        elements.append(Spacer(1, 12))
-        
-        # MINOR DEFECTS REVIEW
-        if language == "Mandarin":
-            minor_label = "次要缺陷审查"
-        else:
-            minor_label = "MINOR DEFECTS REVIEW"
-            
-        minor_style = ParagraphStyle('MinorSection', parent=section_style,
-                                    fontName=bold_font, textColor=brand_blue)
-        elements.append(Paragraph(minor_label, minor_style))
-        elements.append(Spacer(1, 8))
-        
-        # Get minor defects
-        qc_minor_ids, qc_minor_translated = get_translated_defects('qc_minor', language)
-        if qc_minor_translated:
-            for i, defect in enumerate(qc_minor_translated, 1):
-                defect_style = ParagraphStyle(f'defect{i}', parent=styles['Normal'], 
-                                            textColor=brand_blue, fontSize=9, 
-                                            fontName=base_font, leftIndent=15)
-                elements.append(Paragraph(f"{i}. {defect}", defect_style))
-                elements.append(Spacer(1, 4))
-        else:
-            no_defects_text = "无次要缺陷" if language == "Mandarin" else "No minor defects found"
-            no_defects_style = ParagraphStyle('NoDefects', parent=styles['Normal'], 
-                                            fontSize=9, fontName=base_font, 
-                                            alignment=TA_CENTER)
-            elements.append(Paragraph(no_defects_text, no_defects_style))
-        
-        elements.append(Spacer(1, 20))
-        
-        # QC INSPECTOR REVIEW & AMENDMENTS - Start new page if needed
-        elements.append(PageBreak())
-        
-        if language == "Mandarin":
-            qc_label = "质检员检查与修改"
-        else:
-            qc_label = "QC INSPECTOR REVIEW & AMENDMENTS"
-            
-        qc_section_style = ParagraphStyle('QCSection', parent=section_style,
-                                         fontName=bold_font)
-        
-        # Get sampling limits for display
-        sampling_limits = get_sampling_limits(order_info['order_qty'])
-        major_limit = sampling_limits["major_limit"]
-        minor_limit = sampling_limits["minor_limit"]
-        
-        ai_critical_count = len(st.session_state.defect_store['ai_critical'])
-        ai_major_count = len(st.session_state.defect_store['ai_major'])
-        ai_minor_count = len(st.session_state.defect_store['ai_minor'])
-        
-        qc_critical_count = len(st.session_state.defect_store['qc_critical'])
-        qc_major_count = len(st.session_state.defect_store['qc_major'])
-        qc_minor_count = len(st.session_state.defect_store['qc_minor'])
-        
-        crit_change = qc_critical_count - ai_critical_count
-        maj_change = qc_major_count - ai_major_count
-        min_change = qc_minor_count - ai_minor_count
-        
-        if language == "Mandarin":
-            qc_data = [
-                ['缺陷类型', 'AI数量', '质检最终', '变化', '状态'],
-                ['严重', str(ai_critical_count), str(qc_critical_count),
-                 f"{crit_change:+d}" if crit_change != 0 else "0",
-                 '失败' if qc_critical_count>0 else '通过'],
-                ['主要', str(ai_major_count), str(qc_major_count),
-                 f"{maj_change:+d}" if maj_change != 0 else "0",
-                 f'失败' if qc_major_count>major_limit else '通过'],
-                ['次要', str(ai_minor_count), str(qc_minor_count),
-                 f"{min_change:+d}" if min_change != 0 else "0",
-                 f'失败' if qc_minor_count>minor_limit else '通过']
-            ]
-        else:
-            qc_data = [
-                ['Defect Type', 'AI Count', 'QC Final', 'Change', 'Status'],
-                ['Critical', str(ai_critical_count), str(qc_critical_count),
-                 f"{crit_change:+d}" if crit_change != 0 else "0",
-                 'FAIL' if qc_critical_count>0 else 'PASS'],
-                ['Major', str(ai_major_count), str(qc_major_count),
-                 f"{maj_change:+d}" if maj_change != 0 else "0",
-                 f'FAIL' if qc_major_count>major_limit else 'PASS'],
-                ['Minor', str(ai_minor_count), str(qc_minor_count),
-                 f"{min_change:+d}" if min_change != 0 else "0",
-                 f'FAIL' if qc_minor_count>minor_limit else 'PASS']
-            ]
-        
-        qc_table = Table(qc_data, colWidths=[3*cm, 2.5*cm, 2.5*cm, 2.5*cm, 3*cm])
-        qc_table.setStyle(TableStyle([
-            ('BACKGROUND', (0,0), (-1,0), warning_orange),
-            ('TEXTCOLOR', (0,0), (-1,0), colors.white),
-            ('FONTNAME', (0,0), (-1,0), bold_font),
-            ('FONTNAME', (0,1), (-1,-1), base_font),
-            ('FONTSIZE', (0,0), (-1,-1), 10),
-            ('ALIGN', (0,0), (-1,-1), 'CENTER'),
-            ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
-            ('TOPPADDING', (0,0),(-1,-1), 10),
-            ('BOTTOMPADDING', (0,0), (-1,-1), 10),
-            ('GRID', (0,0), (-1,-1), 1, colors.grey)
-        ]))
-        
-        elements.append(Paragraph(qc_label, qc_section_style))
-        elements.append(Spacer(1, 10))
-        elements.append(KeepTogether(qc_table))  # Keep QC table together
-        elements.append(Spacer(1, 20))
-        photos_elements = create_photos_of_faults_table(language, chinese_font)
-        if photos_elements:
-            elements.append(PageBreak())
-            elements.extend(photos_elements)
-        
-        # QC NOTES - Start new page if needed
-        if st.session_state.qc_notes_english and st.session_state.qc_notes_english.strip():
-            elements.append(PageBreak())
-            
-            if language == "Mandarin":
-                notes_label = "质检经理备注"
-            else:
-                notes_label = "QC MANAGER NOTES"
-                
-            notes_section_style = ParagraphStyle('NotesSection', parent=section_style, fontName=bold_font)
-            elements.append(Paragraph(notes_label, notes_section_style))
-            
-            # Translate notes if needed
-            if language == "Mandarin":
-                notes_text = translate_text_with_openai(st.session_state.qc_notes_english, "Mandarin")
-            else:
-                notes_text = st.session_state.qc_notes_english
-                
-            notes_body_style = ParagraphStyle('NotesBody', parent=styles['Normal'], fontSize=10,
-                                             fontName=base_font)
-            elements.append(Paragraph(notes_text, notes_body_style))
-            elements.append(Spacer(1, 15))
-        
-        # Build the PDF with unified header/footer on all pages
-        doc.build(elements, onFirstPage=add_header_footer, onLaterPages=add_header_footer)
-        return buffer.getvalue()
-        
-    except Exception as e:
-        st.error(f"PDF Error: {str(e)}")
-        import traceback
-        st.error(traceback.format_exc())
-        return None
+def inspection_state_from_session():
+    """The session's inspection as an InspectionState; dicts and lists are shared with the session"""
+    return InspectionState(
+        order_qty=st.session_state.get('order_qty_input', "1000"),
+        defect_store=st.session_state.defect_store,
+        problem_defects_ai=st.session_state.problem_defects_ai,
+        problem_defects_qc=st.session_state.problem_defects_qc,
+        qc_defect_containers=st.session_state.get('qc_defect_containers', []),
+        qc_notes_english=st.session_state.qc_notes_english,
+        total_sampling=st.session_state.total_sampling,
+        ctn_no=st.session_state.ctn_no,
+        lot_size=st.session_state.lot_size,
+        selected_city=st.session_state.get('selected_city', 'Guangzhou')
+    )
+
+def store_inspection_state(state):
+    """Write an InspectionState's fields back to the session"""
+    for name in InspectionState.__slots__:
+        if name != 'order_qty':  # Owned by the order quantity input
+            st.session_state[name] = getattr(state, name)
+
+def run_analysis_job(job, images, style_number, color, contract_number, order_qty, analysis_mode):
+    """Background body of an inspection: progress, streamed defects and errors go to the job"""
+    return run_inspection_analysis(
+        client, images, style_number, color, contract_number, order_qty, analysis_mode,
+        on_complete=job.set_progress, on_defect=job.add_event, on_error=job.add_error
+    )
+
+def run_pdf_job(job, order_info, languages, inspection):
+    return generate_all_language_pdfs(client, order_info, inspection, languages)
+
+def apply_analysis_job(job):
+    """Load a finished analysis job's results into this session"""
+    outcome = job.result
+    analyses = outcome["analyses"]
+    ai_report = outcome["report"]
+    usage_log = outcome["usage_log"]
+    
+    # Index defect locations only; crops are made when first shown (see get_defect_crop)
+    # Taken out of the job, so the shared queue does not hold the uploads for its retention period;
+    # reopening the job later shows its results without defect crops
+    replace_inspection_images(job.meta.pop("inspection_images", []))
+    st.session_state.defect_crop_index = build_defect_crop_index(analyses)
+    
+    inspection = inspection_state_from_session()
+    update_ai_problem_table(inspection, ai_report)
+    store_inspection_state(inspection)
+    
+    # Keep a per-session record of each run so the two analysis modes can be compared
+    st.session_state.analysis_benchmarks.append({
+        "mode": ANALYSIS_MODES[job.meta["analysis_mode"]],
+        "seconds": round(outcome["seconds"], 1),
+        "requests": len(usage_log),
+        # Images answered from the analysis cache cost no request and no tokens
+        "cached_images": sum(1 for analysis in analyses if analysis and analysis.get("from_cache")),
+        "prompt_tokens": sum(usage["prompt_tokens"] for usage in usage_log),
+        "completion_tokens": sum(usage["completion_tokens"] for usage in usage_log),
+        "raw_defects": sum(
+            len(analysis.get(f"{category}_defects", []))
+            for analysis in analyses if analysis
+            for category in ['critical', 'major', 'minor']
+        ),
+        "defects_after_dedup": ai_report["critical_count"] + ai_report["major_count"] + ai_report["minor_count"]
+    })
+    
+    st.session_state.analysis_cache_summary = {
+        "hits": sum(1 for analysis in analyses if analysis and analysis.get("from_cache")),
+        "misses": sum(1 for analysis in analyses if analysis and not analysis.get("from_cache"))
+    }
+    st.session_state.inspection_id = job.id
+    st.session_state.ai_report = ai_report
+    st.session_state.order_info = job.meta["order_info"]
+    st.session_state.defect_coordinates = outcome["defect_coordinates"]
+    st.session_state.qc_notes_english = ''
+    st.session_state.pdf_job_id = None
+    st.session_state.analyses_done = True
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def render_analysis_job_progress(job_id):
+    """Progress and streamed defects of a running analysis; reruns the whole page once it ends"""
+    job = get_job_queue().get(job_id)
+    if job is None or job.finished:
+        st.rerun()
+    st.progress(job.progress, text=t("analyzing"))
+    st.markdown(f"**{t('defects_found')}:**")
+    for image_number, severity, description in list(job.events):
+        st.markdown(
+            f'<div class="defect-item {severity}-defect">Image {image_number} · {description}</div>',
+            unsafe_allow_html=True
+        )
+    for message in list(job.errors):
+        st.error(message)
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def render_pdf_job_progress(job_id):
+    job = get_job_queue().get(job_id)
+    if job is None or job.finished:
+        st.rerun()
+    st.info(f"⏳ {t('generating_pdf')}")
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def render_transcription_job_progress(job_id):
+    """Transcript so far of a long recording, chunks in recording order; reruns the page once done"""
+    job = get_job_queue().get(job_id)
+    if job is None or job.finished:
+        st.rerun()
+    st.progress(job.progress, text=f"🎧 {t('transcribing')}")
+    partial_text = join_transcripts(text for _, text in sorted(job.events))
+    st.text_area(t("additional_notes"), value=partial_text, height=120, disabled=True)
 
 def render_defect_section_with_audio(defect_type, category_key):
     """Render defect section with audio input option and editing capability"""
@@ -3840,16 +2397,11 @@ def render_defect_section_with_audio(defect_type, category_key):
                             # Translate back to English if needed
                             if st.session_state.ui_language != "English":
                                 try:
-                                    reverse_response = client.chat.completions.create(
-                                        model="gpt-4o-mini",
-                                        messages=[{
-                                            "role": "user",
-                                            "content": f"Translate this quality control defect description to English. Be precise and accurate. Return ONLY the English translation:\n\n{st.session_state.edit_text.strip()}"
-                                        }],
-                                        max_tokens=200,
-                                        temperature=0.1
+                                    english_text = translate_to_english(
+                                        client, st.session_state.edit_text.strip(),
+                                        "Translate this quality control defect description to English. Be precise and accurate.",
+                                        max_tokens=200
                                     )
-                                    english_text = reverse_response.choices[0].message.content.strip()
                                 except Exception as e:
                                     st.warning(f"Translation warning: Using original text. Error: {str(e)}")
                                     english_text = st.session_state.edit_text.strip()
@@ -3910,60 +2462,8 @@ def render_problem_table_ui(which_table="ai"):
     total_cr, total_major, total_minor = calculate_problem_table_totals(problem_data)
     
     # Define problem names based on UI language
-    if st.session_state.ui_language == "Mandarin":
-        problem_names = {
-            'color_variation': '色差',
-            'clean': '清洁',
-            'toe_lasting': '前帮',
-            'heel_angle': '包跟角',
-            'waist': '腰帮',
-            'edge_wrinkle': '包边皱',
-            'lace': '鞋带',
-            'outsole': '大底',
-            'velcro': '魔术贴',
-            'adhesion': '胶着',
-            'buckle': '鞋扣',
-            'midsole_glue': '中底胶',
-            'tongue': '鞋舌',
-            'grinding_high': '打磨高',
-            'back_strap_length': '后带长',
-            'heel': '鞋跟',
-            'back_strap_attachment': '后带固',
-            'toplift': '大皮',
-            'damage_upper': '鞋面损',
-            'bottom_gapping': '底开胶',
-            'xray_wrinkle': '鞋面皱',
-            'stains': '溢胶',
-            'thread_ends': '线头'
-        }
-        total_text = "总缺陷数:"
-    else:
-        problem_names = {
-            'color_variation': 'Color Variation',
-            'clean': 'Clean',
-            'toe_lasting': 'Toe Lasting',
-            'heel_angle': 'Heel Angle',
-            'waist': 'Waist',
-            'edge_wrinkle': 'Edge Wrinkle',
-            'lace': 'Lace',
-            'outsole': 'Outsole',
-            'velcro': 'Velcro',
-            'adhesion': 'Adhesion',
-            'buckle': 'Buckle',
-            'midsole_glue': 'Midsole Glue',
-            'tongue': 'Tongue',
-            'grinding_high': 'Grinding High',
-            'back_strap_length': 'Back strap Length',
-            'heel': 'Heel',
-            'back_strap_attachment': 'Back strap attachment',
-            'toplift': 'Toplift',
-            'damage_upper': 'Damage upper',
-            'bottom_gapping': 'Bottom Gapping',
-            'xray_wrinkle': 'X-RAY',
-            'stains': 'Stains',
-            'thread_ends': 'Thread ends'
-        }
-        total_text = "Total:"
+    problem_names = PROBLEM_NAMES[st.session_state.ui_language]
+    total_text = "总缺陷数:" if st.session_state.ui_language == "Mandarin" else "Total:"
     
     # Create a COMPLETE HTML table as a single string
     table_html = f'''<div class="scrollable-table">
@@ -4101,6 +2601,41 @@ with st.sidebar:
         label_visibility="collapsed"
     )
 
+with st.sidebar:
+    st.markdown("---")
+    st.markdown("### 🔬 Analysis Mode")
+    st.session_state.analysis_mode = st.selectbox(
+        "Analysis Mode",
+        list(ANALYSIS_MODES.keys()),
+        index=list(ANALYSIS_MODES.keys()).index(st.session_state.analysis_mode),
+        format_func=lambda x: ANALYSIS_MODES[x],
+        key="analysis_mode_select",
+        label_visibility="collapsed",
+        help="Single multi-image request sends all four photos in one call and lets the model merge defects seen from two angles"
+    )
+
+# Inspections started from this session; they keep running in the background, so several can be queued
+with st.sidebar:
+    if st.session_state.inspection_jobs:
+        st.markdown("---")
+        st.markdown("### 🗂️ Inspections")
+        job_status_labels = {"queued": "⏳ Queued", "running": "🔄 Running", "done": "✅ Done", "error": "❌ Failed"}
+        for job_id in reversed(st.session_state.inspection_jobs):
+            job = get_job_queue().get(job_id)
+            if job is None:
+                continue
+            job_order = job.meta["order_info"]
+            job_col1, job_col2 = st.columns([3, 1])
+            with job_col1:
+                st.caption(f"{job_order['contract_number']} · {job_order['style_number']} · {job_order['color']}  \n"
+                           f"{job_status_labels[job.status]}")
+            with job_col2:
+                if job.status == "done" and job_id != st.session_state.get('inspection_id'):
+                    if st.button("Open", key=f"open_job_{job_id}"):
+                        st.session_state.analysis_job_id = job_id
+                        st.query_params["inspection"] = job_id
+                        st.rerun()
+
 if ui_lang != st.session_state.ui_language:
     st.session_state.ui_language = ui_lang
     st.rerun()
@@ -4117,50 +2652,6 @@ with st.sidebar:
     st.markdown("---")
     st.markdown("### 📍 Location Selection")
     
-    # Major Chinese cities with Chinese and English names
-    CHINESE_CITIES = {
-        "Guangzhou": "广东",
-        "Shenzhen": "深圳",
-        "Dongguan": "东莞",
-        "Foshan": "佛山",
-        "Zhongshan": "中山",
-        "Huizhou": "惠州",
-        "Zhuhai": "珠海",
-        "Jiangmen": "江门",
-        "Zhaoqing": "肇庆",
-        "Shanghai": "上海",
-        "Beijing": "北京",
-        "Suzhou": "苏州",
-        "Hangzhou": "杭州",
-        "Ningbo": "宁波",
-        "Wenzhou": "温州",
-        "Wuhan": "武汉",
-        "Chengdu": "成都",
-        "Chongqing": "重庆",
-        "Tianjin": "天津",
-        "Nanjing": "南京",
-        "Xi'an": "西安",
-        "Qingdao": "青岛",
-        "Dalian": "大连",
-        "Shenyang": "沈阳",
-        "Changsha": "长沙",
-        "Zhengzhou": "郑州",
-        "Jinan": "济南",
-        "Harbin": "哈尔滨",
-        "Changchun": "长春",
-        "Taiyuan": "太原",
-        "Shijiazhuang": "石家庄",
-        "Lanzhou": "兰州",
-        "Xiamen": "厦门",
-        "Fuzhou": "福州",
-        "Nanning": "南宁",
-        "Kunming": "昆明",
-        "Guiyang": "贵阳",
-        "Haikou": "海口",
-        "Ürümqi": "乌鲁木齐",
-        "Lhasa": "拉萨"
-    }
-    
     # Initialize session state for selected city
     if 'selected_city' not in st.session_state:
         st.session_state.selected_city = "Guangzhou"  # Default city
@@ -4232,66 +2723,21 @@ uploaded_files = st.file_uploader(t("upload_images"), type=['png','jpg','jpeg'],
 
 uploaded_images = []
 
+if not uploaded_files and st.session_state.uploader_file_ids:
+    # The inspector cleared the uploader, so its photos are released (photos restored from a
+    # reopened inspection never came through this uploader and stay)
+    reset_inspection_images()
+st.session_state.uploader_file_ids = [file.file_id for file in uploaded_files or []]
+
 if uploaded_files and len(uploaded_files) == 4:
     cols = st.columns(4)
-    for idx, file in enumerate(uploaded_files):
-        uploaded_images.append(file)
+    for idx, entry in enumerate(sync_inspection_images(uploaded_files)):
+        uploaded_images.append(entry)
         with cols[idx]:
-            st.image(Image.open(file), caption=f"Image {idx + 1}", use_container_width=True)
+            st.image(entry['preview'], caption=f"Image {idx + 1}", use_container_width=True)
 
 if len(uploaded_images) == 4:
     if st.button(f"{t('start_inspection')}", type="primary", use_container_width=True):
-        progress = st.progress(0)
-        analyses = []
-        all_defect_coordinates = {}
-        
-        # Store uploaded images for later cropping
-        st.session_state.uploaded_images_data = []
-        for file in uploaded_images:
-            image = Image.open(file)
-            st.session_state.uploaded_images_data.append(image)
-        
-        # Reset AI problem table
-        for key in st.session_state.problem_defects_ai:
-            st.session_state.problem_defects_ai[key] = {'cr': 0, 'major': 0, 'minor': 0}
-        
-        with st.spinner(t("analyzing")):
-            for idx, file in enumerate(uploaded_images):
-                image = Image.open(file)
-                analysis, defect_coordinates = analyze_shoe_image_with_locations(
-                    client, image, idx + 1, style_number, color, contract_number
-                )
-                analyses.append(analysis)
-                all_defect_coordinates.update(defect_coordinates)
-                progress.progress((idx + 1) / 4)
-        
-        # Crop and store defect images
-        st.session_state.defect_images = {}
-        for defect_desc, coords in all_defect_coordinates.items():
-            # Find which image contains this defect
-            for img_idx, analysis in enumerate(analyses):
-                if analysis:
-                    all_defects = (analysis.get('critical_defects', []) + 
-                                 analysis.get('major_defects', []) + 
-                                 analysis.get('minor_defects', []))
-                    
-                    # Check if this defect exists in current image analysis
-                    clean_defect = defect_desc
-                    if clean_defect in all_defects:
-                        original_image = st.session_state.uploaded_images_data[img_idx]
-                        cropped_image = crop_defect_area(original_image, coords)
-                        
-                        if cropped_image:
-                            # Create a unique ID for this defect
-                            defect_id = f"defect_{hash(defect_desc)}_{img_idx}"
-                            category = get_defect_category(clean_defect, analysis)
-                            st.session_state.defect_images[defect_id] = {
-                                'image_buffer': save_image_to_buffer(cropped_image),
-                                'description': clean_defect,
-                                'category': category
-                            }
-                        break
-        
         order_info = {
             "contract_number": contract_number,
             "factory": factory,
@@ -4303,21 +2749,70 @@ if len(uploaded_images) == 4:
             "inspection_date": inspection_date.strftime("%Y-%m-%d")
         }
         
-        ai_report = generate_qc_report(analyses)
-        
-        st.session_state.ai_report = ai_report
-        st.session_state.order_info = order_info
-        st.session_state.defect_coordinates = all_defect_coordinates
-        st.session_state.qc_notes_english = ''
-        st.session_state.analyses_done = True
+        # Runs in the background; the job keeps the photos so its results can be opened later
+        inspection_id = uuid.uuid4().hex[:12]
+        analysis_mode = st.session_state.analysis_mode
+        get_job_queue().submit(
+            inspection_id, "analysis", run_analysis_job,
+            [load_inspection_image(idx) for idx in range(len(uploaded_images))],
+            style_number, color, contract_number, order_qty, analysis_mode,
+            meta={
+                "order_info": order_info,
+                "analysis_mode": analysis_mode,
+                "inspection_images": list(st.session_state.inspection_images)
+            }
+        )
+        st.session_state.analysis_job_id = inspection_id
+        st.session_state.inspection_jobs.append(inspection_id)
+        st.query_params["inspection"] = inspection_id
         st.rerun()
 
+analysis_job_id = st.session_state.analysis_job_id
+if analysis_job_id:
+    analysis_job = get_job_queue().get(analysis_job_id)
+    if analysis_job is None:
+        st.session_state.analysis_job_id = None
+        st.warning("This inspection is no longer available on the server; please start it again.")
+    elif not analysis_job.finished:
+        render_analysis_job_progress(analysis_job_id)
+    else:
+        st.session_state.analysis_job_id = None
+        if analysis_job.status == "done":
+            apply_analysis_job(analysis_job)
+            st.rerun()
+        analysis_job.meta.pop("inspection_images", None)
+        st.error(f"Analysis failed: {analysis_job.error}")
+
 if 'analyses_done' in st.session_state and st.session_state.analyses_done:
     ai_report = st.session_state.ai_report
     order_info = st.session_state.order_info
     
     st.markdown(f"## {t('ai_results')}")
     
+    # One batched translation request for everything the results page shows
+    prefetch_defect_translations(st.session_state.ui_language, [st.session_state.qc_notes_english])
+    
+    cache_summary = st.session_state.get('analysis_cache_summary')
+    if cache_summary:
+        cache_totals = get_analysis_cache().stats()
+        st.caption(
+            f"Analysis cache: {cache_summary['hits']} hit(s), {cache_summary['misses']} miss(es) this inspection "
+            f"| process total {cache_totals['hits']} hits / {cache_totals['misses']} misses, "
+            f"{cache_totals['entries']} entries ({cache_totals['bytes'] / (1024 * 1024):.1f} MB)"
+        )
+    
+    reverse_stats = get_reverse_translation_stats()
+    if reverse_stats:
+        st.caption(
+            f"Reverse translations: {reverse_stats.get('skipped_english', 0)} skipped (input already English), "
+            f"{reverse_stats.get('translated_mandarin', 0) + reverse_stats.get('translated_mixed', 0)} sent "
+            f"({reverse_stats.get('translated_mixed', 0)} mixed-script)"
+        )
+    
+    if st.session_state.analysis_benchmarks:
+        with st.expander("Analysis benchmark", expanded=False):
+            st.table(st.session_state.analysis_benchmarks)
+    
     ai_critical_ids, ai_critical_translated = get_translated_defects('ai_critical', st.session_state.ui_language)
     ai_major_ids, ai_major_translated = get_translated_defects('ai_major', st.session_state.ui_language)
     ai_minor_ids, ai_minor_translated = get_translated_defects('ai_minor', st.session_state.ui_language)
@@ -4356,6 +2851,15 @@ if 'analyses_done' in st.session_state and st.session_state.analyses_done:
         
         if not (ai_critical_translated or ai_major_translated or ai_minor_translated):
             st.success(f"{t('no_defects')}")
+        
+        if st.session_state.defect_crop_index and st.toggle(t('show_defect_crops'), key="show_defect_crops"):
+            crop_columns = st.columns(4)
+            for position, (defect_id, entry) in enumerate(st.session_state.defect_crop_index.items()):
+                crop_bytes = get_defect_crop(defect_id)
+                if crop_bytes:
+                    with crop_columns[position % 4]:
+                        st.image(crop_bytes, caption=f"Image {entry['image_index'] + 1} · {t(entry['category'])}",
+                                 use_container_width=True)
     
     st.markdown("---")
     
@@ -4400,7 +2904,7 @@ if 'analyses_done' in st.session_state and st.session_state.analyses_done:
     
     st.markdown("---")
     
-    final_result, final_reason = calculate_final_decision()
+    final_result, final_reason = calculate_final_decision(inspection_state_from_session())
     
     st.markdown(f"## {t('final_summary')}")
     
@@ -4460,25 +2964,50 @@ if 'analyses_done' in st.session_state and st.session_state.analyses_done:
     st.markdown(f"## {t('generate_pdf')}")
     st.info(f"{t('pdf_language_info')} {LANGUAGES[st.session_state.pdf_language]['flag']} {LANGUAGES[st.session_state.pdf_language]['label']}")
     
-    if st.button(f"{t('generate_pdf')}", type="primary", use_container_width=True):
-        with st.spinner(t("generating_pdf")):
-            pdf_bytes = generate_multilingual_pdf(
-                order_info, 
-                st.session_state.pdf_language
-            )
-        
-        if pdf_bytes:
-            lang_suffix = st.session_state.pdf_language[:2].upper()
-            filename = f"QC_Report_{contract_number}_{style_number}_{lang_suffix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-            st.download_button(
-                label=f"⬇️ {t('download_pdf')}",
-                data=pdf_bytes,
-                file_name=filename,
-                mime="application/pdf",
-                type="primary",
-                use_container_width=True
-            )
+    pdf_col1, pdf_col2 = st.columns(2)
+    with pdf_col1:
+        generate_one = st.button(f"{t('generate_pdf')}", type="primary", use_container_width=True)
+    with pdf_col2:
+        generate_all = st.button(f"{t('generate_all_pdfs')}", use_container_width=True)
+    
+    if generate_one or generate_all:
+        pdf_languages = PDF_LANGUAGES if generate_all else [st.session_state.pdf_language]
+        # A snapshot, so edits made while the PDF builds in the background do not race with it. The
+        # job ID carries the snapshot's digest: a build of older content is not reused for new edits
+        pdf_inspection = copy.deepcopy(inspection_state_from_session())
+        pdf_digest = report_digest(order_info, pdf_inspection, '+'.join(pdf_languages))
+        pdf_job = get_job_queue().submit(
+            f"{st.session_state.get('inspection_id', 'session')}:pdf:{pdf_digest}", "pdf",
+            run_pdf_job, order_info, pdf_languages, pdf_inspection
+        )
+        st.session_state.pdf_job_id = pdf_job.id
+    
+    pdf_job = get_job_queue().get(st.session_state.pdf_job_id) if st.session_state.pdf_job_id else None
+    if pdf_job and not pdf_job.finished:
+        render_pdf_job_progress(pdf_job.id)
+    elif pdf_job and pdf_job.status == "done":
+        generated_at = datetime.fromtimestamp(pdf_job.finished_at).strftime('%Y%m%d_%H%M%S')
+        try:
+            for language, pdf_path in pdf_job.result.items():
+                lang_suffix = language[:2].upper()
+                filename = f"QC_Report_{contract_number}_{style_number}_{lang_suffix}_{generated_at}.pdf"
+                # The job only holds the cached file's path; the button reads it from disk
+                with open(pdf_path, "rb") as pdf_file:
+                    st.download_button(
+                        label=f"⬇️ {t('download_pdf')} · {LANGUAGES[language]['flag']} {LANGUAGES[language]['label']}",
+                        data=pdf_file,
+                        file_name=filename,
+                        mime="application/pdf",
+                        type="primary",
+                        use_container_width=True,
+                        key=f"download_pdf_{language}"
+                    )
             st.success(f"✅ {t('pdf_ready')}")
-        else:
-            st.error(f"❌ {t('pdf_failed')}")
+        except FileNotFoundError:
+            # Evicted from the PDF cache since it was built
+            st.session_state.pdf_job_id = None
+            st.warning("This PDF has expired; please generate it again.")
+    elif pdf_job:
+        st.error(f"❌ {t('pdf_failed')}")
+        st.error(f"PDF Error: {pdf_job.error}")
 # Add at the very end, before the last line
@@ -0,0 +1,323 @@
+"""
+Audio preparation and chunked transcription for Whisper. The signal processing is numpy only.
+
+The mic recorder hands over 44.1/48 kHz stereo PCM with seconds of silence before and after the
+speech. Whisper works at 16 kHz mono anyway, so the clip is decoded, downmixed, resampled, trimmed
+to the speech and re-encoded as 16-bit mono WAV before upload, which is a fraction of the size.
+Clips with no speech at all are caught here instead of costing a transcription call.
+
+Long notes are split at pauses into bounded chunks that are transcribed concurrently and stitched
+back together in order. speech_to_text turns a recording into both the inspector's UI-language text
+and the canonical English text with one transcription and at most one translation request.
+"""
+import hashlib
+import io
+import os
+import struct
+import wave
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+
+from qc_core import (
+    QC_CACHE_DIR, PersistentLRUCache, openai_request, process_singleton, store_translation, translate_to_languages
+)
+
+WHISPER_SAMPLE_RATE = 16000
+AUDIO_FRAME_SECONDS = 0.02
+# Frames quieter than this (dBFS) are always silence, however quiet the room is
+AUDIO_SILENCE_DB = float(os.getenv("AUDIO_SILENCE_DB", "-45"))
+# Speech must stand this far above the room's noise floor
+AUDIO_SPEECH_MARGIN_DB = float(os.getenv("AUDIO_SPEECH_MARGIN_DB", "10"))
+AUDIO_MIN_SPEECH_SECONDS = float(os.getenv("AUDIO_MIN_SPEECH_SECONDS", "0.3"))
+AUDIO_TRIM_PADDING_SECONDS = float(os.getenv("AUDIO_TRIM_PADDING_SECONDS", "0.25"))
+# Notes longer than this are transcribed in chunks of at most AUDIO_CHUNK_MAX_SECONDS, in parallel
+AUDIO_LONG_FORM_SECONDS = float(os.getenv("AUDIO_LONG_FORM_SECONDS", "45"))
+AUDIO_CHUNK_MAX_SECONDS = float(os.getenv("AUDIO_CHUNK_MAX_SECONDS", "30"))
+# No chunk is cut shorter than this; Whisper rejects audio under 0.1 s
+AUDIO_CHUNK_MIN_SECONDS = float(os.getenv("AUDIO_CHUNK_MIN_SECONDS", "1.0"))
+AUDIO_TRANSCRIBE_CONCURRENCY = int(os.getenv("AUDIO_TRANSCRIBE_CONCURRENCY", "4"))
+TRANSCRIPT_CACHE_MAX_MB = float(os.getenv("TRANSCRIPT_CACHE_MAX_MB", "10"))
+
+# verbose_json reports the language as a lower-case name; older responses used ISO codes
+WHISPER_LANGUAGES = {
+    "en": "English",
+    "english": "English",
+    "zh": "Mandarin",
+    "cmn": "Mandarin",
+    "chinese": "Mandarin",
+    "mandarin": "Mandarin"
+}
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+def decode_wav(data):
+    """
+    Decode a RIFF/WAVE file into (samples, sample_rate) with float32 samples in [-1, 1] shaped
+    (frames, channels). Handles 8/16/24/32-bit PCM and 32/64-bit float. Raises ValueError otherwise.
+    """
+    if len(data) < 12 or data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+        raise ValueError("Not a WAV file")
+
+    fmt = None
+    pcm = None
+    offset = 12
+    while offset + 8 <= len(data):
+        chunk_id, chunk_size = struct.unpack_from("<4sI", data, offset)
+        body = data[offset + 8:offset + 8 + chunk_size]
+        if chunk_id == b"fmt ":
+            fmt = struct.unpack_from("<HHIIHH", body)
+            if fmt[0] == WAVE_FORMAT_EXTENSIBLE and len(body) >= 26:
+                # The real format code is the first two bytes of the sub-format GUID
+                fmt = (struct.unpack_from("<H", body, 24)[0],) + fmt[1:]
+        elif chunk_id == b"data":
+            pcm = body
+        offset += 8 + chunk_size + (chunk_size & 1)
+    if fmt is None or pcm is None:
+        raise ValueError("WAV file has no fmt or data chunk")
+
+    format_code, channels, sample_rate, _, _, bits = fmt
+    width = bits // 8
+    if channels < 1 or width < 1:
+        raise ValueError("Invalid WAV header")
+    pcm = pcm[:len(pcm) - len(pcm) % (width * channels)]
+
+    if format_code == WAVE_FORMAT_IEEE_FLOAT and bits in (32, 64):
+        samples = np.frombuffer(pcm, dtype=f"<f{width}").astype(np.float32)
+    elif format_code == WAVE_FORMAT_PCM and bits == 8:
+        samples = (np.frombuffer(pcm, dtype=np.uint8).astype(np.float32) - 128) / 128
+    elif format_code == WAVE_FORMAT_PCM and bits in (16, 32):
+        samples = np.frombuffer(pcm, dtype=f"<i{width}").astype(np.float32) / 2 ** (bits - 1)
+    elif format_code == WAVE_FORMAT_PCM and bits == 24:
+        raw = np.frombuffer(pcm, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        values = raw[:, 0] | (raw[:, 1] << 8) | (raw[:, 2] << 16)
+        samples = (np.where(values >= 1 << 23, values - (1 << 24), values) / 2 ** 23).astype(np.float32)
+    else:
+        raise ValueError(f"Unsupported WAV encoding (format {format_code}, {bits}-bit)")
+    return samples.reshape(-1, channels), sample_rate
+
+def encode_wav(samples, sample_rate=WHISPER_SAMPLE_RATE):
+    """Encode mono float samples as a 16-bit PCM WAV file"""
+    pcm = (np.clip(samples, -1, 1) * 32767).astype("<i2")
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(pcm.tobytes())
+    return buffer.getvalue()
+
+def downmix(samples):
+    return samples.mean(axis=1) if samples.ndim == 2 else samples
+
+def resample(samples, source_rate, target_rate=WHISPER_SAMPLE_RATE):
+    """
+    Resample mono samples. Downsampling first low-passes with a windowed-sinc filter below the new
+    Nyquist frequency, so consonant energy above 8 kHz does not fold back into the speech band.
+    """
+    if source_rate == target_rate or len(samples) == 0:
+        return samples.astype(np.float32)
+    if target_rate < source_rate:
+        cutoff = 0.9 * (target_rate / 2) / source_rate  # In cycles per source sample
+        taps = np.arange(-32, 33)
+        kernel = 2 * cutoff * np.sinc(2 * cutoff * taps) * np.hamming(len(taps))
+        samples = np.convolve(samples, kernel / kernel.sum(), mode="same")
+    target_length = int(round(len(samples) * target_rate / source_rate))
+    positions = np.arange(target_length) * (source_rate / target_rate)
+    return np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+
+def frame_levels(samples, sample_rate, frame_seconds=AUDIO_FRAME_SECONDS):
+    """RMS level of each consecutive frame, in dBFS"""
+    frame_length = max(1, int(sample_rate * frame_seconds))
+    frame_count = len(samples) // frame_length
+    if frame_count == 0:
+        return np.empty(0, dtype=np.float32)
+    frames = samples[:frame_count * frame_length].reshape(frame_count, frame_length)
+    rms = np.sqrt(np.mean(np.square(frames, dtype=np.float64), axis=1))
+    return (20 * np.log10(rms + 1e-10)).astype(np.float32)
+
+def speech_frames(levels):
+    """
+    Mark the frames that carry speech: louder than AUDIO_SILENCE_DB and at least
+    AUDIO_SPEECH_MARGIN_DB above the noise floor (the 10th percentile frame). Steady noise with
+    nothing on top of it, like a fan or a hiss, has no frames that qualify.
+    """
+    if len(levels) == 0:
+        return np.zeros(0, dtype=bool)
+    noise_floor = np.percentile(levels, 10)
+    threshold = max(AUDIO_SILENCE_DB, noise_floor + AUDIO_SPEECH_MARGIN_DB)
+    return levels > threshold
+
+def prepare_audio(data):
+    """
+    Turn a recorded WAV into what Whisper needs. Returns a dict with:
+      wav: 16 kHz mono 16-bit WAV bytes, trimmed to the speech (b"" when silent)
+      samples: the same audio as float32 samples, for callers that split it further
+      seconds / original_seconds: duration after and before trimming
+      speech: False when the clip holds no speech and should not be transcribed
+    Raises ValueError when data is not a WAV file this module can decode.
+    """
+    samples, sample_rate = decode_wav(data)
+    original_seconds = len(samples) / sample_rate
+    samples = resample(downmix(samples), sample_rate)
+
+    frame_length = int(WHISPER_SAMPLE_RATE * AUDIO_FRAME_SECONDS)
+    voiced = speech_frames(frame_levels(samples, WHISPER_SAMPLE_RATE))
+    if voiced.sum() * AUDIO_FRAME_SECONDS < AUDIO_MIN_SPEECH_SECONDS:
+        return {"wav": b"", "samples": samples[:0], "seconds": 0.0, "original_seconds": original_seconds,
+                "speech": False}
+
+    voiced_indexes = np.flatnonzero(voiced)
+    padding = int(AUDIO_TRIM_PADDING_SECONDS * WHISPER_SAMPLE_RATE)
+    start = max(0, voiced_indexes[0] * frame_length - padding)
+    end = min(len(samples), (voiced_indexes[-1] + 1) * frame_length + padding)
+    samples = samples[start:end]
+    return {
+        "wav": encode_wav(samples),
+        "samples": samples,
+        "seconds": len(samples) / WHISPER_SAMPLE_RATE,
+        "original_seconds": original_seconds,
+        "speech": True
+    }
+
+def split_at_silence(samples, max_seconds=AUDIO_CHUNK_MAX_SECONDS, sample_rate=WHISPER_SAMPLE_RATE,
+                     min_seconds=AUDIO_CHUNK_MIN_SECONDS):
+    """
+    Split a long recording into chunks of at most max_seconds. Each cut goes at the quietest
+    moment (100 ms average) in the second half of the allowed span, which in speech is a pause
+    between words, so no word is cut in two. Cuts leave at least min_seconds for the last chunk.
+    """
+    frame_length = int(sample_rate * AUDIO_FRAME_SECONDS)
+    max_frames = max(2, int(max_seconds / AUDIO_FRAME_SECONDS))
+    min_frames = min(int(np.ceil(min_seconds / AUDIO_FRAME_SECONDS)), max_frames // 2)
+    levels = frame_levels(samples, sample_rate)
+    smoothed = np.convolve(levels, np.ones(5) / 5, mode="same") if len(levels) >= 5 else levels
+
+    chunks = []
+    start = 0
+    while len(levels) - start > max_frames:
+        search_from = start + max_frames // 2
+        search_to = max(search_from + 1, min(start + max_frames, len(levels) - min_frames))
+        cut = search_from + int(np.argmin(smoothed[search_from:search_to]))
+        chunks.append(samples[start * frame_length:cut * frame_length])
+        start = cut
+    chunks.append(samples[start * frame_length:])
+    return chunks
+
+def join_transcripts(texts, language=None):
+    """Stitch chunk transcripts back together; Chinese text is joined without spaces"""
+    separator = "" if whisper_language_name(language) == "Mandarin" else " "
+    return separator.join(text.strip() for text in texts if text and text.strip())
+
+def transcribe_chunks(client, chunks, on_chunk=None, max_workers=AUDIO_TRANSCRIBE_CONCURRENCY):
+    """
+    Transcribe audio chunks with Whisper concurrently. on_chunk(index, text) is called as each
+    chunk finishes, in completion order. Returns {"text": ..., "language": ..., "chunks": [...]}
+    with the text stitched in recording order and the language Whisper heard for most of the audio.
+    """
+    def transcribe(index):
+        audio_file = io.BytesIO(encode_wav(chunks[index]))
+        audio_file.name = f"chunk_{index}.wav"
+        response = openai_request(
+            client.audio.transcriptions.create,
+            model="whisper-1",
+            file=audio_file,
+            response_format="verbose_json"
+        )
+        return response.text, response.language
+
+    texts = [""] * len(chunks)
+    language_seconds = Counter()
+    with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="qc-whisper") as executor:
+        futures = {executor.submit(transcribe, index): index for index in range(len(chunks))}
+        for future in as_completed(futures):
+            index = futures[future]
+            texts[index], language = future.result()
+            language_seconds[language] += len(chunks[index])
+            if on_chunk:
+                on_chunk(index, texts[index])
+
+    language = language_seconds.most_common(1)[0][0] if language_seconds else None
+    return {"text": join_transcripts(texts, language), "language": language, "chunks": texts}
+
+def transcribe_wav(client, wav):
+    """One Whisper call for a whole recording; returns {"text": ..., "language": ...}"""
+    audio_file = io.BytesIO(wav)
+    audio_file.name = "recording.wav"
+    response = openai_request(
+        client.audio.transcriptions.create,
+        model="whisper-1",
+        file=audio_file,
+        response_format="verbose_json"
+    )
+    return {"text": response.text, "language": response.language}
+
+def whisper_language_name(language):
+    """Map Whisper's language (a name like "chinese" in verbose_json, or a code) to a UI language"""
+    language = (language or "").strip().lower()
+    return WHISPER_LANGUAGES.get(language, language.title() or None)
+
+@process_singleton
+def get_transcript_cache():
+    return PersistentLRUCache(
+        os.path.join(QC_CACHE_DIR, "transcripts.sqlite3"),
+        int(TRANSCRIPT_CACHE_MAX_MB * 1024 * 1024),
+        memory_entries=200
+    )
+
+def localize_transcript(client, text, heard_language, ui_language, english=None):
+    """
+    Produce the UI-language text shown to the inspector and the canonical English text that is
+    stored, with at most one translation request for whichever of the two the speaker did not
+    already say (or was not already translated, when english is given). The English -> UI pair
+    is added to the translation cache, so showing the stored English later in the UI language
+    costs nothing. Returns {"text", "english", "complete"}; when translation fails, english is
+    None (the caller translates the submitted text itself) and complete is False.
+    """
+    known = {heard_language: text}
+    if english:
+        known["English"] = english
+    targets = [language for language in dict.fromkeys(["English", ui_language]) if language not in known]
+    translations, resolved = translate_to_languages(client, text, targets) if targets else ({}, set())
+    translations = {**known, **translations}
+    complete = resolved.issuperset(targets)
+    english = translations["English"] if "English" in known or "English" in resolved else None
+    ui_text = translations.get(ui_language, text)
+    if complete and ui_language != "English" and english != ui_text:
+        store_translation(english, ui_language, ui_text)
+    return {"text": ui_text, "english": english, "complete": complete}
+
+def speech_to_text(client, wav, ui_language, chunks=None, on_chunk=None):
+    """
+    The whole speech-to-defect path: one transcription (chunked and parallel when chunks are
+    given) plus at most one translation. Results are cached by audio hash, and the transcript is
+    shared between UI languages; a localization whose translation failed is not cached. Returns
+    {"text": UI-language text, "english": canonical English or None, "language": what Whisper
+    heard, "from_cache": bool}.
+    """
+    cache = get_transcript_cache()
+    key = hashlib.sha256(wav).hexdigest()
+    entry = cache.get(key)
+    from_cache = entry is not None and ui_language in entry["localized"]
+    if from_cache:
+        localized = entry["localized"][ui_language]
+    else:
+        changed = entry is None
+        if entry is None:
+            transcript = transcribe_chunks(client, chunks, on_chunk) if chunks else transcribe_wav(client, wav)
+            entry = {"text": transcript["text"], "language": transcript["language"], "localized": {}}
+        # Another UI language may already have paid for the English
+        known_english = next((localized["english"] for localized in entry["localized"].values()), None)
+        localized = localize_transcript(client, entry["text"], whisper_language_name(entry["language"]),
+                                        ui_language, known_english)
+        if localized.pop("complete"):
+            # Cached values are shared, so build a new entry instead of updating the one returned
+            entry = {**entry, "localized": {**entry["localized"], ui_language: localized}}
+            changed = True
+        if changed:
+            cache.set(key, entry)
+    return {"text": localized["text"], "english": localized["english"], "language": entry["language"],
+            "from_cache": from_cache}
@@ -0,0 +1,219 @@
+"""
+Headless batch inspection: run the AI inspection over a manifest of lots and write, per lot,
+the PDF report(s) and a JSON summary.
+
+    python qc_batch.py lots.csv --output-dir reports --workers 4 --language English --language Mandarin
+
+The manifest is either a CSV with the columns contract_number, style_number, color, order_qty and
+image_1 .. image_4, or a JSON list of objects with the same fields and "images": [four paths].
+factory, customer, inspector, inspection_date and lot_id are optional. Relative image paths are
+resolved against the manifest's directory. Lot IDs (by default contract_style_color) name the
+output files, so they must be unique within a manifest.
+
+The QC lists start as copies of the AI ones, as in the app. The app's QC problem table starts
+empty and is filled in by the QC manager; with no manager in the loop, batch runs instead copy the
+AI problem table into it, so the decision reflects what the AI found.
+"""
+import argparse
+import copy
+import csv
+import json
+import logging
+import os
+import re
+import shutil
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+from PIL import Image, ImageOps
+
+from qc_core import (
+    InspectionState, calculate_final_decision, create_openai_client, run_inspection_analysis,
+    update_ai_problem_table
+)
+from qc_pdf import PDF_LANGUAGES, generate_all_language_pdfs
+
+logger = logging.getLogger("qc_batch")
+
+REQUIRED_FIELDS = ["contract_number", "style_number", "color", "order_qty"]
+OPTIONAL_FIELDS = ["factory", "customer", "inspector", "inspection_date"]
+IMAGES_PER_LOT = 4
+
+def load_manifest(path):
+    """Read a CSV or JSON manifest into a list of lot dicts with absolute image paths"""
+    base_dir = os.path.dirname(os.path.abspath(path))
+    with open(path, encoding="utf-8-sig") as manifest_file:
+        if path.lower().endswith(".json"):
+            rows = json.load(manifest_file)
+            if isinstance(rows, dict):
+                rows = rows.get("lots", [])
+        else:
+            rows = list(csv.DictReader(manifest_file))
+
+    lots = []
+    seen_stems = {}
+    for row_number, row in enumerate(rows, 1):
+        missing = [field for field in REQUIRED_FIELDS if not str(row.get(field) or "").strip()]
+        if missing:
+            raise ValueError(f"Lot {row_number}: missing {', '.join(missing)}")
+
+        images = row.get("images") or [row.get(f"image_{idx}") for idx in range(1, IMAGES_PER_LOT + 1)]
+        images = [image for image in images if image and str(image).strip()]
+        if len(images) != IMAGES_PER_LOT:
+            raise ValueError(f"Lot {row_number}: expected {IMAGES_PER_LOT} images, got {len(images)}")
+
+        lot = {field: str(row[field]).strip() for field in REQUIRED_FIELDS}
+        lot.update({field: str(row.get(field) or "").strip() for field in OPTIONAL_FIELDS})
+        lot["lot_id"] = str(row.get("lot_id") or "").strip() or f"{lot['contract_number']}_{lot['style_number']}_{lot['color']}"
+        # Each lot's PDFs and summary are named after its lot ID; a clash would overwrite them
+        stem = safe_file_stem(lot["lot_id"]).casefold()
+        if stem in seen_stems:
+            raise ValueError(f"Lot {row_number}: lot_id {lot['lot_id']!r} clashes with lot {seen_stems[stem]}; "
+                             "give one of them a distinct lot_id")
+        seen_stems[stem] = row_number
+        lot["images"] = [os.path.join(base_dir, str(image).strip()) for image in images]
+        lots.append(lot)
+    return lots
+
+def safe_file_stem(text):
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", text).strip("_") or "lot"
+
+def load_lot_images(paths):
+    """Open and EXIF-orient the lot's photos the same way the app does for uploads"""
+    images = []
+    for path in paths:
+        with Image.open(path) as image:
+            image.load()
+            images.append(ImageOps.exif_transpose(image))
+    return images
+
+def inspect_lot(client, lot, output_dir, languages=("English",), analysis_mode="per_image", city="Guangzhou"):
+    """Analyze one lot, write its PDFs and JSON summary, and return the summary"""
+    started = time.perf_counter()
+    errors = []
+
+    outcome = run_inspection_analysis(
+        client, load_lot_images(lot["images"]), lot["style_number"], lot["color"], lot["contract_number"],
+        lot["order_qty"], analysis_mode, on_error=errors.append
+    )
+    analyses = outcome["analyses"]
+    usage_log = outcome["usage_log"]
+    report = outcome["report"]
+    inspection = InspectionState(order_qty=lot["order_qty"], selected_city=city)
+    update_ai_problem_table(inspection, report)
+    # Headless-only policy: the app leaves this empty for the QC manager (see module docstring)
+    inspection.problem_defects_qc = copy.deepcopy(inspection.problem_defects_ai)
+    final_result, final_reason = calculate_final_decision(inspection)
+
+    order_info = {
+        "contract_number": lot["contract_number"],
+        "factory": lot["factory"],
+        "order_qty": lot["order_qty"],
+        "style_number": lot["style_number"],
+        "color": lot["color"],
+        "customer": lot["customer"],
+        "inspector": lot["inspector"],
+        "inspection_date": lot["inspection_date"] or datetime.now().strftime("%Y-%m-%d")
+    }
+
+    file_stem = safe_file_stem(lot["lot_id"])
+    pdfs = {}
+    for language, cached_path in generate_all_language_pdfs(client, order_info, inspection, languages).items():
+        pdf_path = os.path.join(output_dir, f"QC_Report_{file_stem}_{language[:2].upper()}.pdf")
+        shutil.copyfile(cached_path, pdf_path)
+        pdfs[language] = pdf_path
+
+    failed_images = sum(1 for analysis in analyses if analysis is None)
+    summary = {
+        "lot_id": lot["lot_id"],
+        # A lot with no usable analysis must not read as a clean ACCEPT
+        "status": "error" if failed_images == len(analyses) else "partial" if failed_images else "ok",
+        "order_info": order_info,
+        "analysis_mode": analysis_mode,
+        "result": final_result,
+        "reason": final_reason,
+        "critical_count": report["critical_count"],
+        "major_count": report["major_count"],
+        "minor_count": report["minor_count"],
+        "defects": {
+            "critical": report["critical_defects"],
+            "major": report["major_defects"],
+            "minor": report["minor_defects"]
+        },
+        "problem_table": {key: counts for key, counts in report["problem_table"].items() if any(counts.values())},
+        "images": lot["images"],
+        "failed_images": failed_images,
+        "cached_images": sum(1 for analysis in analyses if analysis and analysis.get("from_cache")),
+        "prompt_tokens": sum(usage["prompt_tokens"] for usage in usage_log),
+        "completion_tokens": sum(usage["completion_tokens"] for usage in usage_log),
+        "errors": errors,
+        "pdfs": pdfs,
+        "seconds": round(time.perf_counter() - started, 2)
+    }
+    write_summary(output_dir, file_stem, summary)
+    return summary
+
+def write_summary(output_dir, file_stem, summary):
+    with open(os.path.join(output_dir, f"{file_stem}.json"), "w", encoding="utf-8") as summary_file:
+        json.dump(summary, summary_file, ensure_ascii=False, indent=2)
+
+def run_batch(client, lots, output_dir, workers=4, languages=("English",), analysis_mode="per_image",
+              city="Guangzhou"):
+    """
+    Inspect lots concurrently with at most `workers` lots in flight. OpenAI traffic from all lots
+    still goes through the shared request scheduler, so its rate limits apply to the whole batch.
+    Returns the per-lot summaries in manifest order; a lot that raises gets status "error".
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    summaries = [None] * len(lots)
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="qc-lot") as executor:
+        futures = {
+            executor.submit(inspect_lot, client, lot, output_dir, languages, analysis_mode, city): idx
+            for idx, lot in enumerate(lots)
+        }
+        for done_count, future in enumerate(as_completed(futures), 1):
+            lot = lots[futures[future]]
+            try:
+                summary = future.result()
+            except Exception as e:
+                logger.exception("Lot %s failed", lot["lot_id"])
+                summary = {"lot_id": lot["lot_id"], "status": "error", "errors": [str(e)], "images": lot["images"]}
+                write_summary(output_dir, safe_file_stem(lot["lot_id"]), summary)
+            summaries[futures[future]] = summary
+            logger.info("[%d/%d] %s: %s %s", done_count, len(lots), lot["lot_id"],
+                        summary["status"], summary.get("result", ""))
+    return summaries
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run AI shoe QC inspections for every lot in a manifest.")
+    parser.add_argument("manifest", help="CSV or JSON manifest of lots")
+    parser.add_argument("--output-dir", default="qc_reports", help="where PDFs and JSON summaries are written")
+    parser.add_argument("--workers", type=int, default=4, help="lots inspected at the same time")
+    parser.add_argument("--language", action="append", choices=PDF_LANGUAGES, dest="languages",
+                        help="PDF language; repeat for several (default: English)")
+    parser.add_argument("--mode", choices=["per_image", "combined"], default=os.getenv("ANALYSIS_MODE", "per_image"),
+                        help="one request per photo, or all four photos in one request")
+    parser.add_argument("--city", default="Guangzhou", help="inspection location shown in the PDF footer")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    client = create_openai_client()
+    if client is None:
+        parser.error("OPENAI_API_KEY is not set")
+
+    try:
+        lots = load_manifest(args.manifest)
+    except (OSError, ValueError) as e:
+        parser.error(f"Could not read manifest: {e}")
+
+    summaries = run_batch(client, lots, args.output_dir, args.workers, args.languages or ["English"],
+                          args.mode, args.city)
+    failed = [summary["lot_id"] for summary in summaries if summary["status"] == "error"]
+    logger.info("%d lot(s) inspected, %d failed", len(summaries), len(failed))
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,257 @@
+"""
+Benchmarks for the report pipeline: AI report, PDF tables and the full PDF over synthetic
+inspections, with OpenAI replaced by a local stub of configurable latency.
+
+    python qc_bench.py                       # run every scenario, compare with the baseline
+    python qc_bench.py --scenario zh-typical --latency-ms 50
+    python qc_bench.py --save-baseline       # record this run as the new baseline
+
+Each scenario runs in a fresh process with its own empty cache directory, so wall times are
+cold-cache numbers. Peak RSS is the child's own high-water mark, reset when the scenario starts
+(Linux; elsewhere it falls back to ru_maxrss). Reported per scenario: wall time
+per stage, peak RSS and PDF size. Exits 1 when a metric regresses past --tolerance.
+"""
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from types import SimpleNamespace
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "qc_bench_baseline.json")
+
+# name -> (language, defects per severity, fault photo containers, photo long edge in px)
+SCENARIOS = {
+    "en-small": ("English", 2, 0, 0),
+    "en-typical": ("English", 6, 8, 2000),
+    "zh-typical": ("Mandarin", 6, 8, 2000),
+    "en-many-defects": ("English", 40, 8, 2000),
+    "zh-many-defects": ("Mandarin", 40, 8, 2000),
+    "en-heavy-photos": ("English", 6, 30, 4000),
+    "zh-heavy-photos": ("Mandarin", 6, 30, 4000),
+}
+
+# Metrics compared with the baseline; lower is better for all of them
+COMPARED_METRICS = ["total_seconds", "peak_rss_mb", "pdf_kb"]
+
+DEFECT_PARTS = ["toe cap", "heel counter", "vamp", "quarter", "outsole", "midsole", "tongue", "collar", "lace eyelet", "side panel"]
+DEFECT_ISSUES = ["light scuff", "adhesive stain", "loose thread", "wrinkle", "bottom gapping", "color variation", "uneven stitching", "scratch", "glue overflow", "crease"]
+
+class FakeCompletions:
+    """Stands in for client.chat.completions: sleeps for the configured latency, then answers"""
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def create(self, **kwargs):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.latency)
+        if kwargs.get("response_format", {}).get("type") == "json_object":
+            items = json.loads(kwargs["messages"][-1]["content"])["items"]
+            content = json.dumps({"translations": {key: f"译{text}" for key, text in items.items()}}, ensure_ascii=False)
+        else:
+            content = "译" + kwargs["messages"][-1]["content"].rsplit("\n\n", 1)[-1]
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=None)
+
+def make_fake_client(latency):
+    return SimpleNamespace(chat=SimpleNamespace(completions=FakeCompletions(latency)))
+
+def make_photo(rng, long_edge):
+    """A camera-like JPEG: smooth colour regions plus sensor-style noise"""
+    import numpy as np
+    from PIL import Image
+    short_edge = long_edge * 3 // 4
+    base = Image.fromarray(rng.integers(0, 255, (12, 16, 3), dtype=np.uint8)).resize((long_edge, short_edge), Image.Resampling.BICUBIC)
+    pixels = np.asarray(base, dtype=np.int16) + rng.integers(-12, 12, (short_edge, long_edge, 3), dtype=np.int16)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels.clip(0, 255).astype(np.uint8)).save(buffer, format="JPEG", quality=92)
+    return buffer.getvalue()
+
+def make_inspection(defects_per_severity, container_count, photo_edge, seed):
+    """Four synthetic per-image analyses and the QC photo containers of one inspection"""
+    import numpy as np
+    rng = random.Random(seed)
+    # The seed is in every text so each scenario starts with nothing in the translation cache
+    defect_texts = [f"{rng.choice(DEFECT_PARTS)} - {rng.choice(DEFECT_ISSUES)} ({seed}-{idx})"
+                    for idx in range(defects_per_severity * 3)]
+    analyses = [{"critical_defects": [], "major_defects": [], "minor_defects": []} for _ in range(4)]
+    for idx, text in enumerate(defect_texts):
+        severity = ["critical", "major", "minor"][idx % 3]
+        analyses[idx % 4][f"{severity}_defects"].append(text)
+
+    photo_rng = np.random.default_rng(rng.getrandbits(64))
+    containers = [
+        {
+            "name": f"{rng.choice(DEFECT_PARTS)} {rng.choice(DEFECT_ISSUES)} {idx}",
+            "severity": ["critical", "major", "minor"][idx % 3],
+            "images": [make_photo(photo_rng, photo_edge)]
+        }
+        for idx in range(container_count)
+    ]
+    return analyses, containers
+
+def reset_peak_rss():
+    """
+    Start this process's peak RSS over from its current RSS. On Linux ru_maxrss carries the
+    parent's high-water mark through fork+exec, so without this a scenario would report the
+    largest footprint of any scenario before it.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+        return True
+    except OSError:
+        return False
+
+def peak_rss_mb():
+    """Peak RSS since reset_peak_rss (VmHWM); ru_maxrss where /proc is not available"""
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def run_scenario(name, analyses, containers, latency, cache_dir):
+    """Run one scenario in this (fresh) process, caching under cache_dir, and return its metrics"""
+    reset_peak_rss()
+    # Set before the first qc_core import, which reads it; this process is the scenario's own
+    os.environ["QC_CACHE_DIR"] = cache_dir
+    from qc_core import InspectionState, generate_qc_report, update_ai_problem_table
+    from qc_pdf import (
+        create_photos_of_faults_table, create_problem_table, create_sampling_table, generate_multilingual_pdf,
+        get_cjk_font, prepare_pdf_artifacts
+    )
+
+    language = SCENARIOS[name][0]
+    client = make_fake_client(latency)
+    order_info = {
+        "contract_number": "BENCH-001", "factory": "Bench Factory", "order_qty": "2000", "style_number": "ST-1",
+        "color": "Black", "customer": "Bench", "inspector": "Bench", "inspection_date": "2025-01-01"
+    }
+    chinese_font = get_cjk_font() if language == "Mandarin" else None
+    timings = {}
+
+    def timed(stage, fn, *args, **kwargs):
+        started = time.perf_counter()
+        result = fn(*args, **kwargs)
+        timings[stage] = round(time.perf_counter() - started, 4)
+        return result
+
+    report = timed("report", generate_qc_report, analyses, order_info["order_qty"])
+    state = InspectionState(order_qty=order_info["order_qty"], qc_defect_containers=containers,
+                            qc_notes_english="Benchmark inspection notes.", selected_city="Shenzhen")
+    update_ai_problem_table(state, report)
+    state.problem_defects_qc = {key: dict(counts) for key, counts in state.problem_defects_ai.items()}
+
+    timed("problem_table", create_problem_table, state.problem_defects_qc, "QC", language, chinese_font)
+    timed("sampling_table", create_sampling_table, state, language, chinese_font)
+    with tempfile.TemporaryDirectory() as output_dir:
+        # The first full build runs with empty translation and photo caches; the second is warm
+        pdf_path = os.path.join(output_dir, "report.pdf")
+        timed("pdf_cold", generate_multilingual_pdf, client, order_info, language, state, None, pdf_path)
+        pdf_size = os.path.getsize(pdf_path)
+        artifacts = timed("artifacts", prepare_pdf_artifacts, client, state, [language])
+        timed("photos_table", create_photos_of_faults_table, state.qc_defect_containers, language, chinese_font,
+              artifacts["translations"].get(language, {}), artifacts["fault_photos"])
+        timed("pdf_warm", generate_multilingual_pdf, client, order_info, language, state, artifacts, pdf_path)
+
+    return {
+        "language": language,
+        "defects": len(report["critical_defects"]) + len(report["major_defects"]) + len(report["minor_defects"]),
+        "containers": len(containers),
+        "photo_mb": round(sum(len(c["images"][0]) for c in containers) / (1024 * 1024), 1),
+        "openai_calls": client.chat.completions.calls,
+        "stages": timings,
+        "total_seconds": round(sum(timings[stage] for stage in ["report", "pdf_cold"]), 4),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "pdf_kb": round(pdf_size / 1024, 1)
+    }
+
+def run_isolated(name, latency):
+    """
+    Run a scenario in its own spawned process with an empty cache directory. The synthetic photos
+    are made here and handed over as JPEG bytes; the child resets its peak RSS when the scenario
+    starts, so only the pipeline's own memory (inputs included) is counted.
+    """
+    _, defects_per_severity, container_count, photo_edge = SCENARIOS[name]
+    analyses, containers = make_inspection(defects_per_severity, container_count, photo_edge, seed=f"{name}-{time.time_ns()}")
+    with tempfile.TemporaryDirectory() as cache_dir:
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+            return executor.submit(run_scenario, name, analyses, containers, latency, cache_dir).result()
+
+def compare(results, baseline, tolerance):
+    """Print each metric against the baseline; return the (scenario, metric) pairs that regressed"""
+    regressions = []
+    print(f"{'scenario':<18} {'metric':<14} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, metrics in results.items():
+        for metric in COMPARED_METRICS:
+            current = metrics[metric]
+            before = baseline.get(name, {}).get(metric)
+            if not before:
+                print(f"{name:<18} {metric:<14} {'-':>10} {current:>10} {'new':>8}")
+                continue
+            change = (current - before) / before
+            flag = " !" if change > tolerance else ""
+            print(f"{name:<18} {metric:<14} {before:>10} {current:>10} {change:>+7.0%}{flag}")
+            if flag:
+                regressions.append((name, metric))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the QC report and PDF pipeline on synthetic inspections.")
+    parser.add_argument("--scenario", action="append", choices=list(SCENARIOS), dest="scenarios",
+                        help="scenario to run; repeat for several (default: all)")
+    parser.add_argument("--latency-ms", type=float, default=300, help="simulated OpenAI response time")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline JSON to compare with or save to")
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression per metric")
+    parser.add_argument("--output", help="also write this run's full results as JSON")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for name in args.scenarios or list(SCENARIOS):
+        results[name] = run_isolated(name, args.latency_ms / 1000)
+        metrics = results[name]
+        stages = " ".join(f"{stage}={seconds:.3f}s" for stage, seconds in metrics["stages"].items())
+        print(f"{name}: {metrics['total_seconds']:.3f}s, {metrics['peak_rss_mb']} MB peak, "
+              f"{metrics['pdf_kb']} KB PDF, {metrics['openai_calls']} OpenAI call(s) | {stages}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(results, output_file, indent=2)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as baseline_file:
+            baseline = json.load(baseline_file).get("scenarios", {})
+
+    if args.save_baseline:
+        baseline.update(results)
+        with open(args.baseline, "w", encoding="utf-8") as baseline_file:
+            json.dump({"latency_ms": args.latency_ms, "scenarios": baseline}, baseline_file, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    print()
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f"{len(regressions)} metric(s) regressed by more than {args.tolerance:.0%}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
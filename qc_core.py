@@ -0,0 +1,1607 @@
+"""
+Streamlit-free core of the AI shoe QC inspector: OpenAI request scheduling, the on-disk caches,
+translation, vision analysis and the AQL report/decision logic.
+
+app.py is the interactive front end over this module; qc_batch.py runs it headless over a
+manifest of lots. Nothing here touches Streamlit, so every function takes its inputs explicitly.
+"""
+import base64
+import functools
+import hashlib
+import io
+import itertools
+import json
+import logging
+import os
+import queue
+import random
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dataclasses import dataclass, field
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+
+import openai
+from dotenv import load_dotenv
+from PIL import Image, ImageOps
+from tenacity import Retrying, retry_if_exception, stop_after_attempt, stop_before_delay, wait_random_exponential
+
+# Settings below are read from the environment at import time
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Problem table row names per language (keys match problem_defects_ai / problem_defects_qc)
+PROBLEM_NAMES = {
+    "English": {
+        'color_variation': 'Color Variation',
+        'clean': 'Clean',
+        'toe_lasting': 'Toe Lasting',
+        'heel_angle': 'Heel Angle',
+        'waist': 'Waist',
+        'edge_wrinkle': 'Edge Wrinkle',
+        'lace': 'Lace',
+        'outsole': 'Outsole',
+        'velcro': 'Velcro',
+        'adhesion': 'Adhesion',
+        'buckle': 'Buckle',
+        'midsole_glue': 'Midsole Glue',
+        'tongue': 'Tongue',
+        'grinding_high': 'Grinding High',
+        'back_strap_length': 'Back strap Length',
+        'heel': 'Heel',
+        'back_strap_attachment': 'Back strap attachment',
+        'toplift': 'Toplift',
+        'damage_upper': 'Damage upper',
+        'bottom_gapping': 'Bottom Gapping',
+        'xray_wrinkle': 'X-RAY',
+        'stains': 'Stains',
+        'thread_ends': 'Thread ends'
+    },
+    "Mandarin": {
+        'color_variation': '色差',
+        'clean': '清洁',
+        'toe_lasting': '前帮',
+        'heel_angle': '包跟角',
+        'waist': '腰帮',
+        'edge_wrinkle': '包边皱',
+        'lace': '鞋带',
+        'outsole': '大底',
+        'velcro': '魔术贴',
+        'adhesion': '胶着',
+        'buckle': '鞋扣',
+        'midsole_glue': '中底胶',
+        'tongue': '鞋舌',
+        'grinding_high': '打磨高',
+        'back_strap_length': '后带长',
+        'heel': '鞋跟',
+        'back_strap_attachment': '后带固',
+        'toplift': '大皮',
+        'damage_upper': '鞋面损',
+        'bottom_gapping': '底开胶',
+        'xray_wrinkle': '鞋面皱',
+        'stains': '溢胶',
+        'thread_ends': '线头'
+    }
+}
+
+# Fixed QC vocabulary resolved locally before any network translation (keys are casefolded)
+QC_GLOSSARY = {
+    "Mandarin": {
+        "accept": "接受",
+        "reject": "拒绝",
+        "rework": "返工",
+        "pass": "通过",
+        "fail": "失败",
+        "all defects within aql 2.5 limits": "所有缺陷在AQL 2.5限制内",
+        "no defects": "无缺陷",
+        **{
+            PROBLEM_NAMES["English"][key].casefold(): PROBLEM_NAMES["Mandarin"][key]
+            for key in PROBLEM_NAMES["English"]
+        }
+    }
+}
+
+# Parameterized decision reasons produced by generate_qc_report / calculate_final_decision
+QC_GLOSSARY_TEMPLATES = [
+    (re.compile(r"^critical defects \((\d+)\) - zero tolerance$"),
+     {"Mandarin": "严重缺陷 ({0}) - 零容忍"}),
+    (re.compile(r"^major defects \((\d+)\) exceed (?:aql )?limit \((\d+)\)$"),
+     {"Mandarin": "主要缺陷 ({0}) 超出AQL限制 ({1})"}),
+    (re.compile(r"^minor defects \((\d+)\) exceed (?:aql )?limit \((\d+)\)$"),
+     {"Mandarin": "次要缺陷 ({0}) 超出AQL限制 ({1})"}),
+]
+
+def lookup_glossary(text, target_language):
+    """Return the glossary translation for standard QC vocabulary, or None"""
+    key = text.strip().casefold()
+    glossary = QC_GLOSSARY.get(target_language, {})
+    if key in glossary:
+        return glossary[key]
+    for pattern, templates in QC_GLOSSARY_TEMPLATES:
+        if target_language in templates:
+            match = pattern.match(key)
+            if match:
+                return templates[target_language].format(*match.groups())
+    return None
+
+def process_singleton(factory):
+    """Build factory() once per process, on first use, even when called from several threads"""
+    lock = threading.Lock()
+    instances = []
+    
+    @functools.wraps(factory)
+    def get():
+        with lock:
+            if not instances:
+                instances.append(factory())
+            return instances[0]
+    
+    def reset(instance=None):
+        """
+        Drop the instance so the next call builds a new one (e.g. after it broke). With instance
+        given, only if that is still the current one, so a replacement is never dropped.
+        """
+        with lock:
+            if instances and (instance is None or instances[0] is instance):
+                instances.clear()
+    get.reset = reset
+    return get
+
+def create_openai_client(api_key=None):
+    """OpenAI client for the scheduler below; returns None when no API key is configured"""
+    api_key = api_key or os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        return None
+    # Retries are handled by the request scheduler, not by the SDK
+    return openai.OpenAI(api_key=api_key, max_retries=0)
+
+# OpenAI request scheduling: per-model rate limits, a process-wide in-flight cap shared by all
+# sessions, jittered exponential backoff that honours Retry-After, and a deadline per call
+OPENAI_MAX_IN_FLIGHT = int(os.getenv("OPENAI_MAX_IN_FLIGHT", "8"))
+OPENAI_MAX_ATTEMPTS = int(os.getenv("OPENAI_MAX_ATTEMPTS", "5"))
+OPENAI_CALL_DEADLINE = float(os.getenv("OPENAI_CALL_DEADLINE", "120"))
+OPENAI_DEFAULT_RPM = 60
+OPENAI_REQUESTS_PER_MINUTE = {
+    "gpt-4o": int(os.getenv("OPENAI_RPM_GPT_4O", "60")),
+    "gpt-4o-mini": int(os.getenv("OPENAI_RPM_GPT_4O_MINI", "300")),
+    "whisper-1": int(os.getenv("OPENAI_RPM_WHISPER", "50"))
+}
+
+class TokenBucket:
+    """Classic token bucket: refills at rate_per_minute, allows bursts of up to capacity"""
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or max(1.0, rate_per_minute / 10.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def acquire(self, deadline):
+        """Take one token, waiting for a refill; returns False if that would pass the deadline"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait_seconds = (1 - self.tokens) / self.rate
+            if now + wait_seconds > deadline:
+                return False
+            time.sleep(wait_seconds)
+
+def is_retryable_openai_error(exc):
+    if isinstance(exc, (openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    if isinstance(exc, openai.APIStatusError):
+        return exc.status_code in (408, 409, 429) or exc.status_code >= 500
+    return False
+
+def retry_after_seconds(exc):
+    """Seconds the server asked us to wait (Retry-After / retry-after-ms headers), or None"""
+    response = getattr(exc, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            value = headers["retry-after"]
+            try:
+                return float(value)
+            except ValueError:
+                return max(0.0, (parsedate_to_datetime(value) - datetime.now(parsedate_to_datetime(value).tzinfo)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+    return None
+
+class SlotReleasingStream:
+    """
+    Iterates a streaming response and calls release() exactly once: when the stream is exhausted
+    or raises, on close(), or when the wrapper is garbage collected without ever being iterated.
+    """
+    def __init__(self, stream, release):
+        self._stream = stream
+        self._iterator = None
+        self._release = release
+        self._release_lock = threading.Lock()
+    
+    def __iter__(self):
+        return self
+    
+    def __next__(self):
+        try:
+            if self._iterator is None:
+                self._iterator = iter(self._stream)
+            return next(self._iterator)
+        except BaseException:
+            self.close()
+            raise
+    
+    def close(self):
+        with self._release_lock:
+            release, self._release = self._release, None
+        if release is None:
+            return
+        try:
+            if hasattr(self._stream, "close"):
+                self._stream.close()
+        finally:
+            release()
+    
+    def __del__(self):
+        self.close()
+
+class OpenAIRequestScheduler:
+    """
+    Wraps OpenAI SDK calls with rate limiting and retries. One instance is shared by every
+    session and batch worker in the process (see get_request_scheduler).
+    """
+    def __init__(self, requests_per_minute, max_in_flight, max_attempts, deadline):
+        self.requests_per_minute = requests_per_minute
+        self.max_attempts = max_attempts
+        self.deadline = deadline
+        self._buckets = {}
+        self._buckets_lock = threading.Lock()
+        self._in_flight = threading.BoundedSemaphore(max_in_flight)
+        self._backoff = wait_random_exponential(multiplier=1, max=30)
+    
+    def _bucket(self, model):
+        with self._buckets_lock:
+            if model not in self._buckets:
+                self._buckets[model] = TokenBucket(self.requests_per_minute.get(model, OPENAI_DEFAULT_RPM))
+            return self._buckets[model]
+    
+    def _wait(self, retry_state):
+        backoff = self._backoff(retry_state)
+        retry_after = retry_after_seconds(retry_state.outcome.exception())
+        if retry_after is not None:
+            # Honour the server's hint, with a little jitter so sessions don't retry in lockstep
+            return retry_after + random.uniform(0, 0.25 * max(retry_after, 1))
+        return backoff
+    
+    def call(self, request, deadline=None, **kwargs):
+        """
+        Run request(**kwargs), e.g. client.chat.completions.create, under the scheduler.
+        kwargs must include model. Streaming responses keep their in-flight slot until consumed.
+        """
+        deadline_seconds = deadline or self.deadline
+        deadline_at = time.monotonic() + deadline_seconds
+        retrying = Retrying(
+            stop=stop_after_attempt(self.max_attempts) | stop_before_delay(deadline_seconds),
+            wait=self._wait,
+            retry=retry_if_exception(is_retryable_openai_error),
+            reraise=True
+        )
+        for attempt in retrying:
+            with attempt:
+                return self._call_once(request, deadline_at, kwargs)
+    
+    def _call_once(self, request, deadline_at, kwargs):
+        if not self._bucket(kwargs["model"]).acquire(deadline_at):
+            raise TimeoutError(f"Rate limit wait for {kwargs['model']} would exceed the call deadline")
+        remaining = deadline_at - time.monotonic()
+        if remaining <= 0 or not self._in_flight.acquire(timeout=remaining):
+            raise TimeoutError("Timed out waiting for a free OpenAI request slot")
+        try:
+            response = request(timeout=max(1.0, deadline_at - time.monotonic()), **kwargs)
+        except BaseException:
+            self._in_flight.release()
+            raise
+        if kwargs.get("stream"):
+            return SlotReleasingStream(response, self._in_flight.release)
+        self._in_flight.release()
+        return response
+    
+@process_singleton
+def get_request_scheduler():
+    return OpenAIRequestScheduler(
+        OPENAI_REQUESTS_PER_MINUTE, OPENAI_MAX_IN_FLIGHT, OPENAI_MAX_ATTEMPTS, OPENAI_CALL_DEADLINE
+    )
+
+def openai_request(request, **kwargs):
+    """Issue an OpenAI SDK call through the shared scheduler"""
+    return get_request_scheduler().call(request, **kwargs)
+
+# Local on-disk caches (analysis results, translations) live here
+QC_CACHE_DIR = os.getenv("QC_CACHE_DIR", ".qc_cache")
+ANALYSIS_CACHE_MAX_MB = float(os.getenv("ANALYSIS_CACHE_MAX_MB", "200"))
+
+class PersistentLRUCache:
+    """
+    SQLite-backed key/value store with size-based LRU eviction.
+    Values are stored as JSON. One instance is shared by all sessions/threads in the process.
+    With memory_entries > 0, recently used values are also kept decoded in memory; those are
+    shared between callers, so treat returned values as read-only.
+    """
+    def __init__(self, path, max_bytes, memory_entries=0):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.memory_entries = memory_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._touched = set()  # memory hits whose last_access is not yet written to disk
+        
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_last_access ON entries(last_access)")
+        self._conn.commit()
+    
+    def get(self, key):
+        """Return the cached value or None, refreshing the entry's LRU position on a hit"""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self._touched.add(key)
+                self.hits += 1
+                return self._memory[key]
+            
+            row = self._conn.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            self.hits += 1
+            value = json.loads(row[0])
+            self._remember(key, value)
+        return value
+    
+    def set(self, key, value):
+        """Store a JSON-serialisable value, evicting least recently used entries over max_bytes"""
+        payload = json.dumps(value, ensure_ascii=False)
+        size = len(payload.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            now = time.time()
+            if self._touched:
+                self._conn.executemany(
+                    "UPDATE entries SET last_access = ? WHERE key = ?",
+                    [(now, touched_key) for touched_key in self._touched]
+                )
+                self._touched.clear()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, payload, size, now)
+            )
+            self._evict()
+            self._conn.commit()
+            self._remember(key, value)
+    
+    def _remember(self, key, value):
+        if self.memory_entries <= 0:
+            return
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            evicted_key, _ = self._memory.popitem(last=False)
+            self._touched.discard(evicted_key)
+    
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        stale_keys = []
+        for key, size in self._conn.execute("SELECT key, size FROM entries ORDER BY last_access"):
+            if total <= self.max_bytes:
+                break
+            stale_keys.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM entries WHERE key = ?", stale_keys)
+        for (key,) in stale_keys:
+            self._memory.pop(key, None)
+            self._touched.discard(key)
+    
+    def stats(self):
+        with self._lock:
+            entries, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+            ).fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "bytes": total}
+
+@process_singleton
+def get_analysis_cache():
+    return PersistentLRUCache(
+        os.path.join(QC_CACHE_DIR, "analysis.sqlite3"),
+        int(ANALYSIS_CACHE_MAX_MB * 1024 * 1024)
+    )
+
+# Translations are shared by every session and survive restarts
+TRANSLATION_MODEL = "gpt-4o-mini"
+TRANSLATION_CACHE_MAX_MB = float(os.getenv("TRANSLATION_CACHE_MAX_MB", "20"))
+
+@process_singleton
+def get_translation_cache():
+    return PersistentLRUCache(
+        os.path.join(QC_CACHE_DIR, "translations.sqlite3"),
+        int(TRANSLATION_CACHE_MAX_MB * 1024 * 1024),
+        memory_entries=5000
+    )
+
+def translation_cache_key(text, target_language, model=TRANSLATION_MODEL):
+    return hashlib.sha256(json.dumps([text, target_language, model], ensure_ascii=False).encode("utf-8")).hexdigest()
+
+def get_cached_translation(text, target_language):
+    return get_translation_cache().get(translation_cache_key(text, target_language))
+
+def store_translation(text, target_language, translated):
+    get_translation_cache().set(translation_cache_key(text, target_language), translated)
+
+def is_translation_resolved(text, target_language):
+    """
+    True when text has a real translation (glossary or cache) or needs none. Failed requests fall
+    back to the source text without caching it, so those come out False.
+    """
+    if target_language == "English" or not text or text.strip() == "":
+        return True
+    return lookup_glossary(text, target_language) is not None or get_cached_translation(text, target_language) is not None
+
+def calculate_total_sampling(order_qty):
+    """Calculate total sampling based on order quantity"""
+    try:
+        qty = int(order_qty)
+        if qty <= 300:
+            return "100%"
+        elif qty <= 1200:
+            return "80"
+        elif qty <= 3200:
+            return "125"
+        elif qty <= 10000:
+            return "200"
+        else:
+            return "315"
+    except:
+        return ""
+    
+
+def get_sampling_limits(order_qty):
+    """Get sampling limits based on order quantity"""
+    try:
+        qty = int(order_qty)
+        if qty <= 300:
+            return {"to_inspect": "100%", "major_limit": 1, "minor_limit": 5}
+        elif qty <= 1200:
+            return {"to_inspect": "80", "major_limit": 5, "minor_limit": 9}
+        elif qty <= 3200:
+            return {"to_inspect": "125", "major_limit": 7, "minor_limit": 10}
+        elif qty <= 10000:
+            return {"to_inspect": "200", "major_limit": 10, "minor_limit": 14}
+        else:
+            return {"to_inspect": "315", "major_limit": 14, "minor_limit": 21}
+    except:
+        return {"to_inspect": "", "major_limit": 0, "minor_limit": 0}
+
+# Keywords that identify each problem table row, English and Mandarin. A defect goes to the row
+# of its best keyword: specific keywords beat the generic ones in DEFECT_FALLBACK_KEYWORDS, then
+# the longest keyword wins ("back strap attachment" over "back strap", "midsole" over "sole"),
+# then the one earliest in the text. English keywords must start a word ("lace" is not in
+# "replaced") but may carry a suffix ("laces", "wrinkled"). No match at all means damage_upper.
+DEFECT_KEYWORDS = {
+    'color_variation': ['color variation', 'colour variation', 'color defect', '色差'],
+    'clean': ['clean', 'cleanliness', 'dirty', 'dirt', '清洁度', '清洁', '脏'],
+    'toe_lasting': ['toe lasting', '前帮'],
+    'heel_angle': ['heel angle', '包跟布起角', '包跟角'],
+    'waist': ['waist', '腰帮'],
+    'edge_wrinkle': ['edge wrinkle', '包边条皱', '包边皱'],
+    'lace': ['lace', '鞋带'],
+    'outsole': ['outsole', '大底'],
+    'velcro': ['velcro', '魔术贴'],
+    'adhesion': ['adhesion', '胶着力', '胶着'],
+    'buckle': ['buckle', '鞋扣'],
+    'midsole_glue': ['midsole', '中底胶', '中底'],
+    'tongue': ['tongue', '鞋舌'],
+    'grinding_high': ['grinding', '打磨'],
+    'back_strap_length': ['back strap', '后带'],
+    'back_strap_attachment': ['back strap attachment', '后带固定', '后带固'],
+    'heel': ['鞋跟'],
+    'toplift': ['toplift', '大皮'],
+    'damage_upper': ['damage upper', 'upper damage', '受损', '鞋面损'],
+    'bottom_gapping': ['bottom gapping', '底开胶', '开胶'],
+    'xray_wrinkle': ['x-ray', '打皱', '鞋面皱'],
+    # Stains is the glue-overflow row (溢胶); other stains and dirt count under clean
+    'stains': ['glue stain', 'adhesive stain', 'glue overflow', 'excess glue', '溢胶'],
+    'thread_ends': ['thread ends', 'thread end', '线头']
+}
+
+DEFECT_FALLBACK_KEYWORDS = {
+    'clean': ['stain', '污渍'],
+    'heel': ['heel'],
+    'edge_wrinkle': ['edge', 'wrinkle'],
+    'outsole': ['sole'],
+    'velcro': ['hook', 'loop'],
+    'adhesion': ['glue'],
+    'damage_upper': ['damage'],
+    'bottom_gapping': ['gapping', 'separation'],
+    'thread_ends': ['thread']
+}
+
+DEFAULT_PROBLEM = 'damage_upper'
+
+class DefectKeywordMatcher:
+    """
+    All defect keywords compiled into one regex at import. Keywords are laid out as a prefix tree,
+    so each text position is rejected after a character or two, and the tree sits in a lookahead,
+    so every keyword occurrence is seen, including ones that overlap a longer keyword.
+    """
+    def __init__(self, keywords, fallback_keywords, default=DEFAULT_PROBLEM):
+        self.default = default
+        # keyword -> (score, problem); the score orders by priority first, then length
+        self.scores = {}
+        for priority, table in ((0, fallback_keywords), (1, keywords)):
+            for problem, problem_keywords in table.items():
+                for keyword in problem_keywords:
+                    self.scores[keyword.lower()] = (priority * 1000 + len(keyword), problem)
+        latin = [keyword for keyword in self.scores if keyword[0].isascii()]
+        cjk = [keyword for keyword in self.scores if not keyword[0].isascii()]
+        self.pattern = re.compile(rf"(?=(\b{self.prefix_tree_pattern(latin)}|{self.prefix_tree_pattern(cjk)}))")
+
+    @staticmethod
+    def prefix_tree_pattern(words):
+        """Regex matching the longest of words that starts at the current position"""
+        tree = {}
+        for word in words:
+            node = tree
+            for char in word:
+                node = node.setdefault(char, {})
+            node[""] = {}
+
+        def build(node):
+            branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+            if not branches:
+                return ""
+            body = branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+            # Greedy, so a longer keyword through this node is preferred over the one ending here
+            return f"(?:{body})?" if "" in node else body
+        return build(tree)
+
+    def classify(self, text):
+        """Problem table row for one defect description"""
+        best_score, best_problem = -1, self.default
+        # Matches arrive in text order, so on a tie the earlier keyword is kept
+        for match in self.pattern.finditer(text.lower()):
+            score, problem = self.scores[match.group(1)]
+            if score > best_score:
+                best_score, best_problem = score, problem
+        return best_problem
+
+    def classify_many(self, texts):
+        """Problem table rows for a list of descriptions, matched in a single scan over all of them"""
+        texts = [text.lower() for text in texts]
+        ends = list(itertools.accumulate(len(text) + 1 for text in texts))
+        best_scores = [-1] * len(texts)
+        problems = [self.default] * len(texts)
+        idx = 0
+        # Keywords never contain a newline, so no match crosses from one text into the next
+        for match in self.pattern.finditer("\n".join(texts)):
+            # Matches arrive in order, so the text they fall in only ever moves forward
+            while match.start() >= ends[idx]:
+                idx += 1
+            score, problem = self.scores[match.group(1)]
+            if score > best_scores[idx]:
+                best_scores[idx], problems[idx] = score, problem
+        return problems
+
+DEFECT_MATCHER = DefectKeywordMatcher(DEFECT_KEYWORDS, DEFECT_FALLBACK_KEYWORDS)
+
+def map_defect_to_problem(defect_text, severity=None):
+    """Map AI defect to problem categories"""
+    return DEFECT_MATCHER.classify(defect_text)
+
+def map_defects_to_problems(defect_texts):
+    """map_defect_to_problem for a whole list, in one pass"""
+    return DEFECT_MATCHER.classify_many(defect_texts)
+
+def empty_problem_table():
+    """Problem table with every row at zero; keys match PROBLEM_NAMES"""
+    return {problem_key: {'cr': 0, 'major': 0, 'minor': 0} for problem_key in PROBLEM_NAMES["English"]}
+
+def empty_defect_store():
+    """Defect lists per source and severity; entries are (defect_id, english_text) tuples"""
+    return {f'{source}_{category}': [] for source in ['ai', 'qc'] for category in ['critical', 'major', 'minor']}
+
+def update_problem_table(problem_data, defects, severity):
+    """Count each defect into its problem table row (in place)"""
+    column = {'critical': 'cr', 'major': 'major', 'minor': 'minor'}.get(severity)
+    if not column:
+        return
+    for problem_category in map_defects_to_problems(defects):
+        if problem_category in problem_data:
+            problem_data[problem_category][column] += 1
+
+def translate_text(client, text, target_language):
+    """Translate text using OpenAI with caching"""
+    if not text or text.strip() == "" or target_language == "English":
+        return text
+    
+    glossary_translation = lookup_glossary(text, target_language)
+    if glossary_translation is not None:
+        return glossary_translation
+    
+    cached = get_cached_translation(text, target_language)
+    if cached is not None:
+        return cached
+    
+    lang_map = {
+        "Mandarin": "Simplified Chinese (Mandarin)",
+    }
+    
+    try:
+        response = openai_request(
+            client.chat.completions.create,
+            model=TRANSLATION_MODEL,
+            messages=[{
+                "role": "user",
+                "content": f"Translate to {lang_map[target_language]}. Return ONLY the translation:\n\n{text}"
+            }],
+            max_tokens=500,
+            temperature=0.1
+        )
+        translated = response.choices[0].message.content.strip()
+        store_translation(text, target_language, translated)
+        return translated
+    except Exception as e:
+        logger.warning("Translation error: %s", e)
+        return text
+
+def translate_texts(client, texts, target_language):
+    """
+    Translate many strings with a single structured JSON request.
+    Returns {text: translation} and fills the shared translation cache. If the request fails,
+    pending texts come back untranslated (and uncached); entries missing or malformed in a
+    parsed response fall back to translate_text one at a time.
+    """
+    if target_language == "English":
+        return {text: text for text in texts}
+    
+    lang_map = {
+        "Mandarin": "Simplified Chinese (Mandarin)",
+    }
+    
+    translations = {}
+    pending = []
+    for text in dict.fromkeys(texts):
+        if not text or text.strip() == "":
+            translations[text] = text
+            continue
+        glossary_translation = lookup_glossary(text, target_language)
+        if glossary_translation is not None:
+            translations[text] = glossary_translation
+            continue
+        cached = get_cached_translation(text, target_language)
+        if cached is not None:
+            translations[text] = cached
+        else:
+            pending.append(text)
+    
+    if not pending:
+        return translations
+    
+    # Key items by position so one bad entry does not shift the rest
+    items = {str(idx): text for idx, text in enumerate(pending)}
+    try:
+        response = openai_request(
+            client.chat.completions.create,
+            model=TRANSLATION_MODEL,
+            messages=[
+                {
+                    "role": "system",
+                    "content": f"You are a professional translator for footwear quality control reports. "
+                               f"Translate every value of the JSON object \"items\" to {lang_map[target_language]}. "
+                               f"Reply with a JSON object {{\"translations\": {{...}}}} that uses the same keys "
+                               "and contains only the translations."
+                },
+                {
+                    "role": "user",
+                    "content": json.dumps({"items": items}, ensure_ascii=False)
+                }
+            ],
+            response_format={"type": "json_object"},
+            temperature=0.1
+        )
+        batch_result = json.loads(response.choices[0].message.content).get("translations", {})
+    except Exception as e:
+        # The whole request failed; retrying item by item would only repeat it once per text
+        logger.warning("Translation error: %s", e)
+        for text in pending:
+            translations[text] = text
+        return translations
+    if not isinstance(batch_result, dict):
+        batch_result = {}
+    
+    for key, text in items.items():
+        translated = batch_result.get(key)
+        if isinstance(translated, str) and translated.strip():
+            translated = translated.strip()
+            store_translation(text, target_language, translated)
+            translations[text] = translated
+        else:
+            translations[text] = translate_text(client, text, target_language)
+    
+    return translations
+
+def translate_to_languages(client, text, target_languages):
+    """
+    Translate one text into several languages with a single structured JSON request.
+    Returns ({language: translation}, resolved) where resolved is the set of languages that really
+    came back translated; the others (request failed or left out) get the text unchanged.
+    """
+    language_names = {
+        "English": "English",
+        "Mandarin": "Simplified Chinese (Mandarin)",
+    }
+
+    if not text or text.strip() == "" or not target_languages:
+        return {language: text for language in target_languages}, set(target_languages)
+
+    try:
+        response = openai_request(
+            client.chat.completions.create,
+            model=TRANSLATION_MODEL,
+            messages=[
+                {
+                    "role": "system",
+                    "content": "You are a professional translator for footwear quality control reports. "
+                               "Translate the user's text into each of these languages: "
+                               + ", ".join(f"\"{language}\" ({language_names.get(language, language)})"
+                                           for language in target_languages)
+                               + ". Reply with a JSON object whose keys are exactly those quoted names "
+                               "and whose values are only the translations."
+                },
+                {
+                    "role": "user",
+                    "content": text
+                }
+            ],
+            response_format={"type": "json_object"},
+            temperature=0.1
+        )
+        result = json.loads(response.choices[0].message.content)
+    except Exception as e:
+        logger.warning("Translation error: %s", e)
+        result = {}
+    if not isinstance(result, dict):
+        result = {}
+
+    translations = {}
+    resolved = set()
+    for language in target_languages:
+        translated = result.get(language)
+        if isinstance(translated, str) and translated.strip():
+            translations[language] = translated.strip()
+            resolved.add(language)
+        else:
+            translations[language] = text
+    return translations, resolved
+
+# Han ideographs (basic, extension A, compatibility), CJK punctuation and full-width forms
+CJK_PATTERN = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]")
+LATIN_PATTERN = re.compile(r"[A-Za-z]")
+
+def detect_input_language(text):
+    """
+    Classify inspector input by script, without a network call:
+      "English": no CJK at all (this includes model numbers, sizes and measurements)
+      "Mandarin": CJK with at most the odd Latin code or unit mixed in
+      "mixed": CJK and Latin words in comparable amounts
+    Whatever is not "English" still needs translating before it is stored.
+    """
+    cjk = len(CJK_PATTERN.findall(text))
+    if cjk == 0:
+        return "English"
+    latin = len(LATIN_PATTERN.findall(text))
+    # A Han character carries roughly a word; a Latin word is about five letters
+    return "Mandarin" if cjk >= 2 * (latin / 5) else "mixed"
+
+reverse_translation_stats = Counter()
+reverse_translation_stats_lock = threading.Lock()
+
+def count_reverse_translation(outcome):
+    with reverse_translation_stats_lock:
+        reverse_translation_stats[outcome] += 1
+
+def get_reverse_translation_stats():
+    """Process-wide counts of reverse translations skipped (already English) and sent"""
+    with reverse_translation_stats_lock:
+        return dict(reverse_translation_stats)
+
+def translate_to_english(client, text, instruction="Translate this to English.", max_tokens=500):
+    """
+    Translate inspector input to English for storage. Input that is already English is returned
+    as is without a request; mixed-script input keeps its Latin codes and terms verbatim.
+    API errors propagate so the caller can decide how to fall back.
+    """
+    detected = detect_input_language(text)
+    if detected == "English":
+        count_reverse_translation("skipped_english")
+        return text
+
+    if detected == "mixed":
+        instruction += " Keep model numbers, codes, units and any words already in English exactly as written."
+    response = openai_request(
+        client.chat.completions.create,
+        model=TRANSLATION_MODEL,
+        messages=[{
+            "role": "user",
+            "content": f"{instruction} Return ONLY the English translation:\n\n{text}"
+        }],
+        max_tokens=max_tokens,
+        temperature=0.1
+    )
+    count_reverse_translation(f"translated_{detected.lower()}")
+    return response.choices[0].message.content.strip()
+
+def prefetch_translations(client, defect_store, target_language, extra_texts=()):
+    """Translate a whole defect store (plus any extra strings) in one batched request"""
+    if target_language == "English":
+        return
+    texts = [text for defects in defect_store.values() for _, text in defects]
+    translate_texts(client, texts + list(extra_texts), target_language)
+
+def translate_defects(client, defects, target_language):
+    """Split [(defect_id, english_text), ...] into ids and texts translated to target_language"""
+    if target_language == "English":
+        return [defect_id for defect_id, defect_text in defects], [defect_text for defect_id, defect_text in defects]
+    
+    translations = translate_texts(client, [english_text for _, english_text in defects], target_language)
+    ids = [defect_id for defect_id, _ in defects]
+    translated = [translations[english_text] for _, english_text in defects]
+    
+    return ids, translated
+
+# GPT-4o fits high-detail images inside 2048x2048, then scales the short edge down to 768 before
+# cutting 512px tiles, so anything beyond that only costs bandwidth
+ANALYSIS_MAX_EDGE = int(os.getenv("ANALYSIS_MAX_EDGE", "2048"))
+ANALYSIS_MAX_SHORT_EDGE = int(os.getenv("ANALYSIS_MAX_SHORT_EDGE", "768"))
+ANALYSIS_JPEG_QUALITY = int(os.getenv("ANALYSIS_JPEG_QUALITY", "85"))
+
+def flatten_to_rgb(image, background=(255, 255, 255)):
+    """Convert any PIL mode to RGB, compositing transparency onto a white background"""
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        rgba = image.convert("RGBA")
+        flattened = Image.new("RGB", rgba.size, background)
+        flattened.paste(rgba, mask=rgba.getchannel("A"))
+        return flattened
+    if image.mode != "RGB":
+        return image.convert("RGB")
+    return image
+
+def prepare_image_for_analysis(image, max_edge=None, max_short_edge=None):
+    """
+    Orient, flatten and downscale an image before it is encoded for the vision model, to the
+    size the model would resize it to anyway (long edge <= max_edge, short edge <= max_short_edge).
+    Returns (prepared_image, (scale_x, scale_y)) where scale maps prepared pixels back to the
+    EXIF-oriented original (original_x = prepared_x * scale_x). Percentage coordinates returned
+    by the model are unaffected by the resize, as long as crops use the oriented original.
+    """
+    max_edge = max_edge or ANALYSIS_MAX_EDGE
+    max_short_edge = max_short_edge or ANALYSIS_MAX_SHORT_EDGE
+    oriented = ImageOps.exif_transpose(image)
+    original_width, original_height = oriented.size
+    
+    prepared = flatten_to_rgb(oriented)
+    ratio = min(max_edge / max(original_width, original_height), max_short_edge / min(original_width, original_height))
+    if ratio < 1:
+        new_size = (max(1, round(original_width * ratio)), max(1, round(original_height * ratio)))
+        prepared = prepared.resize(new_size, Image.Resampling.LANCZOS)
+    
+    prepared_width, prepared_height = prepared.size
+    return prepared, (original_width / prepared_width, original_height / prepared_height)
+
+def encode_image(image, quality=ANALYSIS_JPEG_QUALITY):
+    buffer = io.BytesIO()
+    flatten_to_rgb(image).save(buffer, format="JPEG", quality=quality, optimize=True)
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+def get_defect_category(defect_desc, analysis):
+    """Determine which category a defect belongs to"""
+    if defect_desc in analysis.get('critical_defects', []):
+        return 'critical'
+    elif defect_desc in analysis.get('major_defects', []):
+        return 'major'
+    elif defect_desc in analysis.get('minor_defects', []):
+        return 'minor'
+    return 'unknown'
+
+# Vision analysis request settings - these are part of the analysis cache key
+ANALYSIS_MODEL = "gpt-4o"
+ANALYSIS_TEMPERATURE = 0.1
+
+# Structured output schema for one image. "defects" comes first and is a flat list so it can be
+# parsed while the response is still streaming.
+ANALYSIS_RESPONSE_SCHEMA = {
+    "name": "shoe_image_inspection",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "image_number": {"type": "integer"},
+            "defects": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "severity": {"type": "string", "enum": ["critical", "major", "minor"]},
+                        "description": {"type": "string"},
+                        "box": {
+                            "type": "object",
+                            "properties": {
+                                "x1": {"type": "number"},
+                                "y1": {"type": "number"},
+                                "x2": {"type": "number"},
+                                "y2": {"type": "number"}
+                            },
+                            "required": ["x1", "y1", "x2", "y2"],
+                            "additionalProperties": False
+                        }
+                    },
+                    "required": ["severity", "description", "box"],
+                    "additionalProperties": False
+                }
+            },
+            "overall_condition": {"type": "string", "enum": ["Good", "Fair", "Poor"]},
+            "confidence": {"type": "string", "enum": ["High", "Medium", "Low"]},
+            "inspection_notes": {"type": "string"}
+        },
+        "required": ["image_number", "defects", "overall_condition", "confidence", "inspection_notes"],
+        "additionalProperties": False
+    }
+}
+
+# Single-request mode: every photo in one call, each defect attributed to the image it is seen in
+COMBINED_ANALYSIS_RESPONSE_SCHEMA = {
+    "name": "shoe_multi_image_inspection",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "defects": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "image_number": {"type": "integer"},
+                        **ANALYSIS_RESPONSE_SCHEMA["schema"]["properties"]["defects"]["items"]["properties"]
+                    },
+                    "required": ["image_number", "severity", "description", "box"],
+                    "additionalProperties": False
+                }
+            },
+            "overall_condition": ANALYSIS_RESPONSE_SCHEMA["schema"]["properties"]["overall_condition"],
+            "confidence": ANALYSIS_RESPONSE_SCHEMA["schema"]["properties"]["confidence"],
+            "inspection_notes": ANALYSIS_RESPONSE_SCHEMA["schema"]["properties"]["inspection_notes"]
+        },
+        "required": ["defects", "overall_condition", "confidence", "inspection_notes"],
+        "additionalProperties": False
+    }
+}
+
+ANALYSIS_INSTRUCTIONS = """CRITICAL INSTRUCTIONS:
+1. DO NOT include ANY measurements (mm, cm, inches, numbers) in defect descriptions
+2. Each defect must be unique - never list similar defects in different categories
+3. Use clear, descriptive language without numerical data
+4. Focus on defect type and location only
+5. For EACH defect, provide its approximate bounding box (x1, y1, x2, y2) where:
+   - Coordinates are relative to image size (0-100%)
+   - (x1, y1) is the top-left corner and (x2, y2) the bottom-right corner
+
+INSPECTION PROTOCOL:
+1. Scan overall construction and proportion
+2. Examine all visible materials for defects
+3. Check all stitching lines and seam quality
+4. Inspect hardware, eyelets, and functional components
+5. Look for sole attachment and construction issues
+6. Verify color consistency and finish quality
+7. Note any safety or structural concerns
+
+CRITICAL DEFECT CATEGORIES (REJECT immediately):
+- Holes, tears, or punctures in upper materials
+- Broken/missing eyelets, hardware, or structural components
+- Sole separation or delamination
+- Asymmetrical lasting or construction
+- Safety hazards (sharp edges, protruding nails)
+
+MAJOR DEFECT CATEGORIES (Count towards rejection limits):
+- Stitching defects: skipped stitches, loose threads, crooked seams
+- Material defects: scratches, scuffs, stains, grain breaks
+- Construction issues: uneven toe caps, misaligned panels
+- Adhesive residue or excess glue visible
+- Color variation outside acceptable tolerance
+
+MINOR DEFECT CATEGORIES (Count but typically acceptable):
+- Minor sole defects, uneven texturing
+- Very light surface marks that don't affect structural integrity
+
+CRITICAL RULES:
+1. NO measurements or numbers in descriptions
+2. Each defect appears in ONLY ONE category
+3. Be specific about location and defect type WITHOUT measurements
+4. Describe each defect as "[location] - [defect type]", e.g. "heel counter - adhesive stain"
+5. Similar defects should not appear across categories"""
+
+def analysis_cache_key(base64_images, prompt, schema=ANALYSIS_RESPONSE_SCHEMA):
+    """Content address for an analysis: image bytes + prompt + schema + model + temperature"""
+    if isinstance(base64_images, str):
+        base64_images = [base64_images]
+    digest = hashlib.sha256()
+    digest.update(json.dumps([ANALYSIS_MODEL, ANALYSIS_TEMPERATURE, prompt, schema]).encode("utf-8"))
+    for base64_image in base64_images:
+        digest.update(base64_image.encode("ascii"))
+    return digest.hexdigest()
+
+def usage_to_dict(usage):
+    return {"prompt_tokens": usage.prompt_tokens, "completion_tokens": usage.completion_tokens}
+
+class IncrementalDefectParser:
+    """
+    Pulls complete defect objects out of a partially streamed analysis JSON document.
+    feed() returns the defects completed by the new text, in the order the model wrote them.
+    """
+    def __init__(self, array_key="defects"):
+        self._array_pattern = re.compile(r'"%s"\s*:\s*\[' % re.escape(array_key))
+        self._buffer = ""
+        self._pos = 0
+        self._in_array = False
+        self._finished = False
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._object_start = None
+    
+    def feed(self, text):
+        self._buffer += text
+        completed = []
+        if self._finished:
+            return completed
+        if not self._in_array:
+            match = self._array_pattern.search(self._buffer)
+            if not match:
+                return completed
+            self._in_array = True
+            self._pos = match.end()
+        
+        buffer = self._buffer
+        for idx in range(self._pos, len(buffer)):
+            char = buffer[idx]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == "{":
+                if self._depth == 0:
+                    self._object_start = idx
+                self._depth += 1
+            elif char == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    try:
+                        completed.append(json.loads(buffer[self._object_start:idx + 1]))
+                    except ValueError:
+                        pass
+            elif char == "]" and self._depth == 0:
+                self._finished = True
+                break
+        self._pos = len(buffer)
+        return completed
+
+def clean_defect_description(description):
+    """Strip any coordinate suffix the model leaves in a description"""
+    return re.sub(r'\s*\(\d+,\d+,\d+,\d+\)', '', description).strip()
+
+def defect_box_to_coordinates(box):
+    return [box["x1"], box["y1"], box["x2"], box["y2"]]
+
+def build_analysis_result(parsed):
+    """Convert a schema response into the analysis dict + defect_coordinates used by the app"""
+    result = {
+        "image_number": parsed.get("image_number"),
+        "critical_defects": [],
+        "major_defects": [],
+        "minor_defects": [],
+        "overall_condition": parsed.get("overall_condition"),
+        "confidence": parsed.get("confidence"),
+        "inspection_notes": parsed.get("inspection_notes", "")
+    }
+    defect_coordinates = {}
+    for defect in parsed.get("defects", []):
+        description = clean_defect_description(defect["description"])
+        result[f"{defect['severity']}_defects"].append(description)
+        defect_coordinates[description] = defect_box_to_coordinates(defect["box"])
+    result["defect_coordinates"] = defect_coordinates
+    return result, defect_coordinates
+
+def report_analysis_error(message):
+    logger.error(message)
+
+def analyze_shoe_image_with_locations(client, image, image_number, style_number="", color="", contract_number="",
+                                      on_defect=None, usage_log=None, on_error=report_analysis_error):
+    """
+    Analyze image and return defect locations for cropping.
+    The response is streamed; on_defect(image_number, severity, description) is called for
+    each defect as soon as it has fully arrived. Token usage is appended to usage_log if given.
+    Failures are passed to on_error(message) and return (None, {}).
+    """
+    prepared_image, analysis_scale = prepare_image_for_analysis(image)
+    base64_image = encode_image(prepared_image)
+    
+    prompt = f"""You are an expert footwear QC inspector analyzing Image {image_number}.
+Product: {style_number}, Color: {color}, Contract: {contract_number}
+
+{ANALYSIS_INSTRUCTIONS}
+
+Respond in English using the provided JSON schema, with image_number set to {image_number}."""
+    
+    cache = get_analysis_cache()
+    cache_key = analysis_cache_key(base64_image, prompt)
+    cached = cache.get(cache_key)
+    if cached is not None:
+        result = cached["result"]
+        if on_defect:
+            for category in ['critical', 'major', 'minor']:
+                for description in result.get(f"{category}_defects", []):
+                    on_defect(image_number, category, description)
+        result["from_cache"] = True
+        return result, cached["defect_coordinates"]
+    
+    try:
+        stream = openai_request(
+            client.chat.completions.create,
+            model=ANALYSIS_MODEL,
+            messages=[{
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": prompt},
+                    {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}}
+                ]
+            }],
+            max_tokens=1500,
+            temperature=ANALYSIS_TEMPERATURE,
+            response_format={"type": "json_schema", "json_schema": ANALYSIS_RESPONSE_SCHEMA},
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        
+        parser = IncrementalDefectParser()
+        chunks = []
+        for chunk in stream:
+            if chunk.usage and usage_log is not None:
+                usage_log.append(usage_to_dict(chunk.usage))
+            if not chunk.choices or not chunk.choices[0].delta.content:
+                continue
+            text = chunk.choices[0].delta.content
+            chunks.append(text)
+            for defect in parser.feed(text):
+                if on_defect and defect.get("severity") in ('critical', 'major', 'minor'):
+                    on_defect(image_number, defect["severity"], clean_defect_description(defect.get("description", "")))
+        
+        result, defect_coordinates = build_analysis_result(json.loads("".join(chunks)))
+        result["analysis_scale"] = list(analysis_scale)
+        cache.set(cache_key, {"result": result, "defect_coordinates": defect_coordinates})
+        result["from_cache"] = False
+        return result, defect_coordinates
+    except Exception as e:
+        on_error(f"Analysis error: {str(e)}")
+        return None, {}
+
+def analyze_shoe_images_combined(client, images, style_number="", color="", contract_number="",
+                                 on_defect=None, usage_log=None, on_error=report_analysis_error):
+    """
+    Analyze all images in ONE request. The model attributes each defect to an image and reports
+    a defect seen from several angles only once. Returns the same per-image
+    [(analysis, defect_coordinates), ...] list as analyze_images_concurrently.
+    """
+    image_count = len(images)
+    prepared_images = [prepare_image_for_analysis(image) for image in images]
+    base64_images = [encode_image(prepared_image) for prepared_image, _ in prepared_images]
+    analysis_scales = [analysis_scale for _, analysis_scale in prepared_images]
+    
+    prompt = f"""You are an expert footwear QC inspector analyzing {image_count} photos of the same shoe,
+numbered Image 1 to Image {image_count} in the order they are attached.
+Product: {style_number}, Color: {color}, Contract: {contract_number}
+
+{ANALYSIS_INSTRUCTIONS}
+
+MULTI-IMAGE RULES:
+1. Set image_number on every defect to the photo (1-{image_count}) where it is most clearly visible
+2. A defect visible in several photos is ONE defect - report it once, on its clearest photo
+3. The box coordinates refer to that photo only
+
+Respond in English using the provided JSON schema."""
+    
+    cache = get_analysis_cache()
+    cache_key = analysis_cache_key(base64_images, prompt, COMBINED_ANALYSIS_RESPONSE_SCHEMA)
+    cached = cache.get(cache_key)
+    if cached is None:
+        content = [{"type": "text", "text": prompt}]
+        for idx, base64_image in enumerate(base64_images, 1):
+            content.append({"type": "text", "text": f"Image {idx}:"})
+            content.append({"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}})
+        try:
+            stream = openai_request(
+                client.chat.completions.create,
+                model=ANALYSIS_MODEL,
+                messages=[{"role": "user", "content": content}],
+                max_tokens=1500 * image_count,
+                temperature=ANALYSIS_TEMPERATURE,
+                response_format={"type": "json_schema", "json_schema": COMBINED_ANALYSIS_RESPONSE_SCHEMA},
+                stream=True,
+                stream_options={"include_usage": True}
+            )
+            
+            parser = IncrementalDefectParser()
+            chunks = []
+            for chunk in stream:
+                if chunk.usage and usage_log is not None:
+                    usage_log.append(usage_to_dict(chunk.usage))
+                if not chunk.choices or not chunk.choices[0].delta.content:
+                    continue
+                text = chunk.choices[0].delta.content
+                chunks.append(text)
+                for defect in parser.feed(text):
+                    if on_defect and defect.get("severity") in ('critical', 'major', 'minor'):
+                        on_defect(defect.get("image_number"), defect["severity"],
+                                  clean_defect_description(defect.get("description", "")))
+            parsed = json.loads("".join(chunks))
+        except Exception as e:
+            on_error(f"Analysis error: {str(e)}")
+            return [(None, {})] * image_count
+        cache.set(cache_key, parsed)
+        from_cache = False
+    else:
+        parsed = cached
+        from_cache = True
+        if on_defect:
+            for defect in parsed.get("defects", []):
+                on_defect(defect.get("image_number"), defect["severity"], clean_defect_description(defect["description"]))
+    
+    # A defect on an image that was not sent still counts; it is kept on image 1, whose crop may miss it
+    defects = []
+    for defect in parsed.get("defects", []):
+        if defect.get("image_number") not in range(1, image_count + 1):
+            logger.warning("Combined analysis put %r on image %r of %d; assigning it to image 1",
+                           defect.get("description"), defect.get("image_number"), image_count)
+            defect = dict(defect, image_number=1)
+        defects.append(defect)
+    
+    # Split the single response back into per-image analyses for the rest of the pipeline
+    results = []
+    for image_number in range(1, image_count + 1):
+        per_image = dict(parsed, image_number=image_number, defects=[
+            defect for defect in defects if defect["image_number"] == image_number
+        ])
+        result, defect_coordinates = build_analysis_result(per_image)
+        result["analysis_scale"] = list(analysis_scales[image_number - 1])
+        result["from_cache"] = from_cache
+        results.append((result, defect_coordinates))
+    return results
+
+# Cap on vision requests in flight per inspection (keeps us under the org rate limit)
+ANALYSIS_MAX_CONCURRENCY = int(os.getenv("ANALYSIS_MAX_CONCURRENCY", "4"))
+
+def analyze_images_concurrently(client, images, style_number="", color="", contract_number="",
+                                max_workers=None, on_complete=None, on_defect=None, usage_log=None,
+                                on_error=report_analysis_error):
+    """
+    Analyze all images in parallel instead of one after another.
+    Returns a list of (analysis, defect_coordinates) tuples ordered by image_number.
+    on_complete(done_count, total), on_defect(image_number, severity, description) and
+    on_error(message) are called from the calling thread, so they may update UI widgets.
+    """
+    total = len(images)
+    results = [(None, {})] * total
+    if total == 0:
+        return results
+    
+    max_workers = max(1, min(max_workers or ANALYSIS_MAX_CONCURRENCY, total))
+    
+    # Streamed defects and errors are handed back to this thread through a queue
+    events = queue.Queue()
+    
+    def drain_events():
+        while True:
+            try:
+                kind, event = events.get_nowait()
+            except queue.Empty:
+                return
+            if kind == "error":
+                on_error(*event)
+            elif on_defect:
+                on_defect(*event)
+    
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="qc-analysis") as executor:
+        futures = {
+            executor.submit(analyze_shoe_image_with_locations, client, image, idx + 1,
+                            style_number, color, contract_number,
+                            lambda *event: events.put(("defect", event)), usage_log,
+                            lambda *event: events.put(("error", event))): idx
+            for idx, image in enumerate(images)
+        }
+        pending = set(futures)
+        done_count = 0
+        while pending:
+            finished, pending = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+            drain_events()
+            for future in finished:
+                results[futures[future]] = future.result()
+                done_count += 1
+                if on_complete:
+                    on_complete(done_count, total)
+        drain_events()
+    
+    return results
+
+def run_inspection_analysis(client, images, style_number="", color="", contract_number="", order_qty=1000,
+                            analysis_mode="per_image", on_complete=None, on_defect=None,
+                            on_error=report_analysis_error):
+    """
+    Analyze one inspection's photos in the given mode ("per_image" or "combined") and build the AI
+    report. Returns a dict with analyses, defect_coordinates, report, usage_log and seconds.
+    """
+    usage_log = []
+    started = time.perf_counter()
+    if analysis_mode == "combined":
+        results = analyze_shoe_images_combined(
+            client, images, style_number, color, contract_number,
+            on_defect=on_defect, usage_log=usage_log, on_error=on_error
+        )
+        if on_complete:
+            on_complete(len(images), len(images))
+    else:
+        results = analyze_images_concurrently(
+            client, images, style_number, color, contract_number,
+            on_complete=on_complete, on_defect=on_defect, usage_log=usage_log, on_error=on_error
+        )
+    
+    analyses = []
+    all_defect_coordinates = {}
+    for analysis, defect_coordinates in results:
+        analyses.append(analysis)
+        all_defect_coordinates.update(defect_coordinates)
+    
+    return {
+        "analyses": analyses,
+        "defect_coordinates": all_defect_coordinates,
+        "report": generate_qc_report(analyses, order_qty),
+        "usage_log": usage_log,
+        "seconds": time.perf_counter() - started
+    }
+
+def normalize_defect_description(defect):
+    """Normalize defect descriptions to remove variations and enable better duplicate detection"""
+    if not defect:
+        return defect
+    
+    normalized = defect.lower().strip()
+    normalized = ' '.join(normalized.split())
+    
+    replacements = {
+        'scuff marks': 'scuff',
+        'scratch marks': 'scratch', 
+        'loose thread': 'loose threads',
+        'frayed edge': 'fraying',
+        'adhesive mark': 'adhesive residue',
+        'glue mark': 'adhesive residue',
+        'stitching irregularity': 'stitching irregularities',
+        'uneven stitch': 'uneven stitching'
+    }
+    
+    for old, new in replacements.items():
+        normalized = normalized.replace(old, new)
+    
+    return normalized
+
+def generate_qc_report(analyses, order_qty=1000):
+    """
+    Generate initial AI report from analyses with strict duplicate prevention.
+    Besides the decision and counts, the report carries the final defect lists
+    (critical_defects / major_defects / minor_defects) and the AI problem table.
+    """
+    all_critical, all_major, all_minor = [], [], []
+    
+    for analysis in analyses:
+        if analysis:
+            critical_defects = list(dict.fromkeys(analysis.get('critical_defects', [])))
+            major_defects = list(dict.fromkeys(analysis.get('major_defects', [])))
+            minor_defects = list(dict.fromkeys(analysis.get('minor_defects', [])))
+            
+            all_critical.extend(critical_defects)
+            all_major.extend(major_defects)
+            all_minor.extend(minor_defects)
+    
+    # Remove exact duplicates
+    all_critical = list(dict.fromkeys(all_critical))
+    all_major = list(dict.fromkeys(all_major))
+    all_minor = list(dict.fromkeys(all_minor))
+    
+    # Create normalized versions for cross-category duplicate detection
+    normalized_critical = [normalize_defect_description(d) for d in all_critical]
+    normalized_major = [normalize_defect_description(d) for d in all_major]
+    normalized_minor = [normalize_defect_description(d) for d in all_minor]
+    
+    # Remove from major if similar defect exists in critical
+    final_major = []
+    for i, major_defect in enumerate(all_major):
+        norm_major = normalized_major[i]
+        # Check for any overlap with critical defects
+        is_duplicate = False
+        for norm_critical in normalized_critical:
+            # Check if either contains the other or if they share significant keywords
+            if (norm_critical in norm_major or norm_major in norm_critical or
+                len(set(norm_critical.split()) & set(norm_major.split())) >= 2):
+                is_duplicate = True
+                break
+        if not is_duplicate:
+            final_major.append(major_defect)
+    
+    # Remove from minor if similar defect exists in critical or major
+    final_minor = []
+    final_major_normalized = [normalize_defect_description(d) for d in final_major]
+    
+    for i, minor_defect in enumerate(all_minor):
+        norm_minor = normalized_minor[i]
+        is_duplicate = False
+        
+        # Check against critical
+        for norm_critical in normalized_critical:
+            if (norm_critical in norm_minor or norm_minor in norm_critical or
+                len(set(norm_critical.split()) & set(norm_minor.split())) >= 2):
+                is_duplicate = True
+                break
+        
+        # Check against major
+        if not is_duplicate:
+            for norm_major in final_major_normalized:
+                if (norm_major in norm_minor or norm_minor in norm_major or
+                    len(set(norm_major.split()) & set(norm_minor.split())) >= 2):
+                    is_duplicate = True
+                    break
+        
+        if not is_duplicate:
+            final_minor.append(minor_defect)
+    
+    # Final cleanup
+    final_critical = list(dict.fromkeys(all_critical))
+    final_major = list(dict.fromkeys(final_major))
+    final_minor = list(dict.fromkeys(final_minor))
+    
+    # AI problem table
+    problem_table = empty_problem_table()
+    update_problem_table(problem_table, final_critical, 'critical')
+    update_problem_table(problem_table, final_major, 'major')
+    update_problem_table(problem_table, final_minor, 'minor')
+    
+    # Get sampling limits based on order quantity
+    sampling_limits = get_sampling_limits(order_qty)
+    major_limit = sampling_limits["major_limit"]
+    minor_limit = sampling_limits["minor_limit"]
+    
+    if len(final_critical) > 0:
+        result, reason = "REJECT", f"Critical defects ({len(final_critical)}) - Zero tolerance"
+    elif len(final_major) > major_limit:
+        result, reason = "REJECT", f"Major defects ({len(final_major)}) exceed limit ({major_limit})"
+    elif len(final_minor) > minor_limit:
+        result, reason = "REWORK", f"Minor defects ({len(final_minor)}) exceed limit ({minor_limit})"
+    else:
+        result, reason = "ACCEPT", "All defects within AQL 2.5 limits"
+    
+    return {
+        "result": result,
+        "reason": reason,
+        "critical_count": len(final_critical),
+        "major_count": len(final_major),
+        "minor_count": len(final_minor),
+        "sampling_limits": sampling_limits,
+        "critical_defects": final_critical,
+        "major_defects": final_major,
+        "minor_defects": final_minor,
+        "problem_table": problem_table
+    }
+
+def build_defect_store(report):
+    """Initial defect store for a report: AI lists, with the QC lists starting as copies"""
+    defect_store = {
+        'ai_critical': [(f"ai_c_{i}", d) for i, d in enumerate(report["critical_defects"])],
+        'ai_major': [(f"ai_m_{i}", d) for i, d in enumerate(report["major_defects"])],
+        'ai_minor': [(f"ai_n_{i}", d) for i, d in enumerate(report["minor_defects"])]
+    }
+    for category in ['critical', 'major', 'minor']:
+        defect_store[f'qc_{category}'] = defect_store[f'ai_{category}'].copy()
+    return defect_store
+
+@dataclass(slots=True)
+class InspectionState:
+    """
+    Everything one inspection's decision and PDF are computed from. The app keeps these fields in
+    st.session_state (see inspection_state_from_session in app.py); qc_batch builds one per lot.
+    The dicts and lists are shared, not copied, so edits through either side are seen by both.
+    """
+    order_qty: str = "1000"  # As entered; get_sampling_limits parses it
+    defect_store: dict = field(default_factory=empty_defect_store)
+    problem_defects_ai: dict = field(default_factory=empty_problem_table)
+    problem_defects_qc: dict = field(default_factory=empty_problem_table)
+    qc_defect_containers: list = field(default_factory=list)
+    qc_notes_english: str = ''
+    total_sampling: str = ''
+    ctn_no: str = ''
+    lot_size: str = ''
+    selected_city: str = 'Guangzhou'
+
+def update_ai_problem_table(state, report):
+    """Load a fresh AI report into the inspection: defect lists (QC lists reset to match) and AI problem table"""
+    state.defect_store = build_defect_store(report)
+    state.problem_defects_ai = report["problem_table"]
+
+def calculate_final_decision(state):
+    """Calculate final decision based on the QC Manager problem table and sampling limits"""
+    # Calculate defect counts from QC Manager problem table
+    qc_critical_count, qc_major_count, qc_minor_count = calculate_problem_table_totals(state.problem_defects_qc)
+    
+    # Get sampling limits based on order quantity
+    sampling_limits = get_sampling_limits(state.order_qty)
+    major_limit = sampling_limits["major_limit"]
+    minor_limit = sampling_limits["minor_limit"]
+    
+    if qc_critical_count > 0:
+        return "REJECT", f"Critical defects ({qc_critical_count}) - Zero tolerance"
+    elif qc_major_count > major_limit:
+        return "REJECT", f"Major defects ({qc_major_count}) exceed AQL limit ({major_limit})"
+    elif qc_minor_count > minor_limit:
+        return "REWORK", f"Minor defects ({qc_minor_count}) exceed AQL limit ({minor_limit})"
+    else:
+        return "ACCEPT", "All defects within AQL 2.5 limits"
+
+def calculate_problem_table_totals(problem_data):
+    """Calculate total defects from problem table (sum of all columns)"""
+    total_cr = 0
+    total_major = 0
+    total_minor = 0
+    
+    for problem_key, counts in problem_data.items():
+        total_cr += counts['cr']
+        total_major += counts['major']
+        total_minor += counts['minor']
+    
+    return total_cr, total_major, total_minor
\ No newline at end of file
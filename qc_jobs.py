@@ -0,0 +1,107 @@
+"""
+In-process background jobs for inspections and PDF builds.
+
+Work submitted here runs on a process-wide thread pool, not inside the Streamlit script run, so a
+rerun or a dropped browser connection does not cancel it. Jobs are keyed by an ID derived from the
+inspection ID; the UI keeps only that ID and polls the job for progress, streamed events and the
+result. Finished jobs are kept for JOB_RETENTION_SECONDS so a reconnecting session can pick them up.
+"""
+import logging
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from qc_core import process_singleton
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", "3600"))
+
+class Job:
+    """
+    One unit of background work. The worker updates progress, events and errors while it runs;
+    readers on other threads only ever see whole values, so no locking is needed to poll.
+    status is "queued", "running", "done" or "error".
+    """
+    def __init__(self, job_id, kind, meta=None):
+        self.id = job_id
+        self.kind = kind
+        self.meta = meta or {}  # Whatever the submitter needs to use the result later
+        self.status = "queued"
+        self.progress = 0.0
+        self.events = []
+        self.errors = []
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.finished_at = None
+
+    @property
+    def finished(self):
+        return self.status in ("done", "error")
+
+    def set_progress(self, done, total):
+        self.progress = done / total if total else 1.0
+
+    def add_event(self, *event):
+        self.events.append(event)
+
+    def add_error(self, message):
+        self.errors.append(message)
+
+class JobQueue:
+    """Runs jobs on a bounded thread pool and keeps them addressable by ID"""
+    def __init__(self, max_workers=JOB_WORKERS, retention_seconds=JOB_RETENTION_SECONDS):
+        self.executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="qc-job")
+        self.retention_seconds = retention_seconds
+        self.lock = threading.Lock()
+        self.jobs = {}
+
+    def submit(self, job_id, kind, fn, *args, meta=None, **kwargs):
+        """
+        Queue fn(job, *args, **kwargs) under job_id and return the Job. If a job with this ID is
+        still queued or running, that job is returned instead of starting a duplicate.
+        """
+        with self.lock:
+            self.prune()
+            existing = self.jobs.get(job_id)
+            if existing and not existing.finished:
+                return existing
+            job = Job(job_id, kind, meta)
+            self.jobs[job_id] = job
+        self.executor.submit(self.run, job, fn, args, kwargs)
+        return job
+
+    def run(self, job, fn, args, kwargs):
+        job.status = "running"
+        try:
+            job.result = fn(job, *args, **kwargs)
+            job.progress = 1.0
+            status = "done"
+        except Exception as e:
+            logger.exception("Job %s failed", job.id)
+            job.error = f"{e}\n{traceback.format_exc()}"
+            status = "error"
+        # finished_at goes first, so prune never sees a finished job without it
+        with self.lock:
+            job.finished_at = time.time()
+            job.status = status
+
+    def get(self, job_id):
+        with self.lock:
+            self.prune()
+            return self.jobs.get(job_id)
+
+    def prune(self):
+        """Forget finished jobs older than the retention window (call with the lock held)"""
+        cutoff = time.time() - self.retention_seconds
+        for job_id in [job_id for job_id, job in self.jobs.items()
+                       if job.finished and job.finished_at is not None and job.finished_at < cutoff]:
+            del self.jobs[job_id]
+
+@process_singleton
+def get_job_queue():
+    return JobQueue()
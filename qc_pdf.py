@@ -0,0 +1,1638 @@
+"""
+PDF rendering for QC inspection reports (English / Mandarin), independent of Streamlit.
+
+generate_multilingual_pdf takes the inspection explicitly as a qc_core.InspectionState.
+generate_all_language_pdfs renders several languages at once on a process pool, sharing the
+language-independent work (translations, fault photos, decision and counts) between them.
+"""
+import dataclasses
+import functools
+import hashlib
+import io
+import json
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+
+import pytz
+from PIL import Image
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER, TA_LEFT
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import cm, inch
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image as ReportLabImage, PageBreak, KeepTogether
+
+from qc_core import (
+    QC_CACHE_DIR, calculate_final_decision, calculate_problem_table_totals, calculate_total_sampling,
+    flatten_to_rgb, get_sampling_limits, is_translation_resolved, process_singleton, translate_texts
+)
+
+logger = logging.getLogger(__name__)
+
+PDF_LANGUAGES = ["English", "Mandarin"]
+
+# Fault photos are drawn at 1 inch and embedded at the print DPI below, not at camera resolution
+PDF_FAULT_PHOTO_INCHES = 1
+PDF_FAULT_PHOTO_DPI = int(os.getenv("PDF_FAULT_PHOTO_DPI", "300"))
+PDF_FAULT_PHOTO_PX = PDF_FAULT_PHOTO_INCHES * PDF_FAULT_PHOTO_DPI
+PDF_FAULT_PHOTO_QUALITY = int(os.getenv("PDF_FAULT_PHOTO_QUALITY", "85"))
+FAULT_PHOTO_CACHE_MB = float(os.getenv("FAULT_PHOTO_CACHE_MB", "64"))
+# Finished PDFs are kept on disk, not in memory, and handed around as file paths
+PDF_CACHE_DIR = os.path.join(QC_CACHE_DIR, "pdfs")
+PDF_CACHE_MB = float(os.getenv("PDF_CACHE_MB", "512"))
+PDF_TEMP_MAX_AGE = 3600  # Leftover partial files older than this (seconds) are removed
+# Cached PDFs carry their render time in the footer, so they are only reused for this long (seconds)
+PDF_CACHE_MAX_AGE = float(os.getenv("PDF_CACHE_MAX_AGE", "900"))
+PDF_PROCESS_WORKERS = int(os.getenv("PDF_PROCESS_WORKERS", "2"))
+
+# Timezone mapping for Chinese cities
+# Timezone mapping for Chinese cities
+CITY_TIMEZONES = {
+    "Guangzhou": "Asia/Shanghai",
+    "Shenzhen": "Asia/Shanghai",
+    "Dongguan": "Asia/Shanghai",
+    "Foshan": "Asia/Shanghai",
+    "Zhongshan": "Asia/Shanghai",
+    "Huizhou": "Asia/Shanghai",
+    "Zhuhai": "Asia/Shanghai",
+    "Jiangmen": "Asia/Shanghai",
+    "Zhaoqing": "Asia/Shanghai",
+    "Shanghai": "Asia/Shanghai",
+    "Beijing": "Asia/Shanghai",
+    "Suzhou": "Asia/Shanghai",
+    "Hangzhou": "Asia/Shanghai",
+    "Ningbo": "Asia/Shanghai",
+    "Wenzhou": "Asia/Shanghai",
+    "Wuhan": "Asia/Shanghai",
+    "Chengdu": "Asia/Shanghai",
+    "Chongqing": "Asia/Shanghai",
+    "Tianjin": "Asia/Shanghai",
+    "Nanjing": "Asia/Shanghai",
+    "Xi'an": "Asia/Shanghai",
+    "Qingdao": "Asia/Shanghai",
+    "Dalian": "Asia/Shanghai",
+    "Shenyang": "Asia/Shanghai",
+    "Changsha": "Asia/Shanghai",
+    "Zhengzhou": "Asia/Shanghai",
+    "Jinan": "Asia/Shanghai",
+    "Harbin": "Asia/Shanghai",
+    "Changchun": "Asia/Shanghai",
+    "Taiyuan": "Asia/Shanghai",
+    "Shijiazhuang": "Asia/Shanghai",
+    "Lanzhou": "Asia/Shanghai",
+    "Xiamen": "Asia/Shanghai",
+    "Fuzhou": "Asia/Shanghai",
+    "Nanning": "Asia/Shanghai",
+    "Kunming": "Asia/Shanghai",
+    "Guiyang": "Asia/Shanghai",
+    "Haikou": "Asia/Shanghai",
+    "Ürümqi": "Asia/Urumqi",  # Different timezone for Ürümqi
+    "Lhasa": "Asia/Urumqi"
+}
+
+# Major Chinese cities with Chinese and English names (footer location and the city picker)
+CHINESE_CITIES = {
+    "Guangzhou": "广东",
+    "Shenzhen": "深圳",
+    "Dongguan": "东莞",
+    "Foshan": "佛山",
+    "Zhongshan": "中山",
+    "Huizhou": "惠州",
+    "Zhuhai": "珠海",
+    "Jiangmen": "江门",
+    "Zhaoqing": "肇庆",
+    "Shanghai": "上海",
+    "Beijing": "北京",
+    "Suzhou": "苏州",
+    "Hangzhou": "杭州",
+    "Ningbo": "宁波",
+    "Wenzhou": "温州",
+    "Wuhan": "武汉",
+    "Chengdu": "成都",
+    "Chongqing": "重庆",
+    "Tianjin": "天津",
+    "Nanjing": "南京",
+    "Xi'an": "西安",
+    "Qingdao": "青岛",
+    "Dalian": "大连",
+    "Shenyang": "沈阳",
+    "Changsha": "长沙",
+    "Zhengzhou": "郑州",
+    "Jinan": "济南",
+    "Harbin": "哈尔滨",
+    "Changchun": "长春",
+    "Taiyuan": "太原",
+    "Shijiazhuang": "石家庄",
+    "Lanzhou": "兰州",
+    "Xiamen": "厦门",
+    "Fuzhou": "福州",
+    "Nanning": "南宁",
+    "Kunming": "昆明",
+    "Guiyang": "贵阳",
+    "Haikou": "海口",
+    "Ürümqi": "乌鲁木齐",
+    "Lhasa": "拉萨"
+}
+
+def city_now(selected_city):
+    """Current time in the selected city's timezone (server time if the zone is unknown)"""
+    try:
+        return datetime.now(pytz.timezone(CITY_TIMEZONES.get(selected_city, 'Asia/Shanghai')))
+    except Exception:
+        return datetime.now()
+
+# Report colours
+BRAND_BLUE = colors.Color(0.4, 0.49, 0.91)  # Original purple color
+SUCCESS_GREEN = colors.Color(0.31, 0.78, 0.47)
+WARNING_ORANGE = colors.Color(1.0, 0.6, 0.0)
+DANGER_RED = colors.Color(1.0, 0.42, 0.42)
+
+# CJK fonts to try for Mandarin reports, best first: ReportLab's built-in CID font, then Windows TTFs
+CJK_FONT_CANDIDATES = [("STSong-Light", None), ("SimSun", "simsun.ttc"), ("YaHei", "msyh.ttc")]
+
+@process_singleton
+def get_cjk_font():
+    """
+    Register the first CJK font that is available and return its name ("Helvetica" if none is).
+    Resolved once per process; call it to find out which font Mandarin reports use.
+    """
+    for font_name, font_file in CJK_FONT_CANDIDATES:
+        try:
+            pdfmetrics.registerFont(UnicodeCIDFont(font_name) if font_file is None else TTFont(font_name, font_file))
+        except Exception:
+            continue
+        logger.info("Mandarin PDFs use the %s font", font_name)
+        return font_name
+    logger.warning("No CJK font could be registered; Mandarin PDFs fall back to Helvetica")
+    return 'Helvetica'
+
+def get_pdf_fonts(language):
+    """(base_font, bold_font) for a report language"""
+    if language == "Mandarin":
+        return get_cjk_font(), get_cjk_font()
+    return 'Helvetica', 'Helvetica-Bold'
+
+@functools.lru_cache(maxsize=None)
+def get_pdf_styles(language):
+    """
+    The report's ParagraphStyles for one language, built once per process and shared by every
+    build. Treat them as read-only.
+    """
+    base_font, bold_font = get_pdf_fonts(language)
+    styles = getSampleStyleSheet()
+    title = ParagraphStyle('Title', parent=styles['Normal'], fontSize=22, alignment=TA_CENTER,
+                           textColor=BRAND_BLUE, fontName=bold_font, spaceAfter=12)
+    section = ParagraphStyle('Section', parent=styles['Heading2'], fontSize=14, spaceAfter=10,
+                             spaceBefore=15, textColor=BRAND_BLUE, fontName=bold_font, alignment=TA_CENTER)
+    severity_colors = {'critical': DANGER_RED, 'major': WARNING_ORANGE, 'minor': BRAND_BLUE}
+    pdf_styles = {
+        'title': title,
+        'subtitle': ParagraphStyle('Subtitle', parent=styles['Normal'], fontSize=12, alignment=TA_CENTER,
+                                   textColor=colors.Color(0.3, 0.3, 0.3), fontName=base_font, spaceAfter=8),
+        'section': section,
+        'report_title': ParagraphStyle('ReportTitle', parent=title, fontSize=16,
+                                       textColor=colors.black, fontName=bold_font),
+        'result': {
+            result: ParagraphStyle('Result', parent=styles['Normal'], fontSize=18, alignment=TA_CENTER,
+                                   fontName=bold_font, spaceAfter=10, textColor=result_color)
+            for result, result_color in [('ACCEPT', SUCCESS_GREEN), ('REJECT', DANGER_RED), ('REWORK', WARNING_ORANGE)]
+        },
+        'body': ParagraphStyle('Body', parent=styles['Normal'], fontSize=10, spaceAfter=6,
+                               fontName=base_font, textColor=colors.black),
+        'no_defects': ParagraphStyle('NoDefects', parent=styles['Normal'], fontSize=9, fontName=base_font,
+                                     alignment=TA_CENTER),
+        'notes_body': ParagraphStyle('NotesBody', parent=styles['Normal'], fontSize=10, fontName=base_font)
+    }
+    for severity, severity_color in severity_colors.items():
+        pdf_styles[f'{severity}_section'] = ParagraphStyle(f'{severity.title()}Section', parent=section,
+                                                           fontName=bold_font, textColor=severity_color)
+        pdf_styles[f'{severity}_defect'] = ParagraphStyle(f'{severity.title()}Defect', parent=styles['Normal'],
+                                                          textColor=severity_color, fontSize=9,
+                                                          fontName=base_font, leftIndent=15)
+    return pdf_styles
+
+def create_sampling_table(state, language, chinese_font=None, qc_totals=None):
+    """Create sampling inspection table for PDF - FIXED FOR MANDARIN"""
+    try:
+        order_qty = state.order_qty
+        total_sampling = state.total_sampling
+        
+        # Get sampling limits based on order quantity
+        sampling_limits = get_sampling_limits(order_qty)
+        to_inspect = sampling_limits["to_inspect"]
+        major_limit = sampling_limits["major_limit"]
+        minor_limit = sampling_limits["minor_limit"]
+        
+        # Calculate defect counts from QC Manager problem table
+        qc_critical_count, qc_major_count, qc_minor_count = qc_totals or calculate_problem_table_totals(state.problem_defects_qc)
+        
+        # Determine status colors
+        critical_status = "FAIL" if qc_critical_count > 0 else "PASS"
+        major_status = "FAIL" if qc_major_count > major_limit else "PASS"
+        minor_status = "FAIL" if qc_minor_count > minor_limit else "PASS"
+        
+        # Create data for table - DIFFERENT FOR MANDARIN
+        if language == "Mandarin":
+            # Use proper Chinese font or default to Helvetica
+            font_name = chinese_font if chinese_font else 'Helvetica'
+            
+            data = [
+                # Title row
+                ['抽样检查标准 2.5', '', '', '', ''],
+                # Header row
+                ['批次数量', '检查数量', '严重 AQL', '主要 AQL', '次要 AQL'],
+                # Data rows
+                ['0-300 双', '100%', '0', '1', '5'],
+                ['301-1200 双', '80', '0', '5', '9'],
+                ['1201-3200 双', '125', '0', '7', '10'],
+                ['3201-10000 双', '200', '0', '10', '14'],
+                ['10001-35000 双以上', '315', '0', '14', '21'],
+                # Last row with actual results
+                [f"检查总数: {order_qty}", 
+                 f"已抽样: {total_sampling if total_sampling else to_inspect}", 
+                 f"{qc_critical_count} / 0", 
+                 f"{qc_major_count} / {major_limit}", 
+                 f"{qc_minor_count} / {minor_limit}"]
+            ]
+        else:
+            data = [
+                # Title row
+                ['Inspection Standard 2.5', '', '', '', ''],
+                # Header row
+                ['BATCH SIZE', 'TO INSPECT', 'CRITICAL AQL', 'MAJOR AQL', 'MINOR AQL'],
+                # Data rows
+                ['0-300PRS', '100%', '0', '1', '5'],
+                ['301-1200PRS', '80', '0', '5', '9'],
+                ['1201-3200PRS', '125', '0', '7', '10'],
+                ['3201-10000PRS', '200', '0', '10', '14'],
+                ['10001-35000 above', '315', '0', '14', '21'],
+                # Last row with actual results
+                [f"Order Qty: {order_qty}", 
+                 f"Sampled: {total_sampling if total_sampling else to_inspect}", 
+                 f"{qc_critical_count} / 0", 
+                 f"{qc_major_count} / {major_limit}", 
+                 f"{qc_minor_count} / {minor_limit}"]
+            ]
+        
+        # Create table with proper width for portrait A4
+        page_width = A4[0] - 4*cm  # Portrait width minus margins
+        col_widths = [page_width * 0.20] * 5
+        row_heights = [30, 25] + [22]*5 + [30]
+        
+        table = Table(data, colWidths=col_widths, rowHeights=row_heights)
+        
+        # Define table style
+        style = TableStyle([
+            # Title row - yellow background
+            ('BACKGROUND', (0, 0), (4, 0), colors.yellow),
+            ('SPAN', (0, 0), (4, 0)),  # Merge all columns for title
+            ('ALIGN', (0, 0), (4, 0), 'CENTER'),
+            ('FONTSIZE', (0, 0), (4, 0), 12),
+            ('FONTNAME', (0, 0), (4, 0), 'Helvetica-Bold' if language == "English" else (chinese_font if chinese_font else 'Helvetica-Bold')),
+            ('VALIGN', (0, 0), (4, 0), 'MIDDLE'),
+            
+            # Header row - light gray background
+            ('BACKGROUND', (0, 1), (4, 1), colors.Color(0.85, 0.85, 0.85)),
+            ('FONTSIZE', (0, 1), (4, 1), 9),
+            ('FONTNAME', (0, 1), (4, 1), 'Helvetica-Bold' if language == "English" else (chinese_font if chinese_font else 'Helvetica-Bold')),
+            ('ALIGN', (0, 1), (4, 1), 'CENTER'),
+            ('VALIGN', (0, 1), (4, 1), 'MIDDLE'),
+            
+            # Data rows - white background
+            ('BACKGROUND', (0, 2), (4, 6), colors.white),
+            ('FONTSIZE', (0, 2), (4, 6), 9),
+            ('FONTNAME', (0, 2), (4, 6), 'Helvetica' if language == "English" else (chinese_font if chinese_font else 'Helvetica')),
+            ('ALIGN', (0, 2), (0, 6), 'LEFT'),
+            ('ALIGN', (1, 2), (4, 6), 'CENTER'),
+            ('VALIGN', (0, 2), (4, 6), 'MIDDLE'),
+            
+            # Last row - yellow background with colored status
+            ('BACKGROUND', (0, 7), (4, 7), colors.yellow),
+            ('FONTSIZE', (0, 7), (4, 7), 9),
+            ('FONTNAME', (0, 7), (4, 7), 'Helvetica-Bold' if language == "English" else (chinese_font if chinese_font else 'Helvetica-Bold')),
+            ('ALIGN', (0, 7), (4, 7), 'CENTER'),
+            ('VALIGN', (0, 7), (4, 7), 'MIDDLE'),
+            
+            # Color code the results based on status
+            ('TEXTCOLOR', (2, 7), (2, 7), colors.red if critical_status == "FAIL" else colors.green),
+            ('TEXTCOLOR', (3, 7), (3, 7), colors.red if major_status == "FAIL" else colors.green),
+            ('TEXTCOLOR', (4, 7), (4, 7), colors.red if minor_status == "FAIL" else colors.green),
+            
+            # Grid - black borders
+            ('GRID', (0, 0), (4, 7), 1, colors.black),
+            ('LINEABOVE', (0, 0), (4, 0), 1, colors.black),
+            ('LINEBELOW', (0, 7), (4, 7), 1, colors.black),
+            
+            # Padding
+            ('LEFTPADDING', (0, 0), (4, 7), 4),
+            ('RIGHTPADDING', (0, 0), (4, 7), 4),
+            ('TOPPADDING', (0, 0), (4, 7), 3),
+            ('BOTTOMPADDING', (0, 0), (4, 7), 3),
+        ])
+        
+        table.setStyle(style)
+        return KeepTogether(table)  # Keep table together on same page
+        
+    except Exception as e:
+        logger.error("Error creating sampling table: %s", e)
+        return None
+
+def create_problem_table(problem_data, title, language, chinese_font=None):
+    """Create problem identification table for PDF - UPDATED FOR MANDARIN"""
+    # Calculate totals from the problem table
+    total_cr = sum(problem_data[problem]['cr'] for problem in problem_data)
+    total_major = sum(problem_data[problem]['major'] for problem in problem_data)
+    total_minor = sum(problem_data[problem]['minor'] for problem in problem_data)
+    
+    # Define the data structure for the problem table - DIFFERENT FOR MANDARIN
+    if language == "Mandarin":
+        # Use proper Chinese font
+        font_name = chinese_font if chinese_font else 'Helvetica'
+        
+        table_data = [
+            # Header row - ALL 8 COLUMNS IN MANDARIN
+            ['问题', '严重', '主要', '次要', '问题', '严重', '主要', '次要'],
+            
+            # Row 1
+            ['色差', 
+             str(problem_data['color_variation']['cr']), 
+             str(problem_data['color_variation']['major']), 
+             str(problem_data['color_variation']['minor']), 
+             '清洁', 
+             str(problem_data['clean']['cr']), 
+             str(problem_data['clean']['major']), 
+             str(problem_data['clean']['minor'])],
+            
+            # Row 2
+            ['前帮', 
+             str(problem_data['toe_lasting']['cr']), 
+             str(problem_data['toe_lasting']['major']), 
+             str(problem_data['toe_lasting']['minor']), 
+             '包跟角', 
+             str(problem_data['heel_angle']['cr']), 
+             str(problem_data['heel_angle']['major']), 
+             str(problem_data['heel_angle']['minor'])],
+            
+            # Row 3
+            ['腰帮', 
+             str(problem_data['waist']['cr']), 
+             str(problem_data['waist']['major']), 
+             str(problem_data['waist']['minor']), 
+             '包边皱', 
+             str(problem_data['edge_wrinkle']['cr']), 
+             str(problem_data['edge_wrinkle']['major']), 
+             str(problem_data['edge_wrinkle']['minor'])],
+            
+            # Row 4
+            ['鞋带', 
+             str(problem_data['lace']['cr']), 
+             str(problem_data['lace']['major']), 
+             str(problem_data['lace']['minor']), 
+             '大底', 
+             str(problem_data['outsole']['cr']), 
+             str(problem_data['outsole']['major']), 
+             str(problem_data['outsole']['minor'])],
+            
+            # Row 5
+            ['魔术贴', 
+             str(problem_data['velcro']['cr']), 
+             str(problem_data['velcro']['major']), 
+             str(problem_data['velcro']['minor']), 
+             '胶着', 
+             str(problem_data['adhesion']['cr']), 
+             str(problem_data['adhesion']['major']), 
+             str(problem_data['adhesion']['minor'])],
+            
+            # Row 6
+            ['鞋扣', 
+             str(problem_data['buckle']['cr']), 
+             str(problem_data['buckle']['major']), 
+             str(problem_data['buckle']['minor']), 
+             '中底胶', 
+             str(problem_data['midsole_glue']['cr']), 
+             str(problem_data['midsole_glue']['major']), 
+             str(problem_data['midsole_glue']['minor'])],
+            
+            # Row 7
+            ['鞋舌', 
+             str(problem_data['tongue']['cr']), 
+             str(problem_data['tongue']['major']), 
+             str(problem_data['tongue']['minor']), 
+             '打磨高', 
+             str(problem_data['grinding_high']['cr']), 
+             str(problem_data['grinding_high']['major']), 
+             str(problem_data['grinding_high']['minor'])],
+            
+            # Row 8
+            ['后带长', 
+             str(problem_data['back_strap_length']['cr']), 
+             str(problem_data['back_strap_length']['major']), 
+             str(problem_data['back_strap_length']['minor']), 
+             '鞋跟', 
+             str(problem_data['heel']['cr']), 
+             str(problem_data['heel']['major']), 
+             str(problem_data['heel']['minor'])],
+            
+            # Row 9
+            ['后带固', 
+             str(problem_data['back_strap_attachment']['cr']), 
+             str(problem_data['back_strap_attachment']['major']), 
+             str(problem_data['back_strap_attachment']['minor']), 
+             '大皮', 
+             str(problem_data['toplift']['cr']), 
+             str(problem_data['toplift']['major']), 
+             str(problem_data['toplift']['minor'])],
+            
+            # Row 10
+            ['鞋面损', 
+             str(problem_data['damage_upper']['cr']), 
+             str(problem_data['damage_upper']['major']), 
+             str(problem_data['damage_upper']['minor']), 
+             '底开胶', 
+             str(problem_data['bottom_gapping']['cr']), 
+             str(problem_data['bottom_gapping']['major']), 
+             str(problem_data['bottom_gapping']['minor'])],
+            
+            # Row 11
+            ['鞋面皱', 
+             str(problem_data['xray_wrinkle']['cr']), 
+             str(problem_data['xray_wrinkle']['major']), 
+             str(problem_data['xray_wrinkle']['minor']), 
+             '溢胶', 
+             str(problem_data['stains']['cr']), 
+             str(problem_data['stains']['major']), 
+             str(problem_data['stains']['minor'])],
+            
+            # Row 12 - Thread ends only on left side, right side empty
+            ['线头', 
+             str(problem_data['thread_ends']['cr']), 
+             str(problem_data['thread_ends']['major']), 
+             str(problem_data['thread_ends']['minor']), 
+             '', '', '', ''],
+            
+            # Last row - Inspection results - USE CALCULATED TOTALS
+            [f'总缺陷数:', 
+             str(total_cr), 
+             str(total_major), 
+             str(total_minor), 
+             '', '', '', '']
+        ]
+    else:
+        table_data = [
+            # Header row - ALL 8 COLUMNS
+            ['Problem', 'CR', 'MAJOR', 'MINOR', 'Problem', 'CR', 'MAJOR', 'MINOR'],
+            
+            # Row 1
+            ['Color Variation', 
+             str(problem_data['color_variation']['cr']), 
+             str(problem_data['color_variation']['major']), 
+             str(problem_data['color_variation']['minor']), 
+             'Clean', 
+             str(problem_data['clean']['cr']), 
+             str(problem_data['clean']['major']), 
+             str(problem_data['clean']['minor'])],
+            
+            # Row 2
+            ['Toe Lasting', 
+             str(problem_data['toe_lasting']['cr']), 
+             str(problem_data['toe_lasting']['major']), 
+             str(problem_data['toe_lasting']['minor']), 
+             'Heel Angle', 
+             str(problem_data['heel_angle']['cr']), 
+             str(problem_data['heel_angle']['major']), 
+             str(problem_data['heel_angle']['minor'])],
+            
+            # Row 3
+            ['Waist', 
+             str(problem_data['waist']['cr']), 
+             str(problem_data['waist']['major']), 
+             str(problem_data['waist']['minor']), 
+             'Edge Wrinkle', 
+             str(problem_data['edge_wrinkle']['cr']), 
+             str(problem_data['edge_wrinkle']['major']), 
+             str(problem_data['edge_wrinkle']['minor'])],
+            
+            # Row 4
+            ['Lace', 
+             str(problem_data['lace']['cr']), 
+             str(problem_data['lace']['major']), 
+             str(problem_data['lace']['minor']), 
+             'Outsole', 
+             str(problem_data['outsole']['cr']), 
+             str(problem_data['outsole']['major']), 
+             str(problem_data['outsole']['minor'])],
+            
+            # Row 5
+            ['Velcro', 
+             str(problem_data['velcro']['cr']), 
+             str(problem_data['velcro']['major']), 
+             str(problem_data['velcro']['minor']), 
+             'Adhesion', 
+             str(problem_data['adhesion']['cr']), 
+             str(problem_data['adhesion']['major']), 
+             str(problem_data['adhesion']['minor'])],
+            
+            # Row 6
+            ['Buckle', 
+             str(problem_data['buckle']['cr']), 
+             str(problem_data['buckle']['major']), 
+             str(problem_data['buckle']['minor']), 
+             'Midsole Glue', 
+             str(problem_data['midsole_glue']['cr']), 
+             str(problem_data['midsole_glue']['major']), 
+             str(problem_data['midsole_glue']['minor'])],
+            
+            # Row 7
+            ['Tongue', 
+             str(problem_data['tongue']['cr']), 
+             str(problem_data['tongue']['major']), 
+             str(problem_data['tongue']['minor']), 
+             'Grinding High', 
+             str(problem_data['grinding_high']['cr']), 
+             str(problem_data['grinding_high']['major']), 
+             str(problem_data['grinding_high']['minor'])],
+            
+            # Row 8
+            ['Back strap Length', 
+             str(problem_data['back_strap_length']['cr']), 
+             str(problem_data['back_strap_length']['major']), 
+             str(problem_data['back_strap_length']['minor']), 
+             'Heel', 
+             str(problem_data['heel']['cr']), 
+             str(problem_data['heel']['major']), 
+             str(problem_data['heel']['minor'])],
+            
+            # Row 9
+            ['Back strap attachment', 
+             str(problem_data['back_strap_attachment']['cr']), 
+             str(problem_data['back_strap_attachment']['major']), 
+             str(problem_data['back_strap_attachment']['minor']), 
+             'Toplift', 
+             str(problem_data['toplift']['cr']), 
+             str(problem_data['toplift']['major']), 
+             str(problem_data['toplift']['minor'])],
+            
+            # Row 10
+            ['Damage upper', 
+             str(problem_data['damage_upper']['cr']), 
+             str(problem_data['damage_upper']['major']), 
+             str(problem_data['damage_upper']['minor']), 
+             'Bottom Gapping', 
+             str(problem_data['bottom_gapping']['cr']), 
+             str(problem_data['bottom_gapping']['major']), 
+             str(problem_data['bottom_gapping']['minor'])],
+            
+            # Row 11
+            ['X-RAY', 
+             str(problem_data['xray_wrinkle']['cr']), 
+             str(problem_data['xray_wrinkle']['major']), 
+             str(problem_data['xray_wrinkle']['minor']), 
+             'Stains', 
+             str(problem_data['stains']['cr']), 
+             str(problem_data['stains']['major']), 
+             str(problem_data['stains']['minor'])],
+            
+            # Row 12 - Thread ends only on left side, right side empty
+            ['Thread ends', 
+             str(problem_data['thread_ends']['cr']), 
+             str(problem_data['thread_ends']['major']), 
+             str(problem_data['thread_ends']['minor']), 
+             '', '', '', ''],
+            
+            # Last row - Inspection results - USE CALCULATED TOTALS
+            [f'总缺陷数:' if language == "Mandarin" else 'Total:', 
+             str(total_cr), 
+             str(total_major), 
+             str(total_minor), 
+             '', '', '', '']
+        ]
+    
+    # Calculate column widths for portrait A4
+    page_width = A4[0] - 4*cm  # Portrait width minus margins
+    col_widths = [
+        page_width * 0.22,  # Problem column (left side)
+        page_width * 0.07,  # CR
+        page_width * 0.07,  # MAJOR
+        page_width * 0.07,  # MINOR
+        page_width * 0.22,  # Problem column (right side)
+        page_width * 0.07,  # CR
+        page_width * 0.07,  # MAJOR
+        page_width * 0.07   # MINOR
+    ]
+    
+    # Create table - 13 rows total (0-12)
+    table = Table(table_data, colWidths=col_widths, rowHeights=[22] + [18]*12 + [22])
+    
+    # Define table style
+    style = TableStyle([
+        # Header row styling - ALL WHITE BACKGROUND
+        ('BACKGROUND', (0, 0), (7, 0), colors.white),
+        
+        # All body rows - white background
+        ('BACKGROUND', (0, 1), (7, 13), colors.white),
+        
+        # Grid - thin black borders
+        ('GRID', (0, 0), (7, 13), 0.5, colors.black),
+        
+        # Font - Use appropriate font for Chinese
+        ('FONTNAME', (0, 0), (7, 13), 'Helvetica' if language == "English" else (chinese_font if chinese_font else 'Helvetica')),
+        ('FONTSIZE', (0, 0), (7, 13), 7),
+        
+        # Header row - bold
+        ('FONTNAME', (0, 0), (7, 0), 'Helvetica-Bold' if language == "English" else (chinese_font if chinese_font else 'Helvetica-Bold')),
+        ('FONTSIZE', (0, 0), (7, 0), 8),
+        
+        # Last row - bold
+        ('FONTNAME', (0, 13), (3, 13), 'Helvetica-Bold' if language == "English" else (chinese_font if chinese_font else 'Helvetica-Bold')),
+        ('FONTNAME', (4, 13), (4, 13), 'Helvetica-Bold' if language == "English" else (chinese_font if chinese_font else 'Helvetica-Bold')),
+        ('FONTNAME', (5, 13), (7, 13), 'Helvetica-Bold' if language == "English" else (chinese_font if chinese_font else 'Helvetica-Bold')),
+        
+        # Background colors for last row to match screenshot
+        ('BACKGROUND', (0, 13), (0, 13), colors.Color(0.95, 0.95, 0.7)),  # Light yellow
+        ('BACKGROUND', (1, 13), (3, 13), colors.Color(0.8, 0.85, 1.0)),   # Light blue
+        ('BACKGROUND', (4, 13), (4, 13), colors.white),
+        ('BACKGROUND', (5, 13), (7, 13), colors.Color(0.8, 1.0, 0.8)),    # Light green
+        
+        # Alignment
+        ('ALIGN', (0, 0), (0, 13), 'LEFT'),      # Left problem column
+        ('ALIGN', (1, 0), (3, 13), 'CENTER'),    # CR, MAJOR, MINOR (left)
+        ('ALIGN', (4, 0), (4, 13), 'LEFT'),      # Right problem column
+        ('ALIGN', (5, 0), (7, 13), 'CENTER'),    # CR, MAJOR, MINOR (right)
+        
+        ('VALIGN', (0, 0), (7, 13), 'MIDDLE'),
+        
+        # Padding
+        ('LEFTPADDING', (0, 0), (7, 13), 4),
+        ('RIGHTPADDING', (0, 0), (7, 13), 4),
+        ('TOPPADDING', (0, 0), (7, 13), 3),
+        ('BOTTOMPADDING', (0, 0), (7, 13), 3),
+    ])
+    
+    table.setStyle(style)
+    return KeepTogether(table)  # Keep table together on same page
+
+def has_fault_photo(container):
+    """Containers sent to PDF workers carry has_photo instead of the uploads themselves"""
+    return bool(container.get('images') or container.get('has_photo'))
+
+def create_photos_of_faults_table(qc_containers, language, chinese_font=None, translations=None, fault_photos=None):
+    """
+    Create Photos of Faults section for PDF with:
+    1. Only Defect Type headers have color (Critical=red, Major=orange, Minor=blue)
+    2. Container name has NO background color (white background)
+    3. Title "PHOTOS OF FAULTS" has color (dark blue)
+    4. Images aligned to left under container name
+    5. Defects arranged in rows (max 2 per row)
+    6. Defect names wrap text
+    7. All severity types on same page if possible
+    translations maps container names to the report language; fault_photos holds the
+    PDF-sized photo for each container, by position (see prepare_pdf_artifacts).
+    """
+    if not qc_containers:
+        return None  # Don't show section if no containers
+    
+    translations = translations or {}
+    if fault_photos is None:
+        fault_photos = [prepare_fault_photo(c['images'][0]) if c.get('images') else None for c in qc_containers]
+    
+    # Group containers by severity, remembering each one's photo
+    photo_by_container = {id(container): photo for container, photo in zip(qc_containers, fault_photos)}
+    containers_by_severity = {
+        'critical': [c for c in qc_containers if c.get('severity') == 'critical'],
+        'major': [c for c in qc_containers if c.get('severity') == 'major'],
+        'minor': [c for c in qc_containers if c.get('severity') == 'minor']
+    }
+    
+    # Remove empty severity groups
+    containers_by_severity = {k: v for k, v in containers_by_severity.items() if v}
+    
+    if not containers_by_severity:
+        return None
+    
+    elements = []
+    
+    # ========== MAIN TITLE ==========
+    title_text = "缺陷照片" if language == "Mandarin" else "PHOTOS OF FAULTS"
+    
+    title_style = ParagraphStyle(
+        'PhotosMainTitle',
+        fontName='Helvetica-Bold' if language == "English" else (chinese_font if chinese_font else 'Helvetica-Bold'),
+        fontSize=16,
+        alignment=TA_CENTER,
+        textColor=colors.white,
+        spaceAfter=0
+    )
+    
+    # Create title table with dark blue background
+    title_table = Table(
+        [[Paragraph(title_text, title_style)]],
+        colWidths=[A4[0] - 4*cm]
+    )
+    title_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, -1), colors.Color(0.2, 0.3, 0.5)),  # Dark blue
+        ('TEXTCOLOR', (0, 0), (-1, -1), colors.white),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ('BOX', (0, 0), (-1, -1), 2, colors.Color(0.15, 0.2, 0.35)),
+        ('TOPPADDING', (0, 0), (-1, -1), 12),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
+    ]))
+    
+    elements.append(title_table)
+    elements.append(Spacer(1, 20))
+    
+    # ========== DEFECT SEVERITY COLORS ==========
+    severity_colors = {
+        'critical': colors.Color(0.85, 0.2, 0.2),    # Red
+        'major': colors.Color(0.95, 0.6, 0.15),      # Orange
+        'minor': colors.Color(0.25, 0.5, 0.85)       # Blue
+    }
+    
+    # ========== PROCESS ALL SEVERITY GROUPS ==========
+    # Try to keep all on one page if possible
+    all_containers_processed = []
+    
+    # Process in order: Critical, Major, Minor
+    for severity in ['critical', 'major', 'minor']:
+        if severity not in containers_by_severity:
+            continue
+        
+        severity_containers = containers_by_severity[severity]
+        containers_with_images = [c for c in severity_containers if has_fault_photo(c)]
+        
+        if not containers_with_images:
+            continue
+        
+        # Add severity header with color
+        if language == "Mandarin":
+            severity_labels = {
+                'critical': "严重问题",
+                'major': "主要问题", 
+                'minor': "次要问题"
+            }
+        else:
+            severity_labels = {
+                'critical': "CRITICAL DEFECTS",
+                'major': "MAJOR DEFECTS",
+                'minor': "MINOR DEFECTS"
+            }
+        
+        header_text = severity_labels[severity]
+        header_style = ParagraphStyle(
+            f'SeverityHeader_{severity}',
+            fontName='Helvetica-Bold' if language == "English" else (chinese_font if chinese_font else 'Helvetica-Bold'),
+            fontSize=12,
+            alignment=TA_CENTER,
+            textColor=colors.white
+        )
+        
+        header_table = Table(
+            [[Paragraph(header_text, header_style)]],
+            colWidths=[A4[0] - 4*cm],
+            rowHeights=[25]
+        )
+        
+        header_table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, -1), severity_colors[severity]),
+            ('TEXTCOLOR', (0, 0), (-1, -1), colors.white),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+            ('BOX', (0, 0), (-1, -1), 1, severity_colors[severity]),
+            ('TOPPADDING', (0, 0), (-1, -1), 4),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
+        ]))
+        
+        elements.append(header_table)
+        elements.append(Spacer(1, 10))
+        
+        
+        # Process containers in rows (max 2 per row)
+        container_count = len(containers_with_images)
+        
+        for i in range(0, container_count, 2):
+            # Get up to 2 containers for this row
+            row_containers = containers_with_images[i:min(i+2, container_count)]
+            
+            # Create table for this row (max 2 columns)
+            row_data = []
+            col_widths = []
+            
+            for container in row_containers:
+                defect_name = container['name']
+                
+                # Translate defect name if needed
+                if language == "Mandarin":
+                    defect_name = translations.get(defect_name, defect_name)
+                
+                # Create content for this cell
+                cell_content = []
+                
+                # 1. Container name (NO background color, white background)
+                name_style = ParagraphStyle(
+                    f'DefectName_{severity}_{i}',
+                    fontName='Helvetica-Bold' if language == "English" else (chinese_font if chinese_font else 'Helvetica-Bold'),
+                    fontSize=10,
+                    alignment=TA_LEFT,
+                    textColor=colors.black,  # Black text on white background
+                    wordWrap='LTR',  # Allow text wrapping
+                    leading=12
+                )
+                
+                # Wrap text if too long
+                wrapped_name = defect_name
+                if len(defect_name) > 30:
+                    # Simple wrapping - break into multiple lines
+                    words = defect_name.split()
+                    lines = []
+                    current_line = ""
+                    for word in words:
+                        if len(current_line) + len(word) + 1 <= 30:
+                            current_line += " " + word if current_line else word
+                        else:
+                            lines.append(current_line)
+                            current_line = word
+                    if current_line:
+                        lines.append(current_line)
+                    wrapped_name = "\n".join(lines)
+                
+                cell_content.append(Paragraph(wrapped_name, name_style))
+                
+                # 2. Image (1 inch x 1 inch)
+                if has_fault_photo(container):
+                    try:
+                        img_bytes = photo_by_container[id(container)]
+                        img_buffer = io.BytesIO(img_bytes)
+                        
+                        # Create ReportLab Image
+                        reportlab_img = ReportLabImage(img_buffer)
+                        reportlab_img.drawWidth = 1 * inch
+                        reportlab_img.drawHeight = 1 * inch
+                        
+                        cell_content.append(reportlab_img)
+                    except Exception as e:
+                        error_text = f"[Image error]"
+                        error_style = ParagraphStyle(
+                            'ErrorText',
+                            fontName='Helvetica',
+                            fontSize=8,
+                            textColor=colors.red
+                        )
+                        cell_content.append(Paragraph(error_text, error_style))
+                
+                row_data.append(cell_content)
+                col_widths.append((A4[0] - 5*cm) / 2)  # Equal width for 2 columns
+            
+            # If only one container in this row, add empty cell
+            if len(row_containers) == 1:
+                row_data.append([Paragraph("", ParagraphStyle('Empty'))])
+                col_widths.append((A4[0] - 5*cm) / 2)
+            
+            # Create table for this row
+            if row_data:
+                # Convert to proper table structure
+                table_data = []
+                max_elements = max(len(cell) for cell in row_data)
+                
+                for element_idx in range(max_elements):
+                    row = []
+                    for cell_idx in range(len(row_data)):
+                        if element_idx < len(row_data[cell_idx]):
+                            row.append(row_data[cell_idx][element_idx])
+                        else:
+                            row.append(Paragraph("", ParagraphStyle('Empty')))
+                    table_data.append(row)
+                
+                # Create the table
+                row_table = Table(table_data, colWidths=col_widths)
+                
+                # Style the table - NO background color for container names
+                table_style = TableStyle([
+                    # All cells - white background, black border
+                    ('BACKGROUND', (0, 0), (-1, -1), colors.white),
+                    ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+                    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+                    ('LEFTPADDING', (0, 0), (-1, -1), 5),
+                    ('RIGHTPADDING', (0, 0), (-1, -1), 5),
+                    ('TOPPADDING', (0, 0), (-1, -1), 3),
+                    ('BOTTOMPADDING', (0, 0), (-1, -1), 3),
+                ])
+                
+                row_table.setStyle(table_style)
+                elements.append(row_table)
+                elements.append(Spacer(1, 15))
+        
+        # Add spacing between severity groups
+        if severity in ['critical', 'major'] and 'minor' in containers_by_severity:
+            elements.append(Spacer(1, 20))
+    
+    return elements
+
+class BytesLRUCache:
+    """In-memory bytes values bounded by their total size, least recently used evicted first"""
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._photos = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        with self._lock:
+            if key in self._photos:
+                self._photos.move_to_end(key)
+            return self._photos.get(key)
+    
+    def set(self, key, photo):
+        with self._lock:
+            if key in self._photos:
+                return
+            self._photos[key] = photo
+            self._bytes += len(photo)
+            while self._bytes > self.max_bytes and len(self._photos) > 1:
+                _, evicted = self._photos.popitem(last=False)
+                self._bytes -= len(evicted)
+
+# Print-size fault photos keyed by the SHA-256 of the original upload, shared by every PDF build
+@process_singleton
+def get_fault_photo_cache():
+    return BytesLRUCache(int(FAULT_PHOTO_CACHE_MB * 1024 * 1024))
+
+class PdfFileCache:
+    """
+    Finished PDFs on disk, one file per report_digest, bounded by total size. A file's mtime is
+    when it was rendered, and PDFs older than PDF_CACHE_MAX_AGE are not served again. Reading a
+    PDF sets its atime; eviction deletes the least recently used files first. Renders write to a
+    temp file in the same directory that add() then moves into place.
+    """
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+    
+    def path(self, digest):
+        return os.path.join(self.directory, f"{digest}.pdf")
+    
+    def get(self, digest):
+        """Path of the cached PDF for digest, or None (also when it was rendered too long ago)"""
+        path = self.path(digest)
+        try:
+            rendered_at = os.stat(path).st_mtime
+            now = time.time()
+            if now - rendered_at > PDF_CACHE_MAX_AGE:
+                return None
+            os.utime(path, (now, rendered_at))
+        except FileNotFoundError:
+            return None
+        return path
+    
+    def temp_path(self):
+        """A new empty file for a render to write into"""
+        fd, path = tempfile.mkstemp(suffix=".pdf.tmp", dir=self.directory)
+        os.close(fd)
+        return path
+    
+    def add(self, digest, temp_path):
+        """Move a finished render into the cache and return its path"""
+        path = self.path(digest)
+        os.replace(temp_path, path)
+        self.evict(keep=path)
+        return path
+    
+    def add_uncached(self, temp_path):
+        """
+        Keep a finished render that must not be served for its digest again (e.g. translation fell
+        back to English). It gets a name no digest matches and ages out like any other PDF.
+        """
+        path = self.path(f"uncached-{uuid.uuid4().hex}")
+        os.replace(temp_path, path)
+        self.evict(keep=path)
+        return path
+    
+    def evict(self, keep=None):
+        with self._lock:
+            now = time.time()
+            entries = []
+            for entry in os.scandir(self.directory):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                if entry.name.endswith(".tmp"):
+                    if now - stat.st_mtime > PDF_TEMP_MAX_AGE:
+                        discard_file(entry.path)
+                elif entry.name.endswith(".pdf"):
+                    entries.append((max(stat.st_atime, stat.st_mtime), stat.st_size, entry.path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                if path != keep:
+                    discard_file(path)
+                    total -= size
+
+def discard_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+# Finished PDFs keyed by report_digest, so an unchanged report is served without rebuilding
+@process_singleton
+def get_pdf_cache():
+    return PdfFileCache(PDF_CACHE_DIR, int(PDF_CACHE_MB * 1024 * 1024))
+
+def report_digest(order_info, state, language):
+    """
+    Stable digest of everything a PDF is rendered from. Any edit to the order, defects, tables,
+    photos, notes, sampling fields, language or city gives a new digest, and so does a new day
+    in the selected city (the footer carries the date). Photos contribute their content hash.
+    """
+    payload = {
+        "date": city_now(state.selected_city).strftime("%Y-%m-%d"),
+        "order_info": order_info,
+        "language": language,
+        "order_qty": state.order_qty,
+        "defect_store": state.defect_store,
+        "problem_defects_ai": state.problem_defects_ai,
+        "problem_defects_qc": state.problem_defects_qc,
+        "qc_defect_containers": [
+            {
+                "name": container.get('name'),
+                "severity": container.get('severity'),
+                "images": [hashlib.sha256(image).hexdigest() for image in container.get('images', [])]
+            }
+            for container in state.qc_defect_containers
+        ],
+        "qc_notes_english": state.qc_notes_english,
+        "total_sampling": state.total_sampling,
+        "ctn_no": state.ctn_no,
+        "lot_size": state.lot_size,
+        "selected_city": state.selected_city
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")).hexdigest()
+
+def prepare_fault_photo(data):
+    """
+    Fault photo downsampled to PDF_FAULT_PHOTO_DPI at its drawn size, made once per distinct
+    upload and then served from the cache. Returns the original bytes if they cannot be decoded.
+    """
+    key = hashlib.sha256(data).hexdigest()
+    photo = get_fault_photo_cache().get(key)
+    if photo is None:
+        photo = downsample_fault_photo(data)
+        if photo is not data:
+            get_fault_photo_cache().set(key, photo)
+    return photo
+
+def downsample_fault_photo(data):
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image.draft("RGB", (PDF_FAULT_PHOTO_PX, PDF_FAULT_PHOTO_PX))
+            photo = flatten_to_rgb(image)
+            photo.thumbnail((PDF_FAULT_PHOTO_PX, PDF_FAULT_PHOTO_PX), Image.Resampling.LANCZOS)
+        buffer = io.BytesIO()
+        photo.save(buffer, format="JPEG", quality=PDF_FAULT_PHOTO_QUALITY)
+        return buffer.getvalue()
+    except Exception as e:
+        logger.warning("Could not downscale fault photo: %s", e)
+        return data
+
+def prepare_pdf_artifacts(client, state, languages):
+    """
+    The language-independent parts of a report, computed once for every language being rendered:
+    translations (one batched request per language), PDF-sized fault photos, the final decision
+    and the QC problem table totals. The result is plain data, so it can go to worker processes.
+    """
+    texts = [text for defects in state.defect_store.values() for _, text in defects]
+    texts += [container['name'] for container in state.qc_defect_containers] + [state.qc_notes_english or '']
+    translations = {
+        language: translate_texts(client, texts, language) for language in languages if language != "English"
+    }
+    return {
+        "translations": translations,
+        # Languages where some text fell back to English because translation failed
+        "incomplete_languages": [
+            language for language in translations
+            if not all(is_translation_resolved(text, language) for text in translations[language])
+        ],
+        "fault_photos": [
+            prepare_fault_photo(container['images'][0]) if container.get('images') else None
+            for container in state.qc_defect_containers
+        ],
+        "decision": calculate_final_decision(state),
+        "qc_totals": calculate_problem_table_totals(state.problem_defects_qc)
+    }
+
+def generate_multilingual_pdf(client, order_info, language, state, artifacts=None, output=None):
+    """
+    Generate PDF with proper Mandarin font handling - UPDATED WITH TIMESTAMP & LOCATION FOOTER
+    order_info is the header block; state is the InspectionState the tables and decision come from.
+    artifacts comes from prepare_pdf_artifacts and is built here when not given; with it, client
+    is not used. Returns the PDF bytes or, when output (a file path) is given, writes the PDF there
+    and returns the path. Rendering errors propagate to the caller.
+    """
+    if artifacts is None:
+        artifacts = prepare_pdf_artifacts(client, state, [language])
+    translations = artifacts["translations"].get(language, {})
+    buffer = output if output is not None else io.BytesIO()
+    defect_store = state.defect_store
+    qc_notes_english = state.qc_notes_english or ''
+    total_sampling = state.total_sampling or ''
+    selected_city = state.selected_city or 'Guangzhou'
+    
+    # Fonts and styles come from the process-wide registry (see get_pdf_styles)
+    base_font, bold_font = get_pdf_fonts(language)
+    chinese_font = get_cjk_font() if language == "Mandarin" else None
+    pdf_styles = get_pdf_styles(language)
+    
+    # Define header/footer function with timestamp and location - OUTSIDE the try block
+    def add_header_footer(canvas, doc):
+        """Add header and footer to all pages with timestamp and location"""
+        canvas.saveState()
+        
+        # Get current timestamp based on selected city's timezone
+        timestamp = city_now(selected_city).strftime("%Y-%m-%d %H:%M:%S")
+        
+        # USE SELECTED CITY FROM DROPDOWN
+        chinese_city_name = CHINESE_CITIES.get(selected_city, "广东")
+        
+        if language == "Mandarin":
+            location = chinese_city_name
+        else:
+            location = selected_city
+        
+        # Page dimensions
+        page_width = A4[0]
+        page_height = A4[1]
+        
+        # FOOTER: Centered at bottom with timestamp and location
+        footer_text = f"Generated: {timestamp} | Location: {location}"
+        footer_font_size = 8
+        
+        canvas.setFont(base_font, footer_font_size)
+        canvas.setFillColor(colors.grey)
+        
+        # Draw footer text centered at bottom
+        text_width = canvas.stringWidth(footer_text, base_font, footer_font_size)
+        footer_x = (page_width - text_width) / 2
+        footer_y = 1*cm  # 1cm from bottom
+        
+        canvas.drawString(footer_x, footer_y, footer_text)
+        
+        # HEADER: GRAND STEP (H.K.) LTD on all pages except first
+        if doc.page > 1:
+            header_font_size = 12
+            canvas.setFont(bold_font, header_font_size)
+            canvas.setFillColor(colors.black)
+            
+            # Draw header at top center (NO UNDERLINE)
+            header_text = "GRAND STEP (H.K.) LTD"
+            canvas.drawCentredString(page_width/2, page_height - 1*cm, header_text)
+        
+        # PAGE NUMBER: Top right corner
+        page_text = f"Page {doc.page}"
+        canvas.setFont(base_font, 10)
+        canvas.drawRightString(page_width - 2*cm, page_height - 1*cm, page_text)
+        
+        canvas.restoreState()
+    
+    # Create document with increased bottom margin for footer
+    doc = SimpleDocTemplate(buffer, pagesize=A4, 
+                           rightMargin=2*cm, leftMargin=2*cm, 
+                           topMargin=2*cm, bottomMargin=2.5*cm)  # Increased bottom margin for footer
+    
+    elements = []
+    
+    brand_blue = BRAND_BLUE
+    warning_orange = WARNING_ORANGE
+    light_gray = colors.Color(0.97, 0.97, 0.97)
+    
+    title_style = pdf_styles['title']
+    subtitle_style = pdf_styles['subtitle']
+    section_style = pdf_styles['section']
+    
+    # HEADER FOR PAGE 1 - Original purple GRAND STEP (H.K.) LTD
+    if language == "Mandarin":
+        elements.append(Paragraph("GRAND STEP (H.K.) LTD", title_style))
+        elements.append(Spacer(1, 12))
+        elements.append(Paragraph("专业鞋类制造与质量控制", subtitle_style))
+        elements.append(Paragraph("AI驱动质量检查系统", subtitle_style))
+        elements.append(Spacer(1, 20))
+        
+        # Title
+        title_text = "质量控制检查报告"
+    else:
+        elements.append(Paragraph("GRAND STEP (H.K.) LTD", title_style))
+        elements.append(Spacer(1, 12))
+        elements.append(Paragraph("Professional Footwear Manufacturing & Quality Control", subtitle_style))
+        elements.append(Paragraph("AI-Powered Quality Inspection System", subtitle_style))
+        elements.append(Spacer(1, 20))
+        
+        # Title
+        title_text = "QUALITY CONTROL INSPECTION REPORT"
+    
+    report_title = pdf_styles['report_title']
+    elements.append(Paragraph(title_text, report_title))
+    elements.append(Spacer(1, 20))
+    
+    # Final Decision
+    final_result, final_reason = artifacts["decision"]
+    result_text = final_result
+    
+    # TRANSLATE DECISION TEXT FOR MANDARIN
+    if language == "Mandarin":
+        final_label = "最终质检决定"
+        if final_result == "ACCEPT":
+            result_text = "接受"
+            final_reason = "所有缺陷在AQL 2.5限制内"
+        elif final_result == "REJECT":
+            result_text = "拒绝"
+            if "Critical defects" in final_reason:
+                final_reason = "严重缺陷 - 零容忍"
+            else:
+                final_reason = "主要缺陷超出AQL限制"
+        elif final_result == "REWORK":
+            result_text = "返工"
+            final_reason = "次要缺陷超出AQL限制"
+    else:
+        final_label = "FINAL QC DECISION"
+    
+    result_style = pdf_styles['result'].get(final_result, pdf_styles['result']['REWORK'])
+    
+    elements.append(Paragraph(f"{final_label}: {result_text}", result_style))
+    
+    body_style = pdf_styles['body']
+    elements.append(Paragraph(final_reason, body_style))
+    elements.append(Spacer(1, 20))
+    
+    # Order Information
+    if language == "Mandarin":
+        order_label = "订单信息"
+        # Prepare order data in Mandarin
+        order_data = [
+            ['合同编号', order_info['contract_number']],
+            ['工厂', order_info['factory']],
+            ['订单数量', order_info['order_qty']],
+            ['款式', order_info['style_number']],
+            ['颜色', order_info['color']],
+            ['客户', order_info['customer']],
+            ['检查员', order_info['inspector']],
+            ['日期', order_info['inspection_date']],
+            ['总抽样', total_sampling if total_sampling else calculate_total_sampling(state.order_qty)],
+            ['箱号', state.ctn_no or ''],
+            ['批次大小', state.lot_size or ''],
+            ['标准', "AQL 2.5"]
+        ]
+    else:
+        order_label = "ORDER INFORMATION"
+        order_data = [
+            ['Contract Number', order_info['contract_number']],
+            ['Factory', order_info['factory']],
+            ['Order Qty', order_info['order_qty']],
+            ['Style', order_info['style_number']],
+            ['Color', order_info['color']],
+            ['Customer', order_info['customer']],
+            ['Inspector', order_info['inspector']],
+            ['Date', order_info['inspection_date']],
+            ['Total Sampling', total_sampling if total_sampling else calculate_total_sampling(state.order_qty)],
+            ['CTN No', state.ctn_no or ''],
+            ['Lot Size', state.lot_size or ''],
+            ['Standard', "AQL 2.5"]
+        ]
+    
+    order_section_style = section_style
+    elements.append(Paragraph(order_label, order_section_style))
+    elements.append(Spacer(1, 10))
+    
+    order_table = Table(order_data, colWidths=[5*cm, 9*cm])
+    order_table.setStyle(TableStyle([
+        ('BACKGROUND', (0,0), (0,-1), brand_blue),
+        ('TEXTCOLOR', (0,0), (0,-1), colors.white),
+        ('BACKGROUND', (1,0), (1,-1), light_gray),
+        ('FONTNAME', (0,0), (0,-1), base_font),
+        ('FONTNAME', (1,0), (1,-1), base_font),
+        ('FONTSIZE', (0,0), (-1,-1), 10),
+        ('ALIGN', (0,0), (-1,-1), 'LEFT'),
+        ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
+        ('TOPPADDING', (0,0), (-1,-1), 8),
+        ('BOTTOMPADDING', (0,0), (-1,-1), 8),
+        ('GRID', (0,0), (-1,-1), 1, colors.grey)
+    ]))
+    elements.append(KeepTogether(order_table))  # Keep order table together
+    elements.append(Spacer(1, 20))
+    
+    # SAMPLING INSPECTION TABLE - Start new page
+    elements.append(PageBreak())
+    
+    if language == "Mandarin":
+        sampling_label = "抽样检查"
+    else:
+        sampling_label = "SAMPLING INSPECTION"
+        
+    sampling_section_style = section_style
+    elements.append(Paragraph(sampling_label, sampling_section_style))
+    elements.append(Spacer(1, 8))
+    
+    # Create sampling table
+    sampling_table = create_sampling_table(state, language, chinese_font, artifacts["qc_totals"])
+    if sampling_table:
+        elements.append(sampling_table)
+    elements.append(Spacer(1, 20))
+    
+    # PROBLEM IDENTIFIED BY THE AI TABLE
+    if language == "Mandarin":
+        problem_ai_label = "AI识别的问题"
+    else:
+        problem_ai_label = "PROBLEM IDENTIFIED BY THE AI"
+        
+    problem_section_style = section_style
+    elements.append(Paragraph(problem_ai_label, problem_section_style))
+    elements.append(Spacer(1, 8))
+    
+    # Create AI problem table
+    ai_problem_table = create_problem_table(state.problem_defects_ai, "AI", language, chinese_font)
+    if ai_problem_table:
+        elements.append(ai_problem_table)
+    elements.append(Spacer(1, 20))
+    
+    # PROBLEM IDENTIFIED BY THE QC MANAGER TABLE - Start new page if needed
+    elements.append(PageBreak())
+    
+    if language == "Mandarin":
+        problem_qc_label = "质检经理识别的问题"
+    else:
+        problem_qc_label = "PROBLEM IDENTIFIED BY THE QC MANAGER"
+        
+    elements.append(Paragraph(problem_qc_label, problem_section_style))
+    elements.append(Spacer(1, 8))
+    
+    # Create QC problem table
+    qc_problem_table = create_problem_table(state.problem_defects_qc, "QC", language, chinese_font)
+    if qc_problem_table:
+        elements.append(qc_problem_table)
+    elements.append(Spacer(1, 20))
+    
+    # CRITICAL DEFECTS REVIEW - Start new page
+    elements.append(PageBreak())
+    
+    if language == "Mandarin":
+        critical_label = "严重缺陷审查"
+    else:
+        critical_label = "CRITICAL DEFECTS REVIEW"
+        
+    critical_style = pdf_styles['critical_section']
+    elements.append(Paragraph(critical_label, critical_style))
+    elements.append(Spacer(1, 8))
+    
+    # Get critical defects
+    qc_critical_translated = [translations.get(text, text) for _, text in defect_store['qc_critical']]
+    if qc_critical_translated:
+        for i, defect in enumerate(qc_critical_translated, 1):
+            defect_style = pdf_styles['critical_defect']
+            elements.append(Paragraph(f"{i}. {defect}", defect_style))
+            elements.append(Spacer(1, 4))
+    else:
+        no_defects_text = "无严重缺陷" if language == "Mandarin" else "No critical defects found"
+        no_defects_style = pdf_styles['no_defects']
+        elements.append(Paragraph(no_defects_text, no_defects_style))
+    
+    elements.append(Spacer(1, 12))
+    
+    # MAJOR DEFECTS REVIEW
+    if language == "Mandarin":
+        major_label = "主要缺陷审查"
+    else:
+        major_label = "MAJOR DEFECTS REVIEW"
+        
+    major_style = pdf_styles['major_section']
+    elements.append(Paragraph(major_label, major_style))
+    elements.append(Spacer(1, 8))
+    
+    # Get major defects
+    qc_major_translated = [translations.get(text, text) for _, text in defect_store['qc_major']]
+    if qc_major_translated:
+        for i, defect in enumerate(qc_major_translated, 1):
+            defect_style = pdf_styles['major_defect']
+            elements.append(Paragraph(f"{i}. {defect}", defect_style))
+            elements.append(Spacer(1, 4))
+    else:
+        no_defects_text = "无主要缺陷" if language == "Mandarin" else "No major defects found"
+        no_defects_style = pdf_styles['no_defects']
+        elements.append(Paragraph(no_defects_text, no_defects_style))
+    
+    elements.append(Spacer(1, 12))
+    
+    # MINOR DEFECTS REVIEW
+    if language == "Mandarin":
+        minor_label = "次要缺陷审查"
+    else:
+        minor_label = "MINOR DEFECTS REVIEW"
+        
+    minor_style = pdf_styles['minor_section']
+    elements.append(Paragraph(minor_label, minor_style))
+    elements.append(Spacer(1, 8))
+    
+    # Get minor defects
+    qc_minor_translated = [translations.get(text, text) for _, text in defect_store['qc_minor']]
+    if qc_minor_translated:
+        for i, defect in enumerate(qc_minor_translated, 1):
+            defect_style = pdf_styles['minor_defect']
+            elements.append(Paragraph(f"{i}. {defect}", defect_style))
+            elements.append(Spacer(1, 4))
+    else:
+        no_defects_text = "无次要缺陷" if language == "Mandarin" else "No minor defects found"
+        no_defects_style = pdf_styles['no_defects']
+        elements.append(Paragraph(no_defects_text, no_defects_style))
+    
+    elements.append(Spacer(1, 20))
+    
+    # QC INSPECTOR REVIEW & AMENDMENTS - Start new page if needed
+    elements.append(PageBreak())
+    
+    if language == "Mandarin":
+        qc_label = "质检员检查与修改"
+    else:
+        qc_label = "QC INSPECTOR REVIEW & AMENDMENTS"
+        
+    qc_section_style = section_style
+    
+    # Get sampling limits for display
+    sampling_limits = get_sampling_limits(state.order_qty)
+    major_limit = sampling_limits["major_limit"]
+    minor_limit = sampling_limits["minor_limit"]
+    
+    ai_critical_count = len(defect_store['ai_critical'])
+    ai_major_count = len(defect_store['ai_major'])
+    ai_minor_count = len(defect_store['ai_minor'])
+    
+    qc_critical_count = len(defect_store['qc_critical'])
+    qc_major_count = len(defect_store['qc_major'])
+    qc_minor_count = len(defect_store['qc_minor'])
+    
+    crit_change = qc_critical_count - ai_critical_count
+    maj_change = qc_major_count - ai_major_count
+    min_change = qc_minor_count - ai_minor_count
+    
+    if language == "Mandarin":
+        qc_data = [
+            ['缺陷类型', 'AI数量', '质检最终', '变化', '状态'],
+            ['严重', str(ai_critical_count), str(qc_critical_count),
+             f"{crit_change:+d}" if crit_change != 0 else "0",
+             '失败' if qc_critical_count>0 else '通过'],
+            ['主要', str(ai_major_count), str(qc_major_count),
+             f"{maj_change:+d}" if maj_change != 0 else "0",
+             f'失败' if qc_major_count>major_limit else '通过'],
+            ['次要', str(ai_minor_count), str(qc_minor_count),
+             f"{min_change:+d}" if min_change != 0 else "0",
+             f'失败' if qc_minor_count>minor_limit else '通过']
+        ]
+    else:
+        qc_data = [
+            ['Defect Type', 'AI Count', 'QC Final', 'Change', 'Status'],
+            ['Critical', str(ai_critical_count), str(qc_critical_count),
+             f"{crit_change:+d}" if crit_change != 0 else "0",
+             'FAIL' if qc_critical_count>0 else 'PASS'],
+            ['Major', str(ai_major_count), str(qc_major_count),
+             f"{maj_change:+d}" if maj_change != 0 else "0",
+             f'FAIL' if qc_major_count>major_limit else 'PASS'],
+            ['Minor', str(ai_minor_count), str(qc_minor_count),
+             f"{min_change:+d}" if min_change != 0 else "0",
+             f'FAIL' if qc_minor_count>minor_limit else 'PASS']
+        ]
+    
+    qc_table = Table(qc_data, colWidths=[3*cm, 2.5*cm, 2.5*cm, 2.5*cm, 3*cm])
+    qc_table.setStyle(TableStyle([
+        ('BACKGROUND', (0,0), (-1,0), warning_orange),
+        ('TEXTCOLOR', (0,0), (-1,0), colors.white),
+        ('FONTNAME', (0,0), (-1,0), bold_font),
+        ('FONTNAME', (0,1), (-1,-1), base_font),
+        ('FONTSIZE', (0,0), (-1,-1), 10),
+        ('ALIGN', (0,0), (-1,-1), 'CENTER'),
+        ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
+        ('TOPPADDING', (0,0),(-1,-1), 10),
+        ('BOTTOMPADDING', (0,0), (-1,-1), 10),
+        ('GRID', (0,0), (-1,-1), 1, colors.grey)
+    ]))
+    
+    elements.append(Paragraph(qc_label, qc_section_style))
+    elements.append(Spacer(1, 10))
+    elements.append(KeepTogether(qc_table))  # Keep QC table together
+    elements.append(Spacer(1, 20))
+    photos_elements = create_photos_of_faults_table(
+        state.qc_defect_containers, language, chinese_font, translations, artifacts["fault_photos"]
+    )
+    if photos_elements:
+        elements.append(PageBreak())
+        elements.extend(photos_elements)
+    
+    # QC NOTES - Start new page if needed
+    if qc_notes_english.strip():
+        elements.append(PageBreak())
+        
+        if language == "Mandarin":
+            notes_label = "质检经理备注"
+        else:
+            notes_label = "QC MANAGER NOTES"
+            
+        notes_section_style = section_style
+        elements.append(Paragraph(notes_label, notes_section_style))
+        
+        # Translate notes if needed
+        if language == "Mandarin":
+            notes_text = translations.get(qc_notes_english, qc_notes_english)
+        else:
+            notes_text = qc_notes_english
+            
+        notes_body_style = pdf_styles['notes_body']
+        elements.append(Paragraph(notes_text, notes_body_style))
+        elements.append(Spacer(1, 15))
+    
+    # Build the PDF with unified header/footer on all pages
+    doc.build(elements, onFirstPage=add_header_footer, onLaterPages=add_header_footer)
+    return buffer.getvalue() if output is None else output
+
+def state_for_worker(state):
+    """
+    Copy of state to pickle for a worker. Fault photos travel prebuilt in the artifacts, so the
+    containers keep only their name, severity and whether they have a photo, not the uploads.
+    """
+    return dataclasses.replace(state, qc_defect_containers=[
+        {"name": container.get('name'), "severity": container.get('severity'), "has_photo": bool(container.get('images'))}
+        for container in state.qc_defect_containers
+    ])
+
+def render_pdf_in_worker(order_info, language, state, artifacts, output):
+    """Process pool entry point; everything it needs arrives in artifacts, so no client is used"""
+    return generate_multilingual_pdf(None, order_info, language, state, artifacts, output)
+
+@process_singleton
+def get_pdf_process_pool():
+    # spawn, not fork: the app process runs threads (Streamlit, schedulers) that fork would copy mid-state
+    # Workers resolve the CJK font as they start, not on their first Mandarin report
+    return ProcessPoolExecutor(
+        max_workers=max(1, PDF_PROCESS_WORKERS), mp_context=multiprocessing.get_context("spawn"),
+        initializer=get_cjk_font
+    )
+
+def generate_all_language_pdfs(client, order_info, state, languages=PDF_LANGUAGES):
+    """
+    Render the report in every language at once. A language whose inputs are unchanged since its
+    last build is served from the PDF cache. For the rest, the shared work is done here first and
+    the CPU-bound ReportLab layout runs on the process pool. If the pool is unavailable, they are
+    rendered here one after another.
+    Each PDF is written straight to a file in the cache directory; nothing holds it in memory
+    afterwards. Returns {language: pdf_path}. A path stays valid until the cache evicts it.
+    """
+    pdf_cache = get_pdf_cache()
+    digests = {language: report_digest(order_info, state, language) for language in languages}
+    pdfs = {language: pdf_cache.get(digest) for language, digest in digests.items()}
+    missing = [language for language, pdf_path in pdfs.items() if pdf_path is None]
+    if not missing:
+        return pdfs
+    
+    artifacts = prepare_pdf_artifacts(client, state, missing)
+    temp_paths = {language: pdf_cache.temp_path() for language in missing}
+    try:
+        rendered = False
+        if len(missing) > 1:
+            try:
+                pool = get_pdf_process_pool()
+                worker_state = state_for_worker(state)
+                futures = [
+                    pool.submit(render_pdf_in_worker, order_info, language, worker_state, artifacts, temp_paths[language])
+                    for language in missing
+                ]
+                for future in futures:
+                    future.result()
+                rendered = True
+            except (BrokenProcessPool, OSError) as e:
+                logger.warning("PDF process pool unavailable, rendering in this process: %s", e)
+                if isinstance(e, BrokenProcessPool):
+                    # A broken pool stays broken; start a fresh one for the next build
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    get_pdf_process_pool.reset(pool)
+        if not rendered:
+            for language in missing:
+                generate_multilingual_pdf(client, order_info, language, state, artifacts, temp_paths[language])
+        for language in missing:
+            if language in artifacts["incomplete_languages"]:
+                # Served this time but never under its digest, so the next build retries translation
+                pdfs[language] = pdf_cache.add_uncached(temp_paths[language])
+            else:
+                pdfs[language] = pdf_cache.add(digests[language], temp_paths[language])
+    finally:
+        for temp_path in temp_paths.values():
+            discard_file(temp_path)
+    return pdfs